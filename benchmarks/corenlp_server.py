@@ -0,0 +1,255 @@
+from benchmarks.stub_corenlp import StubCoreNLP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import argparse
+import ast
+import hashlib
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+import requests
+
+log = logging.getLogger("CORENLP-SERVER")
+
+# properties that do not change the annotations, so they are not part of the key of a response
+IGNORED_PROPERTIES = {"timeout"}
+
+
+def parse_properties(properties):
+    """
+    The properties are sent either as JSON or, by the stanfordcorenlp client, as the repr of a python dictionary
+    """
+    if not properties:
+        return {}
+    try:
+        return json.loads(properties)
+    except ValueError:
+        return ast.literal_eval(properties)
+
+
+def request_key(text, properties):
+    """
+    :return: the key of a request, built from its text and the properties that affect the annotations
+    """
+    properties = {k: str(v) for k, v in properties.items() if k not in IGNORED_PROPERTIES}
+    return hashlib.sha1(json.dumps([text, properties], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class LatencyModel:
+    """
+    Latency of a simulated remote server: a fixed cost per request, a cost per character of the text
+    and a random jitter, drawn from a seeded generator so that runs are reproducible.
+    """
+
+    def __init__(self, base=0.0, per_char=0.0, jitter=0.0, seed=None):
+        self.base = base
+        self.per_char = per_char
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def delay(self, text):
+        with self.lock:
+            jitter = self.random.uniform(0, self.jitter) if self.jitter else 0.0
+        return self.base + self.per_char * len(text) + jitter
+
+
+class Cassette:
+    """
+    The recorded responses, stored as jsonlines of {key, text, properties, response}.
+    New recordings are appended, so a cassette can be extended by multiple recording sessions.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.responses = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as cassette:
+                for line in cassette:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.responses[record["key"]] = record["response"]
+
+    def __len__(self):
+        return len(self.responses)
+
+    def get(self, key):
+        return self.responses.get(key)
+
+    def record(self, key, text, properties, response):
+        with self.lock:
+            if key in self.responses:
+                return
+            self.responses[key] = response
+            with open(self.path, 'a') as cassette:
+                cassette.write(json.dumps({"key": key, "text": text, "properties": properties, "response": response}))
+                cassette.write("\n")
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    A local HTTP server that speaks the annotate API of the CoreNLP server, so the transformers can run
+    without a JVM. In record mode requests are forwarded to a real CoreNLP server and its responses are
+    recorded; in replay mode the recorded responses are served back; in stub mode responses are produced
+    by StubCoreNLP. In replay mode unknown requests fail, unless a fallback to the stub is enabled.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, mode, cassette=None, upstream=None, latency=None, fallback=False, concurrency=None,
+                 error_rate=0.0):
+        super().__init__(address, AnnotateHandler)
+        self.mode = mode
+        self.cassette = cassette
+        self.upstream = upstream
+        self.latency = latency if latency is not None else LatencyModel()
+        self.fallback = fallback
+        self.stub = StubCoreNLP()
+        # the number of requests annotated at the same time, like the threads of CoreNLP
+        self.slots = threading.BoundedSemaphore(concurrency) if concurrency else None
+        # fraction of the requests that fail as if the server was overloaded
+        self.error_rate = error_rate
+        self.errors = random.Random(0)
+        self.counters = {"requests": 0, "hits": 0, "misses": 0, "recorded": 0, "timeouts": 0, "errors": 0}
+        self.counters_lock = threading.Lock()
+
+    def count(self, counter):
+        with self.counters_lock:
+            self.counters[counter] += 1
+
+    def annotate(self, text, properties):
+        """
+        :return: the status code and the body of the response
+        """
+        self.count("requests")
+        if self.mode == "stub":
+            return 200, self.stub.annotate(text, properties)
+
+        key = request_key(text, properties)
+        response = self.cassette.get(key)
+        if response is not None:
+            self.count("hits")
+            return 200, response
+        self.count("misses")
+
+        if self.mode == "record":
+            r = requests.post(self.upstream, params={'properties': json.dumps(properties)}, data=text.encode('utf-8'))
+            if r.status_code == 200:
+                self.cassette.record(key, text, properties, r.text)
+                self.count("recorded")
+            return r.status_code, r.text
+        if self.fallback:
+            return 200, self.stub.annotate(text, properties)
+        log.warning("No recorded response for '" + text[:50] + "'")
+        return 404, "No recorded response for this text and properties"
+
+
+class AnnotateHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        # liveness and readiness probes of the CoreNLP server
+        if urlparse(self.path).path in ("/live", "/ready"):
+            self.reply(200, "live" if self.path.startswith("/live") else "ready")
+        else:
+            self.reply(404, "Unknown endpoint")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/":
+            self.reply(404, "Unknown endpoint")
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        text = self.rfile.read(length).decode("utf-8")
+        try:
+            properties = parse_properties(parse_qs(url.query).get("properties", [""])[0])
+        except (ValueError, SyntaxError):
+            self.reply(400, "Malformed properties")
+            return
+
+        if self.server.error_rate and self.server.errors.random() < self.server.error_rate:
+            self.server.count("errors")
+            self.reply(503, "CoreNLP server is too busy, try again later")
+            return
+
+        if self.server.slots is not None:
+            self.server.slots.acquire()
+        try:
+            started = time.monotonic()
+            delay = self.server.latency.delay(text)
+            # like CoreNLP, give up on the requests that would exceed their timeout, in milliseconds
+            deadline = int(properties.get("timeout", 0)) / 1000
+            if deadline and delay > deadline:
+                time.sleep(deadline)
+                self.server.count("timeouts")
+                status, body = 500, "CoreNLP request timed out. Your document may be too long."
+            else:
+                status, body = self.server.annotate(text, properties)
+                remaining = delay - (time.monotonic() - started)
+                if remaining > 0:
+                    time.sleep(remaining)
+        finally:
+            if self.server.slots is not None:
+                self.server.slots.release()
+        self.reply(status, body)
+
+    def reply(self, status, body):
+        body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug(format % args)
+
+
+if __name__ == '__main__':
+    log.setLevel(logging.INFO)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    log.addHandler(handler)
+
+    parser = argparse.ArgumentParser(description="Local stand-in of the CoreNLP server that records and replays annotations")
+    parser.add_argument('-mode', type=str, choices=["record", "replay", "stub"], default="replay",
+                        help='record the responses of a CoreNLP server, replay the recorded responses, or serve the '
+                             'responses of the stub, default value is replay')
+    parser.add_argument('-cassette', type=str, help='Path to the recorded responses, required in record and replay mode')
+    parser.add_argument('-upstream', type=str, help='URL of the CoreNLP server to record, e.g. http://localhost:9000')
+    parser.add_argument('-port', type=int, default=9000, help='Port to listen to, default value is 9000')
+    parser.add_argument('-fallback', action='store_true', help='In replay mode, serve the stub for unknown requests')
+    parser.add_argument('-latency', type=float, default=0.0, help='Seconds added to every request')
+    parser.add_argument('-latencyPerChar', type=float, default=0.0, help='Seconds added per character of the text')
+    parser.add_argument('-jitter', type=float, default=0.0, help='Maximum random seconds added to every request')
+    parser.add_argument('-seed', type=int, default=None, help='Seed of the jitter')
+    parser.add_argument('-errorRate', type=float, default=0.0, help='Fraction of the requests that fail as if the '
+                                                                     'server was overloaded, default value is 0')
+    parser.add_argument('-concurrency', type=int, default=None, help='Number of requests served at the same time, '
+                                                                       'default value is unbounded')
+    args = parser.parse_args()
+
+    if args.mode != "stub" and not args.cassette:
+        log.error("A cassette is required in " + args.mode + " mode")
+        exit(1)
+    if args.mode == "record" and not args.upstream:
+        log.error("An upstream CoreNLP server is required in record mode")
+        exit(1)
+
+    cassette = Cassette(args.cassette) if args.cassette else None
+    latency = LatencyModel(args.latency, args.latencyPerChar, args.jitter, args.seed)
+    server = StandInServer(("localhost", args.port), args.mode, cassette, args.upstream, latency, args.fallback,
+                           args.concurrency, args.errorRate)
+    log.info("Serving in " + args.mode + " mode on port " + str(args.port) +
+             (" with " + str(len(cassette)) + " recorded responses" if cassette is not None else ""))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        log.info("Served " + ", ".join(k + ": " + str(v) for k, v in server.counters.items()))
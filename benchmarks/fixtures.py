@@ -0,0 +1,91 @@
+from src.conf.Constants import Keys
+from src.utils import utilities
+import os
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+ACE_PATH = os.path.join(DATA, "ACE", "ace.json")
+M2E2_PATH = os.path.join(DATA, "M2E2", "M2E2_tmp.json")
+RAMS_PATH = os.path.join(DATA, "RAMS", "rams_10.jsonlines")
+
+
+def span(words, start, end):
+    return {Keys.START.value: start, Keys.END.value: end, Keys.TEXT.value: ' '.join(words[start:end])}
+
+
+def build_instance(origin, instance_id, sentences, entities, events, lemma=None, pos_tags=None):
+    """
+    Build an instance of the common schema from already tokenized data, without CoreNLP.
+    Features that CoreNLP would produce are filled with placeholders of the right length.
+    :param sentences:   list of sentences, each one a list of words
+    :param entities:    list of (start, end, type)
+    :param events:      list of (event type, (trigger start, trigger end), [(start, end, role)])
+    """
+    words = [w for sentence in sentences for w in sentence]
+    lemma = lemma if lemma and len(lemma) == len(words) else words
+    pos_tags = pos_tags if pos_tags and len(pos_tags) == len(words) else ["NN"] * len(words)
+    boundaries = []
+    start = 0
+    for sentence in sentences:
+        boundaries.append((start, start + len(sentence)))
+        start += len(sentence)
+    return {
+        Keys.ORIGIN.value: origin,
+        Keys.ID.value: instance_id,
+        Keys.NO_SENTENCES.value: len(sentences),
+        Keys.SENTENCES.value: [span(words, s, e) for s, e in boundaries],
+        Keys.TEXT.value: ' '.join(words),
+        Keys.WORDS.value: words,
+        Keys.LEMMA.value: lemma,
+        Keys.POS_TAGS.value: pos_tags,
+        Keys.NER.value: ["O"] * len(words),
+        Keys.ENTITIES_MENTIONED.value: [dict(span(words, s, e), **{Keys.ENTITY_ID.value: instance_id + "-entity-" + str(i),
+                                                                   Keys.ENTITY_TYPE.value: "O",
+                                                                   Keys.EXISTING_ENTITY_TYPE.value: t})
+                                        for i, (s, e, t) in enumerate(entities)],
+        Keys.EVENTS_MENTIONED.value: [{Keys.EVENT_TYPE.value: event_type,
+                                       Keys.TRIGGER.value: span(words, *trigger),
+                                       Keys.ARGUMENTS.value: [dict(span(words, s, e), **{Keys.ROLE.value: role,
+                                                                                         Keys.ENTITY_TYPE.value: "O",
+                                                                                         Keys.EXISTING_ENTITY_TYPE.value: ""})
+                                                              for s, e, role in arguments]}
+                                      for event_type, trigger, arguments in events],
+        Keys.PENN_TREEBANK.value: ["(ROOT)"] * len(sentences),
+        Keys.DEPENDENCY_PARSING.value: [[] for _ in sentences],
+        Keys.CHUNKS.value: [[[pos_tags[i], "O"] for i in range(s, e)] for s, e in boundaries]
+    }
+
+
+def ace_instances():
+    for i, instance in enumerate(utilities.read_simple_json(ACE_PATH)):
+        yield build_instance("ACE", "ACE-instance-" + str(i), [instance['words']],
+                             [(e['start'], e['end'], e['entity-type']) for e in instance['golden-entity-mentions']],
+                             [(e['event_type'], (e['trigger']['start'], e['trigger']['end']),
+                               [(a['start'], a['end'], a['role']) for a in e['arguments']])
+                              for e in instance['golden-event-mentions']],
+                             instance.get('lemma'), instance.get('pos-tags'))
+
+
+def m2e2_instances():
+    for i, instance in enumerate(utilities.read_simple_json(M2E2_PATH)):
+        yield build_instance("M2E2", "M2E2-instance-" + str(i) + "-" + instance['sentence_id'], [instance['words']],
+                             [(e['start'], e['end'], e['entity-type']) for e in instance['golden-entity-mentions']],
+                             [(e['event_type'], (e['trigger']['start'], e['trigger']['end']),
+                               [(a['start'], a['end'], a['role']) for a in e['arguments']])
+                              for e in instance['golden-event-mentions']],
+                             None, instance.get('pos-tags'))
+
+
+def rams_instances():
+    for i, instance in enumerate(utilities.read_jsonlines(RAMS_PATH)):
+        trigger = instance['evt_triggers'][0]
+        yield build_instance("RAMS", "RAMS-instance-" + str(i) + "-" + instance['doc_key'], instance['sentences'],
+                             [(e[0], e[1] + 1, "") for e in instance['ent_spans']],
+                             [(trigger[2][0][0], (trigger[0], trigger[1] + 1),
+                               [(link[1][0], link[1][1] + 1, link[2]) for link in instance['gold_evt_links']])])
+
+
+def unified_instances():
+    """
+    :return: the samples under data/ as instances of the common schema
+    """
+    return list(ace_instances()) + list(m2e2_instances()) + list(rams_instances())
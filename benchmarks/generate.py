@@ -0,0 +1,196 @@
+from benchmarks.fixtures import ACE_PATH, M2E2_PATH, RAMS_PATH
+from src.utils import utilities
+import argparse
+import hashlib
+import json
+import random
+
+# event types and roles as they appear in each dataset, all of them known to the mappings of Configuration
+ACE_EVENTS = ["Conflict:Attack", "Life:Die", "Justice:Arrest-Jail", "Movement:Transport", "Contact:Meet",
+              "Transaction:Transfer-Money", "Personnel:End-Position", "Life:Injure"]
+ACE_ROLES = ["Attacker", "Target", "Place", "Victim", "Person", "Entity", "Agent", "Instrument"]
+ACE_ENTITY_TYPES = ["PER:Individual", "PER:Group", "ORG:Government", "ORG:Commercial", "GPE:Nation", "LOC:Address"]
+M2E2_EVENTS = ["Conflict:Attack", "Conflict:Demonstrate", "Justice:Arrest-Jail", "Life:Die", "Movement:Transport",
+               "Contact:Meet", "Contact:Phone-Write", "Transaction:Transfer-Money"]
+M2E2_ROLES = ["Attacker", "Target", "Place", "Victim", "Agent", "Person", "Entity", "Instrument"]
+M2E2_ENTITY_TYPES = ["PER", "ORG", "GPE", "LOC", "FAC", "VEH", "WEA"]
+RAMS_EVENTS = ["life.die.deathcausedbyviolentevents", "conflict.attack.firearmattack", "conflict.attack.bombing",
+               "justice.arrestjaildetain.arrestjaildetain", "contact.discussion.meet", "movement.transportperson.n/a",
+               "transaction.transfermoney.purchase", "conflict.demonstrate.marchprotestpoliticalgathering"]
+RAMS_ROLES = ["victim", "killer", "place", "attacker", "target", "instrument", "participant", "detainee"]
+EMM_EVENTS = ["fight", "protest/riot", "assault", "arrest", "terrorist/suicide attack", "property seizure/destruction"]
+EMM_ROLES = ["Perpetrator", "Dead", "Injured", "Location", "Weapons", "Time", "Arrested"]
+
+
+def vocabulary():
+    """
+    :return: the alphabetic words of the samples under data/, lower-cased words and names separately
+    """
+    words = [w for instance in utilities.read_simple_json(ACE_PATH) for w in instance['words']]
+    words += [w for instance in utilities.read_simple_json(M2E2_PATH) for w in instance['words']]
+    words += [w for instance in utilities.read_jsonlines(RAMS_PATH) for s in instance['sentences'] for w in s]
+    words = sorted(set(w for w in words if w.isalpha()))
+    return [w for w in words if w.islower()], [w for w in words if w[0].isupper()]
+
+
+class Generator:
+    """
+    Generates arbitrarily many synthetic instances in the input format of each dataset. The sentences are drawn
+    from the vocabulary of the samples under data/, and the spans of the entities, triggers and arguments are
+    placed at random on the words, so the instances are valid input of the transformers, but meaningless.
+    """
+
+    def __init__(self, seed=None, min_words=8, max_words=30, max_sentences=4):
+        self.random = random.Random(seed)
+        self.words, self.names = vocabulary()
+        self.min_words = min_words
+        self.max_words = max_words
+        self.max_sentences = max_sentences
+
+    def sentence(self):
+        length = self.random.randint(self.min_words, self.max_words)
+        words = [self.random.choice(self.names if self.random.random() < 0.15 else self.words) for _ in range(length)]
+        words[0] = words[0].capitalize()
+        return words + ["."]
+
+    def spans(self, words, n, max_length=3):
+        """
+        :return: up to n disjoint [start, end) spans that do not contain punctuation
+        """
+        spans = []
+        taken = set()
+        for _ in range(4 * n):
+            if len(spans) == n:
+                break
+            length = self.random.randint(1, max_length)
+            start = self.random.randrange(0, max(1, len(words) - length))
+            end = start + length
+            if any(i in taken or not words[i].isalpha() for i in range(start, min(end, len(words)))) or end > len(words):
+                continue
+            taken.update(range(start, end))
+            spans.append((start, end))
+        return spans
+
+    def sentence_level(self, event_types, roles, entity_types):
+        """
+        :return: the words, the entities as (start, end, type) and the events as
+                 (event type, trigger span, [(start, end, role)]) of a single sentence
+        """
+        words = self.sentence()
+        spans = self.spans(words, self.random.randint(2, 5))
+        trigger, spans = spans[0], spans[1:]
+        trigger = (trigger[0], trigger[0] + 1)
+        entities = [(s, e, self.random.choice(entity_types)) for s, e in spans]
+        arguments = [(s, e, self.random.choice(roles)) for s, e, _ in entities if self.random.random() < 0.7]
+        return words, entities, [(self.random.choice(event_types), trigger, arguments)]
+
+    def ace(self, i):
+        words, entities, events = self.sentence_level(ACE_EVENTS, ACE_ROLES, ACE_ENTITY_TYPES)
+        entity_ids = {}
+        golden_entities = []
+        for j, (s, e, entity_type) in enumerate(entities):
+            entity_ids[(s, e)] = "SYN_ENG_" + str(i) + "-E" + str(j)
+            golden_entities.append({"text": ' '.join(words[s:e]), "entity-type": entity_type,
+                                    "head": {"text": words[e - 1], "start": e - 1, "end": e},
+                                    "entity_id": entity_ids[(s, e)], "start": s, "end": e})
+        entity_types = {(s, e): t for s, e, t in entities}
+        return {"sentence": ' '.join(words), "words": words,
+                "golden-entity-mentions": golden_entities,
+                "golden-event-mentions": [{"trigger": {"text": ' '.join(words[t[0]:t[1]]), "start": t[0], "end": t[1]},
+                                           "arguments": [{"role": role, "entity-type": entity_types[(s, e)],
+                                                          "text": ' '.join(words[s:e]), "start": s, "end": e}
+                                                         for s, e, role in arguments],
+                                           "event_type": event_type}
+                                          for event_type, t, arguments in events]}
+
+    def m2e2(self, i):
+        words, entities, events = self.sentence_level(M2E2_EVENTS, M2E2_ROLES, M2E2_ENTITY_TYPES)
+        return {"sentence": ' '.join(words), "words": words, "sentence_id": "SYN_EN_NW_" + str(i // 20) + "_" + str(i % 20),
+                "golden-entity-mentions": [{"text": ' '.join(words[s:e]), "entity-type": t, "start": s, "end": e}
+                                           for s, e, t in entities],
+                "golden-event-mentions": [{"trigger": {"text": ' '.join(words[t[0]:t[1]]), "start": t[0], "end": t[1]},
+                                           "arguments": [{"role": role, "text": ' '.join(words[s:e]), "start": s, "end": e}
+                                                         for s, e, role in arguments],
+                                           "event_type": event_type}
+                                          for event_type, t, arguments in events]}
+
+    def rams(self, i):
+        sentences = [self.sentence() for _ in range(self.random.randint(1, self.max_sentences))]
+        words = [w for sentence in sentences for w in sentence]
+        spans = self.spans(words, self.random.randint(2, 6))
+        trigger, spans = spans[0], spans[1:]
+        event_type = self.random.choice(RAMS_EVENTS)
+        links = []
+        for j, (s, e) in enumerate(spans):
+            links.append(([s, e - 1], "evt" + str(j % 100).zfill(3) + "arg" + str(j + 1).zfill(2) + self.random.choice(RAMS_ROLES)))
+        return {"rel_triggers": [], "gold_rel_links": [],
+                "doc_key": "nw_RC" + hashlib.sha1(str(i).encode()).hexdigest(),
+                "ent_spans": [[s, e, [[role, 1.0]]] for (s, e), role in links],
+                "language_id": "eng", "source_url": "", "split": "train",
+                "evt_triggers": [[trigger[0], trigger[0], [[event_type, 1.0]]]],
+                "sentences": sentences,
+                "gold_evt_links": [[[trigger[0], trigger[0]], span, role] for span, role in links]}
+
+    def emm(self, i):
+        paragraphs = [self.sentence() for _ in range(self.random.randint(1, self.max_sentences))]
+        text = ""
+        offsets = []
+        for words in paragraphs:
+            for w in words:
+                if text and w != ".":
+                    text += " "
+                offsets.append((len(text), len(text) + len(w)))
+                text += w
+            text += "\n"
+        words = [w for words in paragraphs for w in words]
+        spans = self.spans(words, self.random.randint(2, 5))
+        result = [{"from_name": "ev_type", "to_name": "text", "type": "choices",
+                   "value": {"choices": [self.random.choice(EMM_EVENTS)]}}]
+        for j, (s, e) in enumerate(spans):
+            if j == 0:
+                e = s + 1
+            label = "Event Trigger" if j == 0 else self.random.choice(EMM_ROLES)
+            start, end = offsets[s][0], offsets[e - 1][1]
+            result.append({"from_name": "label", "to_name": "text", "type": "labels",
+                           "value": {"start": start, "end": end, "text": text[start:end], "labels": [label]}})
+        return {"id": i, "data": {"text": text, "filename": "synthetic_" + str(i) + ".txt"},
+                "completions": [{"id": i, "result": result}]}
+
+
+# the generator of each dataset and whether the dataset is a jsonlines or a JSON list
+datasets = {
+    "ace": (Generator.ace, False),
+    "m2e2": (Generator.m2e2, False),
+    "rams": (Generator.rams, True),
+    "emm": (Generator.emm, False)
+}
+
+
+def generate(dataset, n, path, seed=None):
+    """
+    Write n synthetic instances of the dataset in path. Instances are written one by one,
+    so the size of the output is not bounded by the memory.
+    """
+    generator = Generator(seed)
+    method, jsonlines = datasets[dataset]
+    with open(path, 'w') as output:
+        if not jsonlines:
+            output.write("[")
+        for i in range(n):
+            if i > 0 and not jsonlines:
+                output.write(",\n")
+            json.dump(method(generator, i), output)
+            if jsonlines:
+                output.write("\n")
+        if not jsonlines:
+            output.write("]\n")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic dataset in the input format of a transformer")
+    parser.add_argument('-dataset', type=str, choices=list(datasets), required=True, help='Format of the dataset')
+    parser.add_argument('-n', type=int, default=1000, help='Number of instances, default value is 1000')
+    parser.add_argument('-out', type=str, required=True, help='Output path')
+    parser.add_argument('-seed', type=int, default=None, help='Seed of the generator')
+    args = parser.parse_args()
+    generate(args.dataset, args.n, args.out, args.seed)
@@ -0,0 +1,233 @@
+from benchmarks.fixtures import ACE_PATH, M2E2_PATH, RAMS_PATH, unified_instances
+from benchmarks.stub_corenlp import StubCoreNLP
+from src.conf import Configuration
+from src.conf.Constants import Keys
+from src.utils import utilities
+from src.validate import ValidateTransformation
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import timeit
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "micro.json")
+
+# the benchmarks that need the spaCy model and the NLTK data
+TRANSFORMER_BENCHMARKS = ["Transformer.search_text_in_list", "EmmTransformer.search_text_in_list_",
+                          "Transformer.chunking"]
+
+
+def ner_tags(words, entities):
+    """
+    :return: the entity type of each word, as CoreNLP tags words, "O" outside the entities
+    """
+    tags = ["O"] * len(words)
+    for entity in entities:
+        for i in range(entity['start'], min(entity['end'], len(words))):
+            tags[i] = entity['entity-type'].split(":")[0]
+    return tags
+
+
+def rams_spans():
+    """
+    :return: (start, end, text, words, whole text, char start, char end) of the entities of the RAMS samples
+    """
+    spans = []
+    for instance in utilities.read_jsonlines(RAMS_PATH):
+        words = [w for sentence in instance['sentences'] for w in sentence]
+        offsets = []
+        position = 0
+        for w in words:
+            offsets.append(position)
+            position += len(w) + 1
+        whole_text = ' '.join(words)
+        for entity in instance['ent_spans']:
+            start, end = entity[0], entity[1] + 1
+            text = ' '.join(words[start:end])
+            spans.append((start, end, text, words, whole_text, offsets[start], offsets[start] + len(text)))
+    return spans
+
+
+class Fixtures:
+    """
+    Inputs of the microbenchmarks, derived from the samples under data/
+    """
+
+    def __init__(self):
+        ace = utilities.read_simple_json(ACE_PATH)
+        m2e2 = utilities.read_simple_json(M2E2_PATH)
+        self.ner = [ner_tags(i['words'], i['golden-entity-mentions']) for i in ace + m2e2]
+        self.entity_ner = [tags[e['start']:e['end']] for i, tags in zip(ace + m2e2, self.ner)
+                           for e in i['golden-entity-mentions']]
+        self.tagged = [(i['words'], i['pos-tags']) for i in ace + m2e2 if len(i['words']) == len(i['pos-tags'])]
+        self.event_types = [e['event_type'].replace(":", ".") for i in ace + m2e2 for e in i['golden-event-mentions']]
+        self.roles = [a['role'].lower() for i in ace + m2e2 for e in i['golden-event-mentions'] for a in e['arguments']]
+        self.spans = rams_spans()
+        self.pointers = []
+        for instance in unified_instances():
+            words = instance[Keys.WORDS.value]
+            spans = instance[Keys.SENTENCES.value] + instance[Keys.ENTITIES_MENTIONED.value]
+            for event in instance[Keys.EVENTS_MENTIONED.value]:
+                spans += [event[Keys.TRIGGER.value]] + event[Keys.ARGUMENTS.value]
+            self.pointers += [(s[Keys.TEXT.value], s[Keys.START.value], s[Keys.END.value], words) for s in spans]
+
+
+def reference():
+    """
+    A fixed pure-Python workload, measured along with every function to calibrate the speed of the machine
+    """
+    return sorted(str(i * 7919 % 10007) for i in range(10000))
+
+
+def benchmarks(fixtures):
+    """
+    :return: a dictionary from the name of each function to (a callable that runs it on all its fixtures,
+             the number of fixtures), and the names of the functions that were skipped because they need the
+             spaCy model or the NLTK data and those are not installed
+    """
+    from src.transformers.Transformer import iob_format
+    validator = ValidateTransformation()
+    suite = {
+        "iob_format": (lambda: [iob_format(tags) for tags in fixtures.ner], len(fixtures.ner)),
+        "utilities.most_frequent": (lambda: [utilities.most_frequent(tags) for tags in fixtures.entity_ner],
+                                    len(fixtures.entity_ner)),
+        "utilities.find_most_similar": (lambda: [utilities.find_most_similar(t, Configuration.events)
+                                                 for t in fixtures.event_types] +
+                                                [utilities.find_most_similar(r, Configuration.roles)
+                                                 for r in fixtures.roles],
+                                        len(fixtures.event_types) + len(fixtures.roles)),
+        "ValidateTransformation.test_pointers": (lambda: [validator.test_pointers(*p) for p in fixtures.pointers],
+                                                 len(fixtures.pointers))
+    }
+
+    try:
+        from src.transformers.Transformer import Transformer
+        from src.transformers.EMM_Transformer import EmmTransformer
+        transformer = Transformer(StubCoreNLP(), False)
+        emm_transformer = EmmTransformer(None, StubCoreNLP(), False)
+    except (OSError, LookupError) as e:
+        print("Skipping the benchmarks of the transformers, the spaCy model or the NLTK data are missing: " + str(e),
+              file=sys.stderr)
+        return suite, list(TRANSFORMER_BENCHMARKS)
+
+    suite["Transformer.search_text_in_list"] = (
+        lambda: [transformer.search_text_in_list(s, e, text, words) for s, e, text, words, _, _, _ in fixtures.spans],
+        len(fixtures.spans))
+    suite["EmmTransformer.search_text_in_list_"] = (
+        lambda: [emm_transformer.search_text_in_list_(cs, ce, whole, text, words)
+                 for _, _, text, words, whole, cs, ce in fixtures.spans],
+        len(fixtures.spans))
+    suite["Transformer.chunking"] = (lambda: [transformer.chunking(words, tags) for words, tags in fixtures.tagged],
+                                     len(fixtures.tagged))
+    return suite, []
+
+
+def measure(function, items, repeat=10):
+    """
+    Measure the function and the reference workload in alternating runs of at least 0.2 seconds each, so both
+    are measured under the same load of the machine
+    :return: the best time per fixture in microseconds, and the best time of the reference workload in microseconds
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    reference_timer = timeit.Timer(reference)
+    reference_number, _ = reference_timer.autorange()
+    best = best_reference = float("inf")
+    for _ in range(repeat):
+        best = min(best, timer.timeit(number) / number)
+        best_reference = min(best_reference, reference_timer.timeit(reference_number) / reference_number)
+    return round(1e6 * best / items, 3), round(1e6 * best_reference, 3)
+
+
+def run(names=None, repeat=10):
+    """
+    :return: the time per fixture of each function, the time of the reference workload measured along with it,
+             and the names of the requested functions that were skipped
+    """
+    logging.disable(logging.WARNING)
+    suite, skipped = benchmarks(Fixtures())
+    results = {}
+    references = {}
+    for name, (function, items) in suite.items():
+        if names and name not in names:
+            continue
+        results[name], references[name] = measure(function, items, repeat)
+        print("{:<40}{:>12} us".format(name, results[name]))
+    return results, references, [name for name in skipped if not names or name in names]
+
+
+def compare(results, references, baseline, tolerance):
+    """
+    The times are compared relative to the reference workload measured along with them, so a machine that is
+    slower or busier than the one of the baseline does not report regressions
+    :return: the names of the functions that are slower than their baseline by more than the tolerance,
+             and the names of the functions without a baseline
+    """
+    regressions = []
+    missing = []
+    for name, value in sorted(results.items()):
+        if name not in baseline["results"]:
+            print("{:<40}{:>12} us   NO BASELINE".format(name, value))
+            missing.append(name)
+            continue
+        expected = baseline["results"][name]
+        if name in baseline.get("references", {}):
+            expected *= references[name] / baseline["references"][name]
+        ratio = value / expected
+        regressed = ratio > 1 + tolerance
+        print("{:<40}{:>12} us   baseline {:>10} us   {:>6.2f}x{}".format(name, value, round(expected, 3), ratio,
+                                                                         "   REGRESSION" if regressed else ""))
+        if regressed:
+            regressions.append(name)
+    return regressions, missing
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the hot functions, on fixtures derived from data/")
+    parser.add_argument('-functions', type=str, nargs='+', help='Functions to benchmark, default value is all of them')
+    parser.add_argument('-repeat', type=int, default=10, help='Number of measurements per function, the best is kept, '
+                                                             'default value is 10')
+    parser.add_argument('-save', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('-compare', action='store_true', help='Compare the results with the baseline and exit with '
+                                                              'an error if any function regressed or has no baseline')
+    parser.add_argument('-baseline', type=str, default=BASELINE_PATH, help='Path to the baseline, default value is '
+                                                                           'benchmarks/baselines/micro.json')
+    parser.add_argument('-tolerance', type=float, default=0.3, help='Accepted slowdown over the baseline, default '
+                                                                    'value is 0.3, i.e. 30%%')
+    args = parser.parse_args()
+
+    results, references, skipped = run(args.functions, args.repeat)
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print("\nbaseline of " + baseline["machine"] + ", python " + baseline["python"])
+        regressions, missing = compare(results, references, baseline, args.tolerance)
+        failed = False
+        if regressions:
+            print("\n" + str(len(regressions)) + " functions regressed beyond " + str(round(100 * args.tolerance)) +
+                  "%: " + ", ".join(regressions))
+            failed = True
+        if missing:
+            print("\n" + str(len(missing)) + " functions have no baseline: " + ", ".join(missing))
+            failed = True
+        if skipped:
+            # the functions that cannot be measured here are reported, they are compared where they can be measured
+            print("\n" + str(len(skipped)) + " functions were skipped and not compared: " + ", ".join(skipped))
+        if failed:
+            exit(1)
+    if args.save:
+        saved = {"machine": (platform.platform() + " " + platform.processor()).strip(), "python": platform.python_version(),
+                 "results": results, "references": references}
+        if os.path.exists(args.baseline):
+            # keep the baselines of the functions that were not benchmarked
+            with open(args.baseline) as f:
+                previous = json.load(f)
+            saved["results"] = dict(previous["results"], **results)
+            saved["references"] = dict(previous.get("references", {}), **references)
+        if skipped:
+            print("\nThe baselines of " + ", ".join(skipped) + " were not recorded", file=sys.stderr)
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(saved, f, indent=2, sort_keys=True)
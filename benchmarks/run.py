@@ -0,0 +1,180 @@
+from benchmarks.generate import generate
+from benchmarks.stub_corenlp import StubCoreNLP
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue as queues
+import resource
+import sys
+import tempfile
+import time
+import traceback
+
+# the transformers in the order of src/transform.py
+TRANSFORMERS = {
+    "rams": ("src.transformers.RAMS_Trasnformer", "RamsTransformer", ".jsonlines"),
+    "emm": ("src.transformers.EMM_Transformer", "EmmTransformer", ".json"),
+    "m2e2": ("src.transformers.M2E2_Transformer", "M2e2Transformer", ".json"),
+    "ace": ("src.transformers.ACE_Transformer", "AceTransformer", ".json")
+}
+
+
+def peak_rss():
+    """
+    :return: peak resident set size of the current process in MB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes in macOS, kilobytes in Linux
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def count_lines(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb') as f:
+        return sum(1 for _ in f)
+
+
+def corenlp_client(server, latency):
+    """
+    :return: a client of the CoreNLP server at the URL, or the stub if no server is given
+    """
+    if server is None:
+        return StubCoreNLP(latency=latency)
+    from src.utils.corenlp import CoreNLPServers
+    return CoreNLPServers([server])
+
+
+def transform_stage(dataset, input_path, output_path, latency, server, pretokenized, annotation_workers):
+    module, name, _ = TRANSFORMERS[dataset]
+    transformer_class = getattr(__import__(module, fromlist=[name]), name)
+    transformer = transformer_class(input_path, corenlp_client(server, latency), False)
+    if pretokenized:
+        transformer.enable_pretokenized()
+    transformer.annotation_workers = annotation_workers
+    start = time.perf_counter()
+    transformer.transform(output_path)
+    return time.perf_counter() - start, count_lines(output_path)
+
+
+def validate_stage(path, workers):
+    from src.validate import validate_file
+    start = time.perf_counter()
+    validated, _ = validate_file(path, True, workers)
+    return time.perf_counter() - start, validated
+
+
+def evaluate_stage(path, workers):
+    from src.evaluate import Evaluator, evaluate_predictions
+    from src.task_evaluators.adapters import CommonSchemaAdapter
+    evaluator = Evaluator()
+    start = time.perf_counter()
+    evaluate_predictions(evaluator, CommonSchemaAdapter(path), path, workers)
+    return time.perf_counter() - start, len(evaluator.instance_origins)
+
+
+def measure(queue, stage, *args):
+    try:
+        from src.utils import timing
+        timing.stages.enabled = True
+        logging.disable(logging.WARNING)
+        elapsed, instances = stage(*args)
+        stages = {name: s["seconds"] for name, s in timing.stages.to_dict()["stages"].items()}
+        queue.put((None, (elapsed, instances, peak_rss(), stages)))
+    except BaseException:
+        queue.put((traceback.format_exc(), None))
+
+
+def run_stage(stage, *args):
+    """
+    Run a stage in a fresh process, so that its peak RSS is not inflated by the previous stages
+    :return: a dictionary with the seconds, the instances, the instances/sec, the peak RSS in MB of the stage
+             and the seconds spent in each timed stage of the pipeline
+    """
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=measure, args=(queue, stage) + args)
+    process.start()
+    while True:
+        try:
+            error, result = queue.get(timeout=1)
+            break
+        except queues.Empty:
+            if not process.is_alive():
+                # the result may have been put right before the process exited
+                try:
+                    error, result = queue.get(timeout=1)
+                    break
+                except queues.Empty:
+                    raise RuntimeError("The " + stage.__name__ + " process exited with code " +
+                                       str(process.exitcode) + " without a result")
+    process.join()
+    if error is not None:
+        raise RuntimeError("The " + stage.__name__ + " process failed:\n" + error)
+    elapsed, instances, rss, stages = result
+    return {"seconds": round(elapsed, 3), "instances": instances,
+            "instances/sec": round(instances / elapsed, 1) if elapsed > 0 else None, "peak RSS (MB)": round(rss, 1),
+            "stages": stages}
+
+
+def benchmark(datasets, n, seed, latency, workers, directory, server=None, pretokenized=False, annotation_workers=1):
+    results = {}
+    outputs = []
+    for dataset in datasets:
+        input_path = os.path.join(directory, dataset + TRANSFORMERS[dataset][2])
+        output_path = os.path.join(directory, dataset + ".out.jsonlines")
+        generate(dataset, n, input_path, seed)
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        results["transform " + dataset] = run_stage(transform_stage, dataset, input_path, output_path, latency,
+                                                      server, pretokenized, annotation_workers)
+        outputs.append(output_path)
+
+    # the unified output of all the transformers
+    unified = os.path.join(directory, "unified.jsonlines")
+    with open(unified, 'wb') as out:
+        for path in outputs:
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    out.write(f.read())
+    results["validate"] = run_stage(validate_stage, unified, workers)
+    results["evaluate"] = run_stage(evaluate_stage, unified, workers)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the transformers, the validator and the evaluator "
+                                                 "on synthetic datasets, against a stub of CoreNLP")
+    parser.add_argument('-datasets', type=str, nargs='+', choices=list(TRANSFORMERS), default=list(TRANSFORMERS),
+                        help='Datasets to benchmark, default value is all of them')
+    parser.add_argument('-n', type=int, default=500, help='Number of instances per dataset, default value is 500')
+    parser.add_argument('-seed', type=int, default=0, help='Seed of the generators, default value is 0')
+    parser.add_argument('-latency', type=float, default=0.0, help='Seconds added to every request of the stub CoreNLP')
+    parser.add_argument('-server', type=str, help='URL of a CoreNLP server to use instead of the stub, e.g. the '
+                                                  'stand-in server of benchmarks.corenlp_server at http://localhost:9000')
+    parser.add_argument('-pretokenized', action='store_true', help='Annotate the tokens of RAMS, ACE and M2E2 as they are')
+    parser.add_argument('-annotationWorkers', type=int, default=1, help='Number of CoreNLP requests of a transformer in '
+                                                                     'flight at the same time, default value is 1')
+    parser.add_argument('-workers', type=int, default=1, help='Number of processes of the validator and the evaluator')
+    parser.add_argument('-out', type=str, help='Path to store the results as JSON')
+    parser.add_argument('-keep', type=str, help='Directory to keep the generated datasets and outputs')
+    args = parser.parse_args()
+
+    if args.keep:
+        os.makedirs(args.keep, exist_ok=True)
+        results = benchmark(args.datasets, args.n, args.seed, args.latency, args.workers, args.keep,
+                            args.server, args.pretokenized, args.annotationWorkers)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            results = benchmark(args.datasets, args.n, args.seed, args.latency, args.workers, directory,
+                                args.server, args.pretokenized, args.annotationWorkers)
+
+    print("{:<16}{:>12}{:>12}{:>16}{:>16}".format("stage", "instances", "seconds", "instances/sec", "peak RSS (MB)"))
+    for stage, result in results.items():
+        print("{:<16}{:>12}{:>12}{:>16}{:>16}".format(stage, result["instances"], result["seconds"],
+                                                      str(result["instances/sec"]), result["peak RSS (MB)"]))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
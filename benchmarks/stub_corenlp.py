@@ -0,0 +1,93 @@
+import json
+import re
+import time
+import zlib
+
+TOKEN = re.compile(r"\w+(?:[.'’]\w+)*|[^\w\s]")
+PTB_ESCAPES = {"(": "-LRB-", ")": "-RRB-", "[": "-LSB-", "]": "-RSB-", "{": "-LCB-", "}": "-RCB-"}
+SENTENCE_END = {".", "!", "?"}
+NER_TYPES = ["PERSON", "LOCATION", "ORGANIZATION", "DATE"]
+
+
+def pos_tag(word):
+    if not word[0].isalnum():
+        return word if word in SENTENCE_END or word in {",", ":"} else ":"
+    if word[0].isdigit():
+        return "CD"
+    if word[0].isupper():
+        return "NNP"
+    if word.endswith("ing"):
+        return "VBG"
+    if word.endswith("ed"):
+        return "VBD"
+    return "NN"
+
+
+def ner_tag(word):
+    if not word[0].isupper():
+        return "O"
+    return NER_TYPES[zlib.crc32(word.encode("utf-8")) % len(NER_TYPES)]
+
+
+class StubCoreNLP:
+    """
+    Offline stand-in for StanfordCoreNLP with the same annotate interface. It tokenizes with a regular
+    expression, splits sentences at final punctuation and produces deterministic tags, a flat parse tree
+    and a chain of dependencies, so benchmarks measure our own code and are comparable across commits.
+    Character offsets are counted in UTF-16 code units, as in CoreNLP.
+    """
+
+    def __init__(self, latency=0.0, latency_per_char=0.0):
+        """
+        :param latency:             seconds added to every request
+        :param latency_per_char:    seconds added per character of the request
+        """
+        self.latency = latency
+        self.latency_per_char = latency_per_char
+        self.requests = 0
+
+    def annotate(self, text, properties=None):
+        self.requests += 1
+        if self.latency or self.latency_per_char:
+            time.sleep(self.latency + self.latency_per_char * len(text))
+        properties = properties or {}
+        whitespace = str(properties.get("tokenize.whitespace", "false")).lower() == "true"
+        eol = str(properties.get("ssplit.eolonly", "false")).lower() == "true"
+
+        sentences = []
+        lines = text.split("\n") if eol else [text]
+        line_start = 0
+        for line in lines:
+            pattern = re.finditer(r"\S+", line) if whitespace else TOKEN.finditer(line)
+            current = []
+            for match in pattern:
+                current.append((match.group(), line_start + match.start(), line_start + match.end()))
+                if not eol and match.group() in SENTENCE_END:
+                    sentences.append(current)
+                    current = []
+            if current:
+                sentences.append(current)
+            line_start += len(line) + 1
+        if len(text.encode("utf-16-le")) != 2 * len(text):
+            # like CoreNLP, count the offsets in UTF-16 code units
+            units = [0]
+            for c in text:
+                units.append(units[-1] + (2 if ord(c) > 0xFFFF else 1))
+            sentences = [[(word, units[begin], units[end]) for word, begin, end in tokens] for tokens in sentences]
+        return json.dumps({"sentences": [self.sentence(i, tokens) for i, tokens in enumerate(sentences)]})
+
+    def sentence(self, index, tokens):
+        words = [PTB_ESCAPES.get(word, word) for word, _, _ in tokens]
+        tags = [pos_tag(word) for word in words]
+        return {
+            "index": index,
+            "parse": "(ROOT (S " + " ".join("(" + tag + " " + word + ")" for word, tag in zip(words, tags)) + "))",
+            "enhancedPlusPlusDependencies": [{"dep": "ROOT" if i == 0 else "dep", "governor": i, "dependent": i + 1}
+                                             for i in range(len(words))],
+            "tokens": [{"index": i + 1, "word": word, "originalText": original, "lemma": word.lower(), "pos": tag,
+                        "ner": ner_tag(word), "characterOffsetBegin": begin, "characterOffsetEnd": end}
+                       for i, (word, tag, (original, begin, end)) in enumerate(zip(words, tags, tokens))]
+        }
+
+    def close(self):
+        pass
@@ -0,0 +1,74 @@
+from benchmarks.fixtures import unified_instances
+from src.validate import ValidateTransformation
+from src.conf.Constants import Keys
+from src.utils import utilities
+import argparse
+import time
+
+
+def legacy_test_pointers(text, start, end, words):
+    new_text = ' '.join(words[start:end])
+    return utilities.string_similarity(new_text, text) >= 0.9
+
+
+def legacy_check_parsing(parsing_dict, detailed=True):
+    """
+    The checks as they were before the validation plan: every span goes through difflib
+    and the fields are looked up one by one. Kept as the reference of the benchmark.
+    """
+    if detailed:
+        assert(Keys.SENTENCES.value in parsing_dict and Keys.TEXT.value in parsing_dict and
+               Keys.WORDS.value in parsing_dict and Keys.LEMMA.value in parsing_dict and
+               Keys.POS_TAGS.value in parsing_dict and Keys.NER.value in parsing_dict and
+               Keys.PENN_TREEBANK.value in parsing_dict and Keys.DEPENDENCY_PARSING.value in parsing_dict and
+               Keys.CHUNKS.value in parsing_dict)
+        assert(len(parsing_dict[Keys.WORDS.value]) == len(parsing_dict[Keys.LEMMA.value]) and
+               len(parsing_dict[Keys.WORDS.value]) == len(parsing_dict[Keys.POS_TAGS.value]) and
+               len(parsing_dict[Keys.WORDS.value]) == len(parsing_dict[Keys.NER.value]))
+        assert(parsing_dict[Keys.NO_SENTENCES.value] == len(parsing_dict[Keys.SENTENCES.value]) and
+               parsing_dict[Keys.NO_SENTENCES.value] == len(parsing_dict[Keys.PENN_TREEBANK.value]) and
+               parsing_dict[Keys.NO_SENTENCES.value] == len(parsing_dict[Keys.CHUNKS.value]) and
+               parsing_dict[Keys.NO_SENTENCES.value] == len(parsing_dict[Keys.DEPENDENCY_PARSING.value]))
+    assert(len(parsing_dict[Keys.WORDS.value]) == len([c for ch in parsing_dict[Keys.CHUNKS.value] for c in ch]))
+    words = parsing_dict[Keys.WORDS.value]
+    for sentence in parsing_dict[Keys.SENTENCES.value]:
+        assert(legacy_test_pointers(sentence[Keys.TEXT.value], sentence[Keys.START.value], sentence[Keys.END.value],
+                                    words))
+    if detailed:
+        for entity in parsing_dict[Keys.ENTITIES_MENTIONED.value]:
+            assert(legacy_test_pointers(entity[Keys.TEXT.value], entity[Keys.START.value], entity[Keys.END.value],
+                                        words))
+    for event in parsing_dict[Keys.EVENTS_MENTIONED.value]:
+        trigger = event[Keys.TRIGGER.value]
+        assert(legacy_test_pointers(trigger[Keys.TEXT.value], trigger[Keys.START.value], trigger[Keys.END.value],
+                                    words))
+        for arg in event[Keys.ARGUMENTS.value]:
+            assert(legacy_test_pointers(arg[Keys.TEXT.value], arg[Keys.START.value], arg[Keys.END.value], words))
+    return True
+
+
+def records_per_second(check, instances, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for instance in instances:
+            check(instance)
+    return repeats * len(instances) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the validation of the samples under data/")
+    parser.add_argument('-repeats', type=int, default=200, help='Number of passes over the samples, default value is 200')
+    parser.add_argument('-disableDetailed', action='store_true', help='Benchmark the non-detailed validation')
+    args = parser.parse_args()
+
+    detailed = not args.disableDetailed
+    instances = unified_instances()
+    validator = ValidateTransformation()
+    assert all(not validator.check_parsing(instance, detailed) for instance in instances)
+
+    before = records_per_second(lambda instance: legacy_check_parsing(instance, detailed), instances, args.repeats)
+    after = records_per_second(lambda instance: validator.check_parsing(instance, detailed), instances, args.repeats)
+    print("instances:\t" + str(len(instances)) + " x " + str(args.repeats))
+    print("before:\t\t" + str(round(before, 1)) + " records/sec")
+    print("after:\t\t" + str(round(after, 1)) + " records/sec")
+    print("speedup:\t" + str(round(after / before, 2)) + "x")
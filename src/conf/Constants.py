@@ -26,3 +26,4 @@ class Keys(Enum):
     TRIGGER = 'trigger'
     EVENT_TYPE = 'event-type'
     COUNTER = "counter"
+    TOKEN_OFFSETS = "token-offsets"
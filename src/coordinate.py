@@ -0,0 +1,156 @@
+from .utils import utilities
+from .utils.workqueue import WorkQueue
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+
+log = logging.getLogger("COORDINATOR")
+log.setLevel(logging.DEBUG)
+consoleOUT = logging.StreamHandler(sys.stdout)
+consoleOUT.setLevel(logging.DEBUG)
+formatter = logging.Formatter('\n%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+consoleOUT.setFormatter(formatter)
+consoleOUT.terminator = ""
+log.addHandler(consoleOUT)
+
+
+def write_shard(instances, path, jsonlines):
+    with open(path, 'w') as f:
+        if jsonlines:
+            for instance in instances:
+                f.write(json.dumps(instance) + "\n")
+        else:
+            json.dump(instances, f)
+
+
+def batches(instances, size):
+    """
+    :return: (index of the first instance, instances) of each batch of size instances
+    """
+    batch = []
+    start = 0
+    for i, instance in enumerate(instances):
+        if not batch:
+            start = i
+        batch.append(instance)
+        if len(batch) == size:
+            yield start, batch
+            batch = []
+    if batch:
+        yield start, batch
+
+
+def split(queue, dataset, path, shard_size, shards_path, lease, max_attempts):
+    """
+    Split a dataset into shards of shard_size instances, in the format of the dataset, and add them to the queue.
+    The offset of each shard is the index its transformer builds the ids from: the index of its first instance,
+    or for EMM the index of its JSON in the directory of the dataset. The cost of each shard, which decides the
+    order the shards are claimed in, is the size of its input.
+    :return: the number of shards
+    """
+    if dataset == "rams":
+        sources = [(0, utilities.iterate_jsonlines(path))]
+    elif dataset == "emm" and os.path.isdir(path):
+        # each JSON is read when its shards are written, so a single one is held in memory at a time
+        sources = ((i, utilities.read_simple_json(os.path.join(path, file))) for i, file in enumerate(os.listdir(path)))
+    else:
+        sources = [(0, utilities.read_simple_json(path))]
+
+    shards = 0
+    for source, instances in sources:
+        for start, batch in batches(instances, shard_size):
+            name = dataset + "-" + str(shards).zfill(6)
+            input_path = os.path.join(shards_path, name + (".jsonlines" if dataset == "rams" else ".json"))
+            write_shard(batch, input_path, dataset == "rams")
+            offset = source if dataset == "emm" else start
+            queue.add(dataset, input_path, os.path.join(shards_path, name + ".out.jsonlines"), offset,
+                      os.path.getsize(input_path), lease, max_attempts)
+            shards += 1
+    return shards
+
+
+def append(part_path, out):
+    if os.path.exists(part_path):
+        with open(part_path, 'rb') as part:
+            shutil.copyfileobj(part, out)
+
+
+def merge(queue, output_path):
+    """
+    Concatenate the outputs of the shards in the order of the queue, once all of them are done.
+    The invalid instances of the shards are concatenated in the output path followed by .rejects
+    :return: whether the outputs were merged
+    """
+    shards = queue.shards()
+    unfinished = [shard for shard in shards if shard["status"] != "done"]
+    if unfinished:
+        for shard in unfinished:
+            log.error("Shard " + str(shard["id"]) + " of " + shard["dataset"] + " is " + shard["status"] +
+                      (": " + shard["error"] if shard["error"] else ""))
+        return False
+    rejects = [shard["output"] + ".rejects" for shard in shards if os.path.exists(shard["output"] + ".rejects")]
+    with open(output_path, 'wb') as out:
+        for shard in shards:
+            append(shard["output"], out)
+    if rejects:
+        with open(output_path + ".rejects", 'wb') as out:
+            for path in rejects:
+                append(path, out)
+    log.info("Merged " + str(sum(shard["instances"] for shard in shards)) + " instances of " + str(len(shards)) +
+             " shards in '" + output_path + "'")
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Split the datasets into shards for the workers of src.transform, "
+                                                 "and merge their outputs")
+    parser.add_argument('-queue', metavar='queue_path', type=str, help='Path to the SQLite database of the queue, on a filesystem shared by the workers', required=True)
+    parser.add_argument('-shards', metavar='shards_path', type=str, help='Directory to store the shards and their outputs, default value is the queue path followed by .shards')
+    parser.add_argument('-shardSize', metavar='N', type=int, default=1000, help='Number of instances per shard, default value is 1000')
+    parser.add_argument('-lease', metavar='seconds', type=float, default=600, help='Seconds a worker holds a shard without renewing its lease, after which the shard is given to another worker, default value is 600')
+    parser.add_argument('-maxAttempts', metavar='N', type=int, default=3, help='Number of times a shard is claimed before it is marked as failed, default value is 3')
+    parser.add_argument('-emm', metavar='emm_path', type=str, help='Path to the EMM dataset, can be a json file or a folder of jsons')
+    parser.add_argument('-rams', metavar='rams_path', type=str, help='Path to the RAMS dataset')
+    parser.add_argument('-m2e2', metavar='m2e2_path', type=str, help='Path to the M2E2 dataset')
+    parser.add_argument('-ace', metavar='ace_path', type=str, help='Path to the pre-processed ACE dataset')
+    parser.add_argument('-status', action='store_true', help='Print the number of shards per status')
+    parser.add_argument('-merge', metavar='output_path', type=str, help='Concatenate the outputs of the shards in the given path, once all of them are done')
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.queue)
+    # the datasets in the order of src.transform, which is the order of the merge
+    datasets = [(name, path) for name, path in (("rams", args.rams), ("emm", args.emm), ("m2e2", args.m2e2),
+                                                ("ace", args.ace)) if path]
+    failed = False
+    if datasets:
+        shards_path = args.shards if args.shards else args.queue + ".shards"
+        os.makedirs(shards_path, exist_ok=True)
+        queued = {shard["dataset"] for shard in queue.shards()}
+        for name, path in datasets:
+            if not os.path.exists(path):
+                log.error(name.upper() + " path '" + path + "' does not exist")
+                failed = True
+                continue
+            # the shards of a dataset are numbered from 0, adding it again would overwrite the files of its shards
+            # and transform its instances twice
+            if name in queued or any(file.startswith(name + "-") for file in os.listdir(shards_path)):
+                log.error("Shards of " + name.upper() + " already exist in the queue or in '" + shards_path +
+                          "', use a new queue and shards directory")
+                failed = True
+                continue
+            shards = split(queue, name, path, args.shardSize, shards_path, args.lease, args.maxAttempts)
+            log.info("Added " + str(shards) + " shards of " + name.upper() + " to the queue")
+
+    if args.status or not (datasets or args.merge):
+        for status, counts in queue.status().items():
+            log.info(status + ": " + str(counts["shards"]) + " shards, " + str(counts["instances"]) + " instances")
+
+    if args.merge and not merge(queue, args.merge):
+        log.error("Not all the shards are done, the outputs were not merged")
+        exit(1)
+    if failed:
+        exit(1)
+    print()
@@ -0,0 +1,264 @@
+from .conf.Constants import Keys
+from .validate import shard_ranges
+import argparse
+import logging
+import sys
+from tqdm import tqdm
+from functools import partial
+from multiprocessing import Pool
+import numpy as np
+import json
+import os
+import zlib
+
+log = logging.getLogger("DEDUPLICATOR")
+log.setLevel(logging.DEBUG)
+consoleOUT = logging.StreamHandler(sys.stdout)
+consoleOUT.setLevel(logging.DEBUG)
+formatter = logging.Formatter('\n%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+consoleOUT.setFormatter(formatter)
+consoleOUT.terminator = ""
+log.addHandler(consoleOUT)
+
+# the hashes of the permutations are computed modulo a Mersenne prime, so their products fit in 64 bits
+PRIME = (1 << 31) - 1
+
+
+def permutations(n_permutations, seed=1):
+    """
+    :return: the coefficients (a, b) of the n_permutations hash functions (a * x + b) mod PRIME
+    """
+    generator = np.random.RandomState(seed)
+    a = generator.randint(1, PRIME, n_permutations).astype(np.uint64)
+    b = generator.randint(0, PRIME, n_permutations).astype(np.uint64)
+    return a, b
+
+
+def shingles(words, size):
+    """
+    :return: the hashes of the shingles of size consecutive words, a text shorter than size is a single shingle
+    """
+    words = [word.lower() for word in words]
+    n_shingles = max(1, len(words) - size + 1)
+    return np.fromiter((zlib.crc32(' '.join(words[i:i + size]).encode('utf-8')) % PRIME for i in range(n_shingles)),
+                       dtype=np.uint64, count=n_shingles)
+
+
+def minhash(hashes, a, b):
+    """
+    :return: the MinHash signature of the hashes of the shingles, the minimum hash of each permutation
+    """
+    return ((np.outer(a, hashes) + b[:, None]) % PRIME).min(axis=1).astype(np.uint32)
+
+
+def signature_shard(path, start, end, shingle_size, a, b):
+    """
+    Compute the signatures of the lines that start inside [start, end) of a jsonlines file
+    :return: the ids and the origins of the instances, their signatures, and whether each instance has a signature;
+             instances without words, or that are not valid JSON, have none and are never duplicates
+    """
+    ids = []
+    origins = []
+    signatures = []
+    signed = []
+    with open(path, 'rb') as json_file:
+        if start > 0:
+            # the line containing start-1 belongs to the previous shard
+            json_file.seek(start - 1)
+            json_file.readline()
+        offset = json_file.tell()
+        while offset < end:
+            line = json_file.readline()
+            if not line:
+                break
+            if line.strip():
+                try:
+                    instance = json.loads(line)
+                except ValueError:
+                    instance = None
+                if not isinstance(instance, dict):
+                    instance = {}
+                words = instance.get(Keys.WORDS.value)
+                ids.append(instance.get(Keys.ID.value))
+                origins.append(instance.get(Keys.ORIGIN.value))
+                signed.append(bool(words))
+                signatures.append(minhash(shingles(words, shingle_size), a, b) if words
+                                  else np.zeros(len(a), dtype=np.uint32))
+            offset += len(line)
+    signatures = np.array(signatures, dtype=np.uint32).reshape(len(signatures), len(a))
+    return ids, origins, signatures, np.array(signed, dtype=bool)
+
+
+def signature_shard_range(path, shingle_size, a, b, shard):
+    return signature_shard(path, shard[0], shard[1], shingle_size, a, b)
+
+
+def sign_file(path, shingle_size=5, n_permutations=128, workers=1, seed=1):
+    """
+    Stream the lines of a jsonlines file and compute their MinHash signatures, using a pool of
+    processes over byte-range shards
+    :return: the ids and the origins of the instances, their signatures, and whether each instance has a signature,
+             in the order of the file
+    """
+    a, b = permutations(n_permutations, seed)
+    shards = shard_ranges(path, workers * 4)
+    sign = partial(signature_shard_range, path, shingle_size, a, b)
+    if workers > 1:
+        with Pool(workers) as pool:
+            results = list(tqdm(pool.imap(sign, shards), total=len(shards)))
+    else:
+        results = list(tqdm(map(sign, shards), total=len(shards)))
+    ids = [instance_id for result in results for instance_id in result[0]]
+    origins = [origin for result in results for origin in result[1]]
+    signatures = np.concatenate([result[2] for result in results]) if results \
+        else np.zeros((0, n_permutations), dtype=np.uint32)
+    signed = np.concatenate([result[3] for result in results]) if results else np.zeros(0, dtype=bool)
+    return ids, origins, signatures, signed
+
+
+class Clusters:
+    """
+    Union-find of the instances; the root of a cluster is its first instance in the file
+    """
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        i, j = self.find(i), self.find(j)
+        if i != j:
+            self.parent[max(i, j)] = min(i, j)
+
+    def roots(self):
+        return [self.find(i) for i in range(len(self.parent))]
+
+
+def cluster(signatures, signed, bands=16, threshold=0.8):
+    """
+    Find the clusters of near-duplicates with LSH: the signatures are split into bands, and instances whose
+    signatures are equal in a band fall in the same bucket. Each instance of a bucket is compared with the first
+    instance of the bucket and joins its cluster if the estimated Jaccard similarity of their shingles reaches
+    the threshold, so the comparisons are linear in the number of instances instead of quadratic.
+    :param signatures:  the signatures of the instances
+    :param signed:      whether each instance has a signature
+    :param bands:       number of bands, the signatures must split evenly into them
+    :param threshold:   minimum estimated Jaccard similarity of near-duplicates
+    :return: the index of the first instance of the cluster of each instance
+    """
+    clusters = Clusters(len(signatures))
+    candidates = np.flatnonzero(signed)
+    rows = signatures.shape[1] // bands
+    for band in tqdm(range(bands)):
+        # the rows of a band as a single value, so equal bands are found by sorting
+        keys = np.ascontiguousarray(signatures[candidates, band * rows:(band + 1) * rows])
+        keys = keys.view(np.dtype((np.void, keys.dtype.itemsize * rows))).ravel()
+        _, buckets = np.unique(keys, return_inverse=True)
+        order = np.argsort(buckets, kind='stable')
+        bounds = np.flatnonzero(np.diff(buckets[order])) + 1
+        for members in np.split(candidates[order], bounds):
+            if len(members) < 2:
+                continue
+            first = members[0]
+            similarity = (signatures[members[1:]] == signatures[first]).mean(axis=1)
+            for member in members[1:][similarity >= threshold]:
+                clusters.union(first, member)
+    return clusters.roots()
+
+
+def write_clusters(ids, origins, roots, path):
+    """
+    Store the cluster of each instance that has near-duplicates, identified by the id of its first instance
+    """
+    sizes = np.bincount(roots, minlength=len(roots))
+    with open(path, 'w') as f:
+        for i, root in enumerate(roots):
+            if sizes[root] > 1:
+                f.write(json.dumps({Keys.ID.value: ids[i], Keys.ORIGIN.value: origins[i], "cluster": ids[root]}) + "\n")
+
+
+def write_deduplicated(input_path, roots, path):
+    """
+    Copy the first instance of each cluster, in the order of the input
+    :return: the number of stored instances
+    """
+    stored = 0
+    i = 0
+    with open(input_path, 'rb') as input_file, open(path, 'wb') as f:
+        for line in input_file:
+            if not line.strip():
+                continue
+            if roots[i] == i:
+                f.write(line if line.endswith(b"\n") else line + b"\n")
+                stored += 1
+            i += 1
+    return stored
+
+
+def cross_origin(origins, roots):
+    """
+    :return: the number of clusters per combination of origins, for the clusters of more than one origin
+    """
+    cluster_origins = {}
+    for i, root in enumerate(roots):
+        cluster_origins.setdefault(root, set()).add(str(origins[i]))
+    counts = {}
+    for cluster_origin in cluster_origins.values():
+        if len(cluster_origin) > 1:
+            key = ", ".join(sorted(cluster_origin))
+            counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Find the near-duplicate instances of a jsonlines file of the common schema")
+    parser.add_argument('-input', metavar='input_path', type=str, help='Path to the jsonlines to deduplicate', required=True)
+    parser.add_argument('-out', metavar='out_path', type=str, help='Path to store the input without the near-duplicates, keeping the first instance of each cluster')
+    parser.add_argument('-clusters', metavar='clusters_path', type=str, help='Path to store the cluster of each instance that has near-duplicates')
+    parser.add_argument('-shingleSize', metavar='N', type=int, default=5, help='Number of consecutive words of a shingle, default value is 5')
+    parser.add_argument('-permutations', metavar='N', type=int, default=128, help='Number of hash functions of the MinHash signatures, default value is 128')
+    parser.add_argument('-bands', metavar='N', type=int, default=16, help='Number of LSH bands the signatures are split into, default value is 16')
+    parser.add_argument('-threshold', metavar='similarity', type=float, default=0.8, help='Minimum estimated Jaccard similarity of the shingles of near-duplicates, default value is 0.8')
+    parser.add_argument('-seed', type=int, default=1, help='Seed of the hash functions, default value is 1')
+    parser.add_argument('-workers', type=int, default=os.cpu_count(), help='Number of processes computing the signatures, default value is the number of CPUs')
+
+    args = parser.parse_args()
+    if not os.path.exists(args.input):
+        log.error("Path '" + args.input + "' does not exist")
+        exit(1)
+    if args.bands < 1 or args.permutations % args.bands != 0:
+        log.error("The " + str(args.permutations) + " permutations cannot be split into " + str(args.bands) + " bands")
+        exit(1)
+    for path in (args.out, args.clusters):
+        if path and not os.path.exists(os.path.dirname(os.path.abspath(path))):
+            log.error("Path '" + path + "' does not exist")
+            exit(1)
+
+    log.info("Computing the MinHash signatures of '" + args.input + "'")
+    ids, origins, signatures, signed = sign_file(args.input, args.shingleSize, args.permutations,
+                                                 max(1, args.workers), args.seed)
+    log.info("Finding the near-duplicates of " + str(len(ids)) + " instances")
+    roots = cluster(signatures, signed, args.bands, args.threshold)
+
+    sizes = np.bincount(roots, minlength=len(roots))
+    log.info("Found " + str(int((sizes > 1).sum())) + " clusters of near-duplicates with " +
+             str(int(sizes[sizes > 1].sum())) + " instances, " + str(len(roots) - int((sizes > 0).sum())) +
+             " instances are near-duplicates of a previous one")
+    for key, count in sorted(cross_origin(origins, roots).items()):
+        log.warning(str(count) + " clusters span " + key)
+    if (~signed).any():
+        log.warning(str(int((~signed).sum())) + " instances have no words and were not compared")
+
+    if args.clusters:
+        write_clusters(ids, origins, roots, args.clusters)
+        log.info("Clusters were stored in '" + args.clusters + "'")
+    if args.out:
+        stored = write_deduplicated(args.input, roots, args.out)
+        log.info(str(stored) + " instances were stored in '" + args.out + "'")
+    print()
@@ -1,4 +1,7 @@
 from .utils import utilities
+from .utils.interval_index import IntervalIndex
+from .utils import bootstrap
+from .task_evaluators.adapters import adapters, join, EeqaAdapter
 from .conf.Constants import Keys
 from .conf.Configuration import events
 import argparse
@@ -6,10 +9,12 @@ import logging
 import sys
 from tqdm import tqdm
 import json
+import csv
 import os
-from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay
-from matplotlib import pyplot as plt
-from sklearn.metrics import accuracy_score
+from functools import partial
+from multiprocessing import Pool
+from array import array
+import numpy as np
 
 log = logging.getLogger("EVALUATOR")
 log.setLevel(logging.DEBUG)
@@ -28,8 +33,148 @@ consoleER.terminator = ""
 log_root.addHandler(consoleER)
 
 
-class Evaluator:
+# counters kept for every instance, all the scores are computed from them
+COUNTERS = ['event_types_tp', 'trigger_tp', 'total_predicted_events', 'total_gold_events',
+            'trigger_exact_tp', 'trigger_overlap_tp', 'trigger_classification_tp',
+            'argument_identification_tp', 'argument_classification_tp',
+            'total_predicted_arguments', 'total_gold_arguments']
+
+# metric name -> (true positives, predicted, gold) counters
+METRICS = {
+    "Event Classification": ('event_types_tp', 'total_predicted_events', 'total_gold_events'),
+    "Trigger Identification": ('trigger_tp', 'total_predicted_events', 'total_gold_events'),
+    "Trigger Identification (exact)": ('trigger_exact_tp', 'total_predicted_events', 'total_gold_events'),
+    "Trigger Identification (overlap)": ('trigger_overlap_tp', 'total_predicted_events', 'total_gold_events'),
+    "Trigger Classification": ('trigger_classification_tp', 'total_predicted_events', 'total_gold_events'),
+    "Argument Identification": ('argument_identification_tp', 'total_predicted_arguments', 'total_gold_arguments'),
+    "Argument Classification": ('argument_classification_tp', 'total_predicted_arguments', 'total_gold_arguments')
+}
+OFFSET_METRICS = ["Trigger Identification (exact)", "Trigger Identification (overlap)", "Trigger Classification",
+                  "Argument Identification", "Argument Classification"]
+
+# extensions of the stored confusion matrix, and of the images -cmPath plots instead of storing it
+CM_FORMATS = (".npz", ".csv")
+CM_IMAGE_FORMATS = (".png", ".jpg", ".jpeg", ".pdf", ".svg")
+
+
+class InstanceCounts:
+    """
+    Counters of a single instance, both overall and per event type
+    """
     def __init__(self):
+        self.total = dict.fromkeys(COUNTERS, 0)
+        self.by_type = {}
+
+    def add(self, counter, event_type, value=1):
+        self.total[counter] += value
+        if event_type not in self.by_type:
+            self.by_type[event_type] = dict.fromkeys(COUNTERS, 0)
+        self.by_type[event_type][counter] += value
+
+
+def prf(tp, predicted, gold):
+    precision = 100.0 * tp / predicted if predicted > 0 else 0
+    recall = 100.0 * tp / gold if gold > 0 else 0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0
+    return precision, recall, f1
+
+
+def score_instance(events_gt, events_pred, offsets=False):
+    """
+    Score the predicted events of an instance against its golden events. It depends only on
+    its input, so instances can be scored in parallel and accumulated by an Evaluator.
+    :param events_gt:   golden events of the instance
+    :param events_pred: predicted events of the instance, in the common schema
+    :param offsets:     also score triggers and arguments by their offsets
+    :return: the InstanceCounts, and the golden and predicted event types of the instance
+    """
+    counts = InstanceCounts()
+
+    # from type to trigger and number of occurrences
+    golden_events = {}
+
+    # list containing predictions/golden event types of the current instance
+    gold = []
+    predictions = []
+    for event in events_gt:
+        event_type = event[Keys.EVENT_TYPE.value]
+        if event_type in golden_events.keys():
+            golden_events[event_type][Keys.TRIGGER.value].append(event[Keys.TRIGGER.value][Keys.TEXT.value])
+            golden_events[event_type][Keys.COUNTER.value] += 1
+        else:
+            golden_events[event_type] = {
+                Keys.TRIGGER.value: [event[Keys.TRIGGER.value][Keys.TEXT.value]],
+                Keys.COUNTER.value: 1
+            }
+        gold.append(event_type)
+        counts.add('total_gold_events', event_type)
+
+    for event in events_pred:
+        event_type = event[Keys.EVENT_TYPE.value]
+        counts.add('total_predicted_events', event_type)
+        if event_type in golden_events.keys():
+            if golden_events[event_type][Keys.COUNTER.value] > 0:
+                counts.add('event_types_tp', event_type)
+                golden_events[event_type][Keys.COUNTER.value] -= 1
+
+            predicted_trigger = event[Keys.TRIGGER.value][Keys.TEXT.value]
+            for trigger in golden_events[event_type][Keys.TRIGGER.value]:
+                if utilities.string_similarity(predicted_trigger, trigger) > 0.8:
+                    counts.add('trigger_tp', event_type)
+        predictions.append(event_type)
+
+    if offsets:
+        score_offsets(events_gt, events_pred, counts)
+    return counts, gold, predictions
+
+
+def score_offsets(events_gt, events_pred, counts):
+    """
+    Score triggers and arguments using their start/end offsets instead of their text.
+    The gold spans of the instance are indexed once, and every gold span can be matched
+    by a single prediction, so repeated words are not counted multiple times.
+    :param events_gt:   golden events of the instance
+    :param events_pred: predicted events of the instance
+    :param counts:      InstanceCounts of the instance to update
+    :return: None
+    """
+    triggers = IntervalIndex([(event[Keys.TRIGGER.value][Keys.START.value],
+                               event[Keys.TRIGGER.value][Keys.END.value],
+                               event[Keys.EVENT_TYPE.value])
+                              for event in events_gt])
+    arguments = IntervalIndex([(arg[Keys.START.value], arg[Keys.END.value],
+                                (event[Keys.EVENT_TYPE.value], arg[Keys.ROLE.value]))
+                               for event in events_gt for arg in event[Keys.ARGUMENTS.value]])
+    for event in events_gt:
+        counts.add('total_gold_arguments', event[Keys.EVENT_TYPE.value], len(event[Keys.ARGUMENTS.value]))
+
+    exact_used, overlap_used, classification_used = set(), set(), set()
+    argument_identification_used, argument_classification_used = set(), set()
+    for event in events_pred:
+        event_type = event[Keys.EVENT_TYPE.value]
+        start = event[Keys.TRIGGER.value][Keys.START.value]
+        end = event[Keys.TRIGGER.value][Keys.END.value]
+        if triggers.match(start, end, exact_used) is not None:
+            counts.add('trigger_exact_tp', event_type)
+        if triggers.match(start, end, overlap_used, overlap=True) is not None:
+            counts.add('trigger_overlap_tp', event_type)
+        if triggers.match(start, end, classification_used, accept=lambda t: t == event_type) is not None:
+            counts.add('trigger_classification_tp', event_type)
+
+        predicted_arguments = event.get(Keys.ARGUMENTS.value, [])
+        counts.add('total_predicted_arguments', event_type, len(predicted_arguments))
+        for arg in predicted_arguments:
+            role = arg[Keys.ROLE.value]
+            if arguments.match(arg[Keys.START.value], arg[Keys.END.value], argument_identification_used,
+                               accept=lambda p: p[0] == event_type) is not None:
+                counts.add('argument_identification_tp', event_type)
+            if arguments.match(arg[Keys.START.value], arg[Keys.END.value], argument_classification_used,
+                               accept=lambda p: p == (event_type, role)) is not None:
+                counts.add('argument_classification_tp', event_type)
+
+
+class Evaluator:
+    def __init__(self, offsets=False):
         self.trigger_tp = 0
         self.event_types_tp = 0
         self.total_gold_events = 0
@@ -37,46 +182,139 @@ class Evaluator:
         self.gold_dict = {}
         self.predictions_dict = {}
 
+        # offset-based scoring
+        self.offsets = offsets
+        self.trigger_exact_tp = 0
+        self.trigger_overlap_tp = 0
+        self.trigger_classification_tp = 0
+        self.argument_identification_tp = 0
+        self.argument_classification_tp = 0
+        self.total_gold_arguments = 0
+        self.total_predicted_arguments = 0
+
+        # per-instance counters, stored as compact int64 buffers
+        self.instance_counts = {counter: array('q') for counter in COUNTERS}
+
+        # integer-coded groups: the origin of each instance, and the event type of each (instance, type) row
+        self.origins = {}
+        self.instance_origins = array('q')
+        self.event_types = {}
+        self.type_codes = array('q')
+        self.type_counts = {counter: array('q') for counter in COUNTERS}
+
     def evaluate(self, gt, pred):
-        events_gt = gt[Keys.EVENTS_MENTIONED.value]
-        self.total_gold_events += len(events_gt)
-
-        # from type to trigger and number of occurrences
-        golden_events = {}
-
-        # list containing predictions/golden event types of the current instance
-        gold = []
-        predictions = []
-        for event in events_gt:
-            event_type = event[Keys.EVENT_TYPE.value]
-            if event_type in golden_events.keys():
-                golden_events[event_type][Keys.TRIGGER.value].append(event[Keys.TRIGGER.value][Keys.TEXT.value])
-                golden_events[event_type][Keys.COUNTER.value] += 1
+        """
+        :param gt:      ground truth instance
+        :param pred:    predicted instance in the common schema
+        :return: None
+        """
+        self.evaluate_events(gt, pred[Keys.EVENTS_MENTIONED.value])
+
+    def evaluate_events(self, gt, events_pred):
+        """
+        :param gt:          ground truth instance
+        :param events_pred: predicted events in the common schema
+        :return: None
+        """
+        self.add_instance(gt[Keys.ID.value], gt.get(Keys.ORIGIN.value, "UNKNOWN"),
+                          score_instance(gt[Keys.EVENTS_MENTIONED.value], events_pred, self.offsets))
+
+    def add_instance(self, instance_id, origin, scores):
+        """
+        Store the scores of an instance
+        :param instance_id: id of the ground truth instance
+        :param origin:      origin of the ground truth instance
+        :param scores:      the result of score_instance
+        :return: None
+        """
+        counts, gold, predictions = scores
+        self.add_counts(counts, origin)
+        self.gold_dict[instance_id] = gold
+        self.predictions_dict[instance_id] = predictions
+
+    def add_counts(self, counts, origin):
+        """
+        Accumulate the counters of an instance to the totals, to the per-instance vectors
+        and to the integer-coded group rows
+        :param counts:  InstanceCounts of the instance
+        :param origin:  origin of the instance
+        :return: None
+        """
+        for counter, value in counts.total.items():
+            setattr(self, counter, getattr(self, counter) + value)
+            self.instance_counts[counter].append(value)
+        self.instance_origins.append(self.origins.setdefault(origin, len(self.origins)))
+
+        for event_type, type_counts in counts.by_type.items():
+            self.type_codes.append(self.event_types.setdefault(event_type, len(self.event_types)))
+            for counter, value in type_counts.items():
+                self.type_counts[counter].append(value)
+
+    def get_count_vectors(self, metric):
+        """
+        :param metric:  name of the metric, a key of METRICS
+        :return: the per-instance (true positives, predicted, gold) vectors of the metric
+        """
+        return tuple(np.frombuffer(self.instance_counts[counter], dtype=np.int64) for counter in METRICS[metric])
+
+    def get_confidence_intervals(self, metrics, n_resamples=1000, confidence=0.95, seed=None):
+        """
+        Bootstrap confidence intervals of the precision, recall and F1 of each metric
+        :return: a dictionary from metric to its intervals
+        """
+        return {metric: bootstrap.confidence_interval(*self.get_count_vectors(metric), n_resamples=n_resamples,
+                                                      confidence=confidence, seed=seed)
+                for metric in metrics}
+
+    def compare(self, other, metrics, n_resamples=1000, confidence=0.95, seed=None):
+        """
+        Paired bootstrap significance of the F1 difference between another evaluator and this one.
+        Both must have evaluated the same ground truth in the same order.
+        :return: a dictionary from metric to the results of the test
+        """
+        return {metric: bootstrap.paired_test(self.get_count_vectors(metric), other.get_count_vectors(metric),
+                                              n_resamples=n_resamples, confidence=confidence, seed=seed)
+                for metric in metrics}
+
+    def get_breakdown(self, metrics):
+        """
+        Per-origin and per-event-type scores, computed from the integer-coded group rows
+        accumulated during evaluation, without a second pass over the data.
+        :param metrics: list of metric names, keys of METRICS
+        :return: a list of rows, one per group and metric
+        """
+        rows = []
+        groupings = [("origin", self.origins, self.instance_origins, self.instance_counts),
+                     ("event-type", self.event_types, self.type_codes, self.type_counts)]
+        for grouping, labels, codes, columns in groupings:
+            codes = np.frombuffer(codes, dtype=np.int64)
+            totals = {counter: np.bincount(codes, weights=np.frombuffer(columns[counter], dtype=np.int64),
+                                           minlength=len(labels)).astype(np.int64)
+                      for counter in COUNTERS}
+            for label, code in sorted(labels.items()):
+                for metric in metrics:
+                    tp, predicted, gold = [int(totals[counter][code]) for counter in METRICS[metric]]
+                    precision, recall, f1 = prf(tp, predicted, gold)
+                    rows.append({"group": grouping, "value": label, "metric": metric, "tp": tp,
+                                 "predicted": predicted, "gold": gold, "precision": precision,
+                                 "recall": recall, "f1": f1})
+        return rows
+
+    def export_breakdown(self, metrics, path):
+        """
+        Store the per-origin and per-event-type scores as CSV, or as JSON if the path ends with .json
+        :param metrics: list of metric names
+        :param path:    output path
+        :return: None
+        """
+        rows = self.get_breakdown(metrics)
+        with open(path, 'w') as breakdown_file:
+            if path.endswith(".json"):
+                json.dump(rows, breakdown_file, indent=4)
             else:
-                golden_events[event_type] = {
-                    Keys.TRIGGER.value: [event[Keys.TRIGGER.value][Keys.TEXT.value]],
-                    Keys.COUNTER.value: 1
-                }
-            gold.append(event_type)
-
-        events_pred = pred[Keys.EVENTS_MENTIONED.value]
-        self.total_predicted_events += len(events_pred)
-        for event in events_pred:
-            event_type = event[Keys.EVENT_TYPE.value]
-            if event_type in golden_events.keys():
-                if golden_events[event_type][Keys.COUNTER.value] > 0:
-                    self.event_types_tp += 1
-                    golden_events[event_type][Keys.COUNTER.value] -= 1
-
-                predicted_trigger = event[Keys.TRIGGER.value][Keys.TEXT.value]
-                for trigger in golden_events[event_type][Keys.TRIGGER.value]:
-                    if utilities.string_similarity(predicted_trigger, trigger) > 0.8:
-                        self.trigger_tp += 1
-            predictions.append(event_type)
-
-        # store the results of this instance
-        self.gold_dict[gt[Keys.ID.value]] = gold
-        self.predictions_dict[gt[Keys.ID.value]] = predictions
+                writer = csv.DictWriter(breakdown_file, fieldnames=list(rows[0].keys()) if rows else ["group"])
+                writer.writeheader()
+                writer.writerows(rows)
 
     def get_ordered_results(self):
         final_gold = []
@@ -104,37 +342,129 @@ class Evaluator:
 
 
     def get_classification_score(self):
-        precision = 100.0 * self.event_types_tp / self.total_predicted_events if self.total_predicted_events > 0 else 0
-        recall = 100.0 * self.event_types_tp / self.total_gold_events if self.total_gold_events > 0 else 0
-        f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0
+        precision, recall, f1 = prf(self.event_types_tp, self.total_predicted_events, self.total_gold_events)
 
         final_gold, final_predictions = self.get_ordered_results()
         assert(len(final_gold) == len(final_predictions))
-        acc = 100.0 * accuracy_score(final_gold, final_predictions)
+        correct = sum(g == p for g, p in zip(final_gold, final_predictions))
+        acc = 100.0 * correct / len(final_gold) if len(final_gold) > 0 else 0
         return precision, recall, f1, acc
 
     def get_identification_score(self):
-        precision = 100.0 * self.trigger_tp / self.total_predicted_events if self.total_predicted_events > 0 else 0
-        recall = 100.0 * self.trigger_tp / self.total_gold_events if self.total_gold_events > 0 else 0
-        f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0
-        return precision, recall, f1
+        return prf(self.trigger_tp, self.total_predicted_events, self.total_gold_events)
 
-    def get_confusion_matrix(self, cmPath=None):
-        fig, ax = plt.subplots(1, 1, figsize=(25, 25))
+    def get_score(self, metric):
+        return prf(*[getattr(self, counter) for counter in METRICS[metric]])
+
+    def get_offset_scores(self):
+        """
+        :return: a dictionary from the name of each offset-based metric to its precision, recall and F1
+        """
+        return {metric: self.get_score(metric) for metric in OFFSET_METRICS}
+
+    def get_confusion_matrix(self, labels=None):
+        """
+        Confusion matrix of the event types, rows are the golden types and columns the predicted ones.
+        Pairs with a type that is not in the labels are ignored.
+        :param labels:  the event types to include, by default all the event types sorted
+        :return: a len(labels) x len(labels) matrix
+        """
+        labels = sorted(events) if labels is None else labels
         final_gold, final_predictions = self.get_ordered_results()
         assert(len(final_gold) == len(final_predictions))
-        cfm = confusion_matrix(final_gold, final_predictions, labels=events)
-        ConfusionMatrixDisplay(cfm, display_labels=events).plot(values_format='d', ax=ax)
+        indices = {label: i for i, label in enumerate(labels)}
+        cfm = np.zeros((len(labels), len(labels)), dtype=np.int64)
+        for gold, prediction in zip(final_gold, final_predictions):
+            if gold in indices and prediction in indices:
+                cfm[indices[gold], indices[prediction]] += 1
+        return cfm
+
+    def export_confusion_matrix(self, cmPath, labels=None):
+        """
+        Store the confusion matrix and its labels as .npz or as CSV, depending on the extension
+        :param cmPath:  output path, ending with .npz or .csv
+        :param labels:  the event types to include
+        :return: None
+        :raise ValueError: if the extension is neither .npz nor .csv
+        """
+        extension = os.path.splitext(cmPath)[1].lower()
+        if extension not in CM_FORMATS:
+            raise ValueError("The confusion matrix can be stored as " + " or ".join(CM_FORMATS) + ", not '" + cmPath + "'")
+        labels = sorted(events) if labels is None else labels
+        cfm = self.get_confusion_matrix(labels)
+        if extension == ".npz":
+            np.savez_compressed(cmPath, confusion_matrix=cfm, labels=np.array(labels))
+        else:
+            with open(cmPath, 'w') as cm_file:
+                writer = csv.writer(cm_file)
+                writer.writerow(["gold/predicted"] + list(labels))
+                for label, row in zip(labels, cfm):
+                    writer.writerow([label] + row.tolist())
+
+    def plot_confusion_matrix(self, plotPath, labels=None):
+        """
+        Plot the confusion matrix into an image. Plotting libraries are imported only here and use
+        a non-interactive backend, so evaluation does not need them or a display.
+        :param plotPath:    path of the image
+        :param labels:      the event types to include
+        :return: None
+        """
+        import matplotlib
+        matplotlib.use('Agg')
+        from matplotlib import pyplot as plt
+        from sklearn.metrics import ConfusionMatrixDisplay
+
+        labels = sorted(events) if labels is None else labels
+        fig, ax = plt.subplots(1, 1, figsize=(25, 25))
+        ConfusionMatrixDisplay(self.get_confusion_matrix(labels), display_labels=labels).plot(values_format='d', ax=ax)
         ax.set_title('Confusion Matrix')
-        fig.show()
-        if cmPath:
-            fig.savefig(cmPath)
+        fig.savefig(plotPath)
+        plt.close(fig)
 
-if __name__ == '__main__':
+
+def score_job(adapter, offsets, job):
+    instance_id, origin, events_gt, lines = job
+    return instance_id, origin, score_instance(events_gt, adapter.convert_lines(lines), offsets)
+
+
+def evaluate_predictions(evaluator, adapter, ground_truth_path, workers=1):
+    """
+    Stream the ground truth and the predictions, and accumulate their scores into the evaluator.
+    Predictions are converted and scored by a pool of processes if workers > 1; the results are
+    accumulated in the order of the ground truth.
+    :param evaluator:           the Evaluator
+    :param adapter:             the PredictionAdapter of the predictions
+    :param ground_truth_path:   path to the ground truth jsonlines
+    :param workers:             number of processes
+    :return: None
+    """
+    jobs = ((gt[Keys.ID.value], gt.get(Keys.ORIGIN.value, "UNKNOWN"), gt[Keys.EVENTS_MENTIONED.value], lines)
+            for gt, lines in join(adapter, ground_truth_path))
+    score = partial(score_job, adapter, evaluator.offsets)
+    if workers > 1:
+        with Pool(workers) as pool:
+            for instance_id, origin, scores in tqdm(pool.imap(score, jobs, chunksize=256)):
+                evaluator.add_instance(instance_id, origin, scores)
+    else:
+        for instance_id, origin, scores in tqdm(map(score, jobs)):
+            evaluator.add_instance(instance_id, origin, scores)
+
+
+def main(default_format="common"):
     parser = argparse.ArgumentParser(description="Give arguments")
-    parser.add_argument('-predictions', metavar='--predictions', type=str, help='Path to the json containing the predictions', required=True)
+    parser.add_argument('-predictions', metavar='--predictions', type=str, help='Path to the json, or directory of jsons, containing the predictions', required=True)
     parser.add_argument('-groundTruth', metavar='--groundTruth', type=str, help='Path to the json containing the ground truth', required=True)
-    parser.add_argument('-cmPath', type=str, help='Path to save CM')
+    parser.add_argument('-cmPath', type=str, help='Path to save CM, as .npz or .csv, or plotted if it is an image')
+    parser.add_argument('-cmPlot', type=str, help='Path to save a plot of the CM, requires matplotlib and scikit-learn')
+    parser.add_argument('-offsets', action='store_true', help='Also score triggers and arguments by their offsets')
+    parser.add_argument('-bootstrap', metavar='resamples', type=int, default=0, help='Number of bootstrap resamples for the confidence intervals, disabled by default')
+    parser.add_argument('-confidence', type=float, default=0.95, help='Confidence level of the intervals, default value is 0.95')
+    parser.add_argument('-seed', type=int, help='Seed of the bootstrap resampling')
+    parser.add_argument('-breakdown', metavar='breakdown_path', type=str, help='Path to store the per-origin and per-event-type scores, as CSV or JSON')
+    parser.add_argument('-format', type=str, default=default_format, choices=list(adapters.keys()), help='Format of the predictions, default value is ' + default_format)
+    parser.add_argument('-maxWords', type=int, default=500, help='eeqa format: evaluate only the ground truth instances with less words, default value is 500, 0 to disable')
+    parser.add_argument('-workers', type=int, default=1, help='Number of processes that score the instances, default value is 1')
+    parser.add_argument('-compareWith', metavar='baseline_path', type=str, help='Path to the json containing the predictions of a baseline, to test the significance of the differences')
 
     args = parser.parse_args()
 
@@ -146,17 +476,36 @@ if __name__ == '__main__':
         log.error("Ground truth file '" + args.groundTruth + "' does not exist")
         exit(1)
 
-    if args.cmPath:
-        if not os.path.exists(os.path.dirname(args.cmPath)):
-            log.error("CM path '" + args.groundTruth + "' does not exist")
+    for path in [args.cmPath, args.cmPlot]:
+        if path and not os.path.exists(os.path.dirname(os.path.abspath(path))):
+            log.error("CM path '" + path + "' does not exist")
             exit(1)
 
-    evaluator = Evaluator()
-    with open(args.predictions) as predictions_jsonfile,  open(args.groundTruth) as groundTruth_jsonfile:
-        for prediction_json, groundTruth_json in tqdm(zip(predictions_jsonfile, groundTruth_jsonfile)):
-            prediction = json.loads(prediction_json)
-            groundTruth = json.loads(groundTruth_json)
-            evaluator.evaluate(groundTruth, prediction)
+    # an image path used to store the plot of the CM, so it is still plotted
+    cm_plot = args.cmPath and os.path.splitext(args.cmPath)[1].lower() in CM_IMAGE_FORMATS
+    if args.cmPath and not cm_plot and os.path.splitext(args.cmPath)[1].lower() not in CM_FORMATS:
+        log.error("CM path '" + args.cmPath + "' must end with " + ", ".join(CM_FORMATS + CM_IMAGE_FORMATS))
+        exit(1)
+
+    if args.breakdown and not os.path.exists(os.path.dirname(os.path.abspath(args.breakdown))):
+        log.error("Breakdown path '" + args.breakdown + "' does not exist")
+        exit(1)
+
+    if args.compareWith and not os.path.exists(args.compareWith):
+        log.error("Baseline file '" + args.compareWith + "' does not exist")
+        exit(1)
+
+    def get_adapter(path):
+        if args.format == "eeqa":
+            return EeqaAdapter(path, args.maxWords if args.maxWords > 0 else None)
+        return adapters[args.format](path)
+
+    evaluator = Evaluator(args.offsets)
+    evaluate_predictions(evaluator, get_adapter(args.predictions), args.groundTruth, args.workers)
+    baseline = None
+    if args.compareWith:
+        baseline = Evaluator(args.offsets)
+        evaluate_predictions(baseline, get_adapter(args.compareWith), args.groundTruth, args.workers)
 
     precision, recall, f1, acc = evaluator.get_classification_score()
     log.info("Event Classification")
@@ -172,7 +521,51 @@ if __name__ == '__main__':
     log.info("RECALL:\t" + str(recall))
     log.info("F1-SCORE:\t" + str(f1))
 
-    evaluator.get_confusion_matrix(args.cmPath)
+    if args.offsets:
+        for metric, (precision, recall, f1) in evaluator.get_offset_scores().items():
+            print()
+            log.info(metric)
+            log.info("PRECISION:\t" + str(precision))
+            log.info("RECALL:\t" + str(recall))
+            log.info("F1-SCORE:\t" + str(f1))
     print()
 
+    metrics = ["Event Classification", "Trigger Identification"] + (OFFSET_METRICS if args.offsets else [])
+    if args.bootstrap > 0:
+        log.info("Bootstrap " + str(100 * args.confidence) + "% confidence intervals over " + str(args.bootstrap) + " resamples")
+        intervals = evaluator.get_confidence_intervals(metrics, args.bootstrap, args.confidence, args.seed)
+        for metric, interval in intervals.items():
+            log.info(metric)
+            for name, (low, high) in interval.items():
+                log.info(name.upper() + ":\t[" + str(round(low, 3)) + ", " + str(round(high, 3)) + "]")
+        print()
+
+    if args.breakdown:
+        evaluator.export_breakdown(metrics, args.breakdown)
+        log.info("Per-origin and per-event-type scores were stored in '" + args.breakdown + "'")
+        print()
 
+    if baseline:
+        log.info("Paired bootstrap against '" + args.compareWith + "' over " + str(max(args.bootstrap, 1000)) + " resamples")
+        results = baseline.compare(evaluator, metrics, max(args.bootstrap, 1000), args.confidence, args.seed)
+        for metric, result in results.items():
+            low, high = result["interval"]
+            log.info(metric + "\tF1 DIFFERENCE: " + str(round(result["delta"], 3)) +
+                     "\tCI: [" + str(round(low, 3)) + ", " + str(round(high, 3)) + "]" +
+                     "\tP-VALUE: " + str(result["p-value"]))
+        print()
+
+    if cm_plot:
+        evaluator.plot_confusion_matrix(args.cmPath)
+        log.info("Confusion Matrix plot was stored in '" + args.cmPath + "'")
+    elif args.cmPath:
+        evaluator.export_confusion_matrix(args.cmPath)
+        log.info("Confusion Matrix was stored in '" + args.cmPath + "'")
+    if args.cmPlot:
+        evaluator.plot_confusion_matrix(args.cmPlot)
+        log.info("Confusion Matrix plot was stored in '" + args.cmPlot + "'")
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+from ..conf.Constants import Keys
+from ..utils import utilities
+import json
+import os
+
+# how the predictions are matched to the ground truth
+POSITIONAL = "positional"
+KEYED = "keyed"
+
+
+class PredictionAdapter:
+    """
+    Streams the predictions of a model and converts them into the events of the common schema,
+    so every prediction format is evaluated by the same Evaluator.
+    Predictions are matched to the ground truth either by their position, or by a key. Keyed predictions
+    are indexed by their byte offsets, so only the keys are kept in memory.
+    """
+    join = POSITIONAL
+
+    def __init__(self, path):
+        self.path = path
+
+    def files(self):
+        if os.path.isdir(self.path):
+            return [os.path.join(self.path, file) for file in sorted(os.listdir(self.path))]
+        return [self.path]
+
+    def read_lines(self):
+        """
+        :return: a generator of the raw predictions. JSON lists are loaded and re-serialized item by item
+        """
+        for file in self.files():
+            with open(file) as json_file:
+                head = json_file.read(1)
+                while head.isspace():
+                    head = json_file.read(1)
+                json_file.seek(0)
+                if head == "[":
+                    for prediction in json.load(json_file):
+                        yield json.dumps(prediction)
+                    continue
+                for line in json_file:
+                    if line.strip():
+                        yield line
+
+    def build_index(self):
+        """
+        :return: a dictionary from each key to the (file, byte offset) of its predictions
+        """
+        index = {}
+        for file in self.files():
+            with open(file, 'rb') as json_file:
+                offset = 0
+                for line in json_file:
+                    if line.strip():
+                        index.setdefault(self.key(json.loads(line)), []).append((file, offset))
+                    offset += len(line)
+        return index
+
+    def accept_gold(self, gt):
+        """
+        :return: whether the ground truth instance is evaluated by this format
+        """
+        return True
+
+    def key(self, pred):
+        raise NotImplementedError
+
+    def gold_key(self, gt):
+        raise NotImplementedError
+
+    def convert(self, pred):
+        """
+        :param pred:    a prediction of the model
+        :return:        its events in the common schema
+        """
+        raise NotImplementedError
+
+    def convert_lines(self, lines):
+        return [event for line in lines for event in self.convert(json.loads(line))]
+
+
+class CommonSchemaAdapter(PredictionAdapter):
+    """
+    Predictions that follow the common schema, in the same order as the ground truth
+    """
+
+    def convert(self, pred):
+        return pred[Keys.EVENTS_MENTIONED.value]
+
+
+class EeqaAdapter(PredictionAdapter):
+    """
+    Predictions of EEQA: 'event' is a list of events, each one a list starting with [trigger index, event type]
+    followed by the [start, end, role] of its arguments, with inclusive token indices.
+    Predictions are in the same order as the ground truth instances that have less than max_words words.
+    """
+
+    def __init__(self, path, max_words=500):
+        super().__init__(path)
+        self.max_words = max_words
+
+    def accept_gold(self, gt):
+        return self.max_words is None or len(gt[Keys.WORDS.value]) < self.max_words
+
+    def convert(self, pred):
+        sentence = pred['sentence']
+        events = []
+        for event in pred['event']:
+            trigger_index, event_type = event[0][0], event[0][1]
+            arguments = [{Keys.START.value: arg[0],
+                          Keys.END.value: arg[1] + 1,
+                          Keys.TEXT.value: ' '.join(sentence[arg[0]: arg[1] + 1]),
+                          Keys.ROLE.value: arg[2]}
+                         for arg in event[1:]]
+            events.append({Keys.EVENT_TYPE.value: event_type,
+                           Keys.TRIGGER.value: {Keys.START.value: trigger_index,
+                                                Keys.END.value: trigger_index + 1,
+                                                Keys.TEXT.value: sentence[trigger_index]},
+                           Keys.ARGUMENTS.value: arguments})
+        return events
+
+
+class StudentAAdapter(PredictionAdapter):
+    """
+    Predictions keyed by 'doc_id', with a 'graph' of 'triggers' as [start, end, event type] and optionally
+    'entities' and 'roles' as [trigger index, entity index, role]. The predictions of a document
+    may be split into multiple lines and files.
+    """
+    join = KEYED
+
+    def key(self, pred):
+        return pred['doc_id']
+
+    def gold_key(self, gt):
+        return gt[Keys.ID.value].replace("/", "") + ".json"
+
+    def convert(self, pred):
+        tokens = pred['tokens']
+        graph = pred['graph']
+        entities = graph.get('entities', [])
+        events = []
+        for i, trigger in enumerate(graph['triggers']):
+            arguments = [{Keys.START.value: entities[role[1]][0],
+                          Keys.END.value: entities[role[1]][1],
+                          Keys.TEXT.value: ' '.join(tokens[entities[role[1]][0]: entities[role[1]][1]]),
+                          Keys.ROLE.value: role[2].lower()}
+                         for role in graph.get('roles', []) if role[0] == i]
+            events.append({Keys.EVENT_TYPE.value: trigger[2].replace(":", ".").upper(),
+                           Keys.TRIGGER.value: {Keys.START.value: trigger[0],
+                                                Keys.END.value: trigger[1],
+                                                Keys.TEXT.value: ' '.join(tokens[trigger[0]:trigger[1]])},
+                           Keys.ARGUMENTS.value: arguments})
+        return events
+
+
+adapters = {
+    "common": CommonSchemaAdapter,
+    "eeqa": EeqaAdapter,
+    "studentA": StudentAAdapter
+}
+
+
+def join(adapter, ground_truth_path):
+    """
+    Stream the ground truth and match each instance to its raw predictions.
+    :param adapter:             the PredictionAdapter of the predictions
+    :param ground_truth_path:   path to the ground truth jsonlines
+    :return: a generator of (ground truth instance, list of raw predictions)
+    """
+    gold = filter(adapter.accept_gold, utilities.iterate_jsonlines(ground_truth_path))
+    if adapter.join == POSITIONAL:
+        for gt, line in zip(gold, adapter.read_lines()):
+            yield gt, [line]
+        return
+
+    index = adapter.build_index()
+    handles = {}
+    try:
+        for gt in gold:
+            lines = []
+            for file, offset in index.get(adapter.gold_key(gt), []):
+                if file not in handles:
+                    handles[file] = open(file, 'rb')
+                handles[file].seek(offset)
+                lines.append(handles[file].readline().decode('utf-8'))
+            yield gt, lines
+    finally:
+        for handle in handles.values():
+            handle.close()
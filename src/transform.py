@@ -2,12 +2,25 @@ from .transformers.RAMS_Trasnformer import RamsTransformer
 from .transformers.M2E2_Transformer import M2e2Transformer
 from .transformers.ACE_Transformer import AceTransformer
 from .transformers.EMM_Transformer import EmmTransformer
+from .transformers.Transformer import ANNOTATORS
+from .validate import ValidateTransformation
+from .utils import timing
+from .utils.memprofile import MemoryProfiler
+from .utils.scheduler import CircuitBreaker, RequestScheduler
+from .utils.corenlp import CoreNLPServers, warm_up
+from .utils.duplicates import ParsingCache
+from .utils.workqueue import WorkQueue, worker_name
 from stanfordcorenlp import StanfordCoreNLP
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 import argparse
 import os
 import logging
+import shutil
 import sys
+import threading
+import time
 
 log = logging.getLogger("TRANSFORMER")
 log.setLevel(logging.DEBUG)
@@ -26,12 +39,23 @@ consoleER.terminator = ""
 log_root.addHandler(consoleER)
 
 
+# the transformers of the datasets of the shards of a queue
+TRANSFORMERS = {"rams": RamsTransformer, "emm": EmmTransformer, "m2e2": M2e2Transformer, "ace": AceTransformer}
+# seconds to wait for the shards leased by other workers
+POLL_INTERVAL = 5
+
 parser = argparse.ArgumentParser(description="Give arguments")
-parser.add_argument('-coreNLP', metavar='coreNLP_path', type=str, help='Path to the pretrained coreNLP model', required=True)
+parser.add_argument('-coreNLP', metavar='coreNLP_path', type=str, help='Path to the pretrained coreNLP model')
+parser.add_argument('-servers', metavar='url', type=str, nargs='+', help='URLs of running CoreNLP servers to use instead of launching CoreNLP, e.g. http://localhost:9000')
 parser.add_argument('-memory', metavar='memory', default="3", type=str, help='CoreNLP memory in GB, default value is 3 GB')
-parser.add_argument('-timeout', metavar='timeout', default="10", type=str, help='CoreNLP timeout, default value is 10 sec')
+parser.add_argument('-timeout', metavar='timeout', default="10", type=str, help='CoreNLP timeout of a request of up to 1000 characters, longer requests get proportionally more time, default value is 10 sec')
+parser.add_argument('-retries', metavar='retries', default=3, type=int, help='Number of retries of a failed CoreNLP request, default value is 3')
+parser.add_argument('-backoff', metavar='seconds', default=1.0, type=float, help='Seconds before the first retry of a failed CoreNLP request, doubled on every retry, default value is 1 sec')
+parser.add_argument('-breakerThreshold', metavar='N', default=5, type=int, help='Pause the CoreNLP requests after N consecutive failures, default value is 5')
+parser.add_argument('-breakerCooldown', metavar='seconds', default=30.0, type=float, help='Seconds to pause the CoreNLP requests when the server is overloaded, default value is 30 sec')
 
-parser.add_argument('-out', metavar='out', type=str, help='Output path', required=True)
+parser.add_argument('-out', metavar='out', type=str, help='Output path, required unless -queue is provided')
+parser.add_argument('-queue', metavar='queue_path', type=str, help='Work on the shards of the queue of src.coordinate, instead of the given datasets')
 
 parser.add_argument('-emm', metavar='emm_path', type=str, help='Path to the EMM dataset, can be a json file or a folder of jsons')
 parser.add_argument('-rams', metavar='rams_path', type=str, help='Path to the RAMS dataset')
@@ -39,20 +63,50 @@ parser.add_argument('-m2e2', metavar='m2e2_path', type=str, help='Path to the M2
 parser.add_argument('-ace', metavar='ace_path', type=str, help='Path to the pre-processed ACE dataset')
 
 parser.add_argument('-disableMapping', action='store_true', help='Disable event type mapping matching ')
+parser.add_argument('-chunkSize', metavar='chunk_size', default=5000, type=int, help='Maximum number of characters of consecutive sentences annotated in a single CoreNLP request, default value is 5000')
+parser.add_argument('-concurrent', action='store_true', help='Transform the datasets at the same time, sharing the annotation workers')
+parser.add_argument('-annotationWorkers', metavar='N', default=1, type=int, help='Number of CoreNLP requests of a transformer in flight at the same time, default value is 1')
+parser.add_argument('-queueSize', metavar='N', default=100, type=int, help='Capacity of the queues between the stages of the transformation, default value is 100')
+parser.add_argument('-duplicatesCache', metavar='N', default=10000, type=int, help='Number of parsings kept to reuse for identical texts of the run, 0 to annotate every text, default value is 10000')
+parser.add_argument('-pretokenized', action='store_true', help='Annotate the tokens of RAMS, ACE and M2E2 as they are, instead of re-tokenizing their text')
+parser.add_argument('-validate', action='store_true', help='Validate the instances before storing them, invalid instances are stored in the rejects path')
+parser.add_argument('-rejects', metavar='rejects_path', type=str, help='Path to store the invalid instances, default value is the output path with the .rejects extension')
+parser.add_argument('-timings', metavar='timings_path', type=str, help='Path to export the time spent in each stage, as a Prometheus textfile if it ends with .prom, otherwise as JSON')
+parser.add_argument('-timingsInterval', metavar='seconds', default=60, type=int, help='Export the timings every N seconds during the transformation, default value is 60')
+parser.add_argument('-memprofile', metavar='memprofile_path', type=str, help='Profile the memory with tracemalloc and store a summary per transformer in the given path')
+parser.add_argument('-memprofileEvery', metavar='N', default=1000, type=int, help='Take a memory snapshot every N instances, default value is 1000')
+parser.add_argument('-memprofileTop', metavar='N', default=10, type=int, help='Number of top allocation sites to report per transformer, default value is 10')
 
 args = parser.parse_args()
 disable_mapping = args.disableMapping
-if not os.path.exists(args.coreNLP):
-    log.error("CoreNLP path does not exist")
+if not args.coreNLP and not args.servers:
+    log.error("Either the CoreNLP path or the URLs of running CoreNLP servers are required")
     exit(1)
 
-if not os.path.exists(os.path.dirname(args.out)):
-    log.error("Output path does not exist")
+if not args.servers and not os.path.exists(args.coreNLP):
+    log.error("CoreNLP path does not exist")
     exit(1)
 
-if not args.emm and not args.ace and not args.m2e2 and not args.rams:
-    log.error("No input dataset to transform")
-    exit(1)
+if args.queue:
+    if not os.path.exists(args.queue):
+        log.error("Queue path '" + args.queue + "' does not exist")
+        exit(1)
+
+    if args.emm or args.ace or args.m2e2 or args.rams:
+        log.error("The datasets of a queue are split into shards by src.coordinate, they are not given to its workers")
+        exit(1)
+else:
+    if not args.out:
+        log.error("Output path is required")
+        exit(1)
+
+    if not os.path.exists(os.path.dirname(args.out)):
+        log.error("Output path does not exist")
+        exit(1)
+
+    if not args.emm and not args.ace and not args.m2e2 and not args.rams:
+        log.error("No input dataset to transform")
+        exit(1)
 
 if not args.memory.isdigit():
     log.error("CoreNLP memory value is not a number")
@@ -62,21 +116,211 @@ if not args.timeout.isdigit():
     log.error("CoreNLP timeout value is not a number")
     exit(1)
 
+if args.timingsInterval <= 0:
+    log.error("Timings interval must be a positive number of seconds")
+    exit(1)
+
+if args.concurrent and args.memprofile:
+    log.error("The memory of concurrent transformations cannot be profiled per transformer")
+    exit(1)
+
 if disable_mapping:
     log.info("Disable Mapping event types")
 
 output_path = args.out
-log.info("Results will be stored in '" + output_path + "'")
+rejects_path = None
+if output_path:
+    log.info("Results will be stored in '" + output_path + "'")
+    rejects_path = args.rejects if args.rejects else output_path + ".rejects"
+validator = None
+if args.validate:
+    validator = ValidateTransformation()
+    if rejects_path:
+        log.info("Invalid instances will be stored in '" + rejects_path + "'")
+
+if args.timings:
+    timing.stages.enabled = True
+    timing.stages.start_exporting(args.timings, args.timingsInterval)
+    log.info("Timings will be exported in '" + args.timings + "' every " + str(args.timingsInterval) + " seconds")
+
+profiler = None
+if args.memprofile:
+    profiler = MemoryProfiler(args.memprofileEvery, args.memprofileTop)
+    log.info("Memory profile will be stored in '" + args.memprofile + "'")
+
+
+def run(transformer, output_path, rejects_path):
+    transformer.chunk_size = args.chunkSize
+    transformer.scheduler = scheduler
+    transformer.annotation_workers = args.annotationWorkers
+    transformer.queue_size = args.queueSize
+    transformer.parsings = parsings
+    if args.pretokenized:
+        transformer.enable_pretokenized()
+    if validator is not None:
+        transformer.enable_validation(validator, rejects_path)
+    if profiler is not None:
+        transformer.enable_memory_profiling(profiler)
+        profiler.start(transformer.origin)
+    try:
+        transformer.transform(output_path)
+    finally:
+        # a shard that failed does not leave its profile running
+        if profiler is not None:
+            profiler.stop()
+    if profiler is not None:
+        summary = profiler.summary()[transformer.origin]
+        log.info("Peak traced memory of " + transformer.origin + ": " + str(summary["peak traced (MB)"]) +
+                 "MB, peak RSS: " + str(summary["peak RSS (MB)"]) + "MB")
+    if validator is not None:
+        log.info(str(transformer.rejected) + " instances failed validation")
+    if transformer.unannotated:
+        log.warning(str(transformer.unannotated) + " instances could not be annotated by CoreNLP")
+
+
+def append(part_path, path):
+    if os.path.exists(part_path):
+        with open(part_path, 'rb') as part, open(path, 'ab') as f:
+            shutil.copyfileobj(part, f)
+        os.remove(part_path)
 
-coreNLP = StanfordCoreNLP(args.coreNLP, memory=args.memory + 'g', timeout=int(args.timeout), logging_level=logging.WARNING)
-log.info("Initialized Core NLP with " + str(args.memory) + "GB of memory and " + args.timeout + " seconds")
 
+def run_concurrently(transformers):
+    """
+    Run the transformers at the same time, with a pool of annotation workers shared by all of them. Each transformer
+    stores its instances in a temporary file next to the output, and when all of them are completed the temporary
+    files are appended to the output in the order of the transformers, except those of the transformers that failed.
+    The pool has at least one worker per transformer, so the transformers annotate at the same time.
+    :return: whether all the transformers were completed
+    """
+    workers = max(args.annotationWorkers, len(transformers))
+    if workers > args.annotationWorkers:
+        log.info("Using " + str(workers) + " annotation workers, one per dataset")
+    annotation_pool = ThreadPoolExecutor(workers)
+    runs = []
+    with ThreadPoolExecutor(len(transformers)) as runner:
+        for transformer in transformers:
+            transformer.executor = annotation_pool
+            output_part = output_path + "." + transformer.origin + ".tmp"
+            rejects_part = rejects_path + "." + transformer.origin + ".tmp"
+            for part in (output_part, rejects_part):
+                if os.path.exists(part):
+                    os.remove(part)
+            runs.append((transformer, output_part, rejects_part,
+                         runner.submit(run, transformer, output_part, rejects_part)))
+    annotation_pool.shutdown()
+
+    completed = True
+    for transformer, output_part, rejects_part, result in runs:
+        try:
+            result.result()
+        except Exception:
+            log.exception("The transformation of " + transformer.origin + " failed, its instances are not stored")
+            for part in (output_part, rejects_part):
+                if os.path.exists(part):
+                    os.remove(part)
+            completed = False
+            continue
+        append(output_part, output_path)
+        append(rejects_part, rejects_path)
+    return completed
+
+
+if args.servers:
+    coreNLP = CoreNLPServers(args.servers)
+    ready = coreNLP.ready()
+    if not ready:
+        log.error("None of the CoreNLP servers is ready")
+        exit(1)
+    for url in coreNLP.urls:
+        if url not in ready:
+            log.warning("CoreNLP server '" + url + "' is not ready, it will not be used")
+    coreNLP.use(ready)
+    log.info("Using the CoreNLP servers " + ", ".join(ready))
+else:
+    coreNLP = StanfordCoreNLP(args.coreNLP, memory=args.memory + 'g', timeout=int(args.timeout), logging_level=logging.WARNING)
+    log.info("Initialized Core NLP with " + str(args.memory) + "GB of memory and " + args.timeout + " seconds")
+log.info("Warmed up CoreNLP in " + str(round(warm_up(coreNLP, {'annotators': ANNOTATORS}), 3)) + " seconds")
+scheduler = RequestScheduler(coreNLP, int(args.timeout), args.retries, args.backoff,
+                             CircuitBreaker(args.breakerThreshold, args.breakerCooldown))
+parsings = ParsingCache(args.duplicatesCache) if args.duplicatesCache > 0 else None
+
+
+def work(queue):
+    """
+    Claim shards of the queue until all of them are done, transform each one in a temporary file next to its output,
+    and move the temporary file to the output of the shard when it is marked as done. The transformer of each dataset
+    is initialized once and reused for all the shards of the dataset. The lease of the shard is
+    renewed while it is transformed; if the lease is lost, the shard was given to another worker and the
+    output of this worker is discarded.
+    """
+    worker = worker_name()
+    transformers = {}
+    log.info("Working on the queue '" + args.queue + "' as " + worker)
+    while True:
+        shard = queue.claim(worker)
+        if shard is None:
+            if not queue.unfinished():
+                break
+            # the remaining shards are leased by other workers, wait in case their leases expire
+            time.sleep(POLL_INTERVAL)
+            continue
+        log.info("Claimed shard " + str(shard["id"]) + " of " + shard["dataset"].upper() + ", attempt " +
+                 str(shard["attempts"]))
+        part = shard["output"] + "." + worker.replace(":", "-") + ".tmp"
+        for path in (part, part + ".rejects"):
+            if os.path.exists(path):
+                os.remove(path)
+
+        renewed = threading.Event()
+
+        def renew():
+            while not renewed.wait(shard["lease"] / 3):
+                if not queue.renew(shard["id"], worker):
+                    log.warning("Lost the lease of shard " + str(shard["id"]))
+                    return
+
+        renewer = threading.Thread(target=renew, daemon=True)
+        renewer.start()
+        try:
+            if shard["dataset"] not in transformers:
+                transformers[shard["dataset"]] = TRANSFORMERS[shard["dataset"]](shard["input"], coreNLP, disable_mapping)
+            transformer = transformers[shard["dataset"]]
+            transformer.reset(shard["input"], shard["offset"])
+            run(transformer, part, part + ".rejects")
+        except Exception as e:
+            log.exception("Failed to transform shard " + str(shard["id"]))
+            queue.fail(shard["id"], worker, repr(e))
+            continue
+        finally:
+            renewed.set()
+            renewer.join()
+
+        def store():
+            os.replace(part, shard["output"])
+            if os.path.exists(part + ".rejects"):
+                os.replace(part + ".rejects", shard["output"] + ".rejects")
+
+        # the output exists even if no instance was stored
+        open(part, 'a').close()
+        with open(part, 'rb') as f:
+            instances = sum(1 for _ in f)
+        if queue.complete(shard["id"], worker, instances, store):
+            log.info("Completed shard " + str(shard["id"]) + " with " + str(instances) + " instances")
+        else:
+            log.warning("Shard " + str(shard["id"]) + " was given to another worker, its output is discarded")
+            for path in (part, part + ".rejects"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+# the transformers in the order their instances are stored, initialized when they run
+transformers = []
 if args.rams:
     if os.path.exists(args.rams):
         log.info("Starting the transformation of RAMS ")
         log.info("RAMS source: '" + args.rams + "'")
-        transformer = RamsTransformer(args.rams, coreNLP, disable_mapping)
-        transformer.transform(output_path)
+        transformers.append(partial(RamsTransformer, args.rams, coreNLP, disable_mapping))
     else:
         log.error("RAMS path '" + args.rams + "' does not exist")
 
@@ -84,8 +328,7 @@ if args.emm:
     if os.path.exists(args.emm):
         log.info("Starting the transformation of EMM ")
         log.info("EMM source: '" + args.emm + "'")
-        transformer = EmmTransformer(args.emm, coreNLP, disable_mapping)
-        transformer.transform(output_path)
+        transformers.append(partial(EmmTransformer, args.emm, coreNLP, disable_mapping))
     else:
         log.error("EMM path '" + args.emm + "' does not exist")
 
@@ -93,8 +336,7 @@ if args.m2e2:
     if os.path.exists(args.m2e2):
         log.info("Starting the transformation of M2E2 ")
         log.info("M2E2 source: '" + args.m2e2 + "'")
-        transformer = M2e2Transformer(args.m2e2, coreNLP, disable_mapping)
-        transformer.transform(output_path)
+        transformers.append(partial(M2e2Transformer, args.m2e2, coreNLP, disable_mapping))
     else:
         log.error("M2E2 path '" + args.m2e2 + "' does not exist")
 
@@ -102,10 +344,35 @@ if args.ace:
     if os.path.exists(args.ace):
         log.info("Starting the transformation of pre-processed ACE ")
         log.info("Ace source: '" + args.ace + "'")
-        transformer = AceTransformer(args.ace, coreNLP, disable_mapping)
-        transformer.transform(output_path)
+        transformers.append(partial(AceTransformer, args.ace, coreNLP, disable_mapping))
     else:
         log.error("ACE path '" + args.ace + "' does not exist")
 
+completed = True
+if args.queue:
+    queue = WorkQueue(args.queue)
+    work(queue)
+    queue.close()
+elif args.concurrent and len(transformers) > 1:
+    transformers = [transformer() for transformer in transformers]
+    log.info("Transforming " + ", ".join(t.origin for t in transformers) + " concurrently")
+    completed = run_concurrently(transformers)
+else:
+    for transformer in transformers:
+        run(transformer(), output_path, rejects_path)
+
+if args.timings:
+    timing.stages.stop_exporting(args.timings)
+if profiler is not None:
+    profiler.write_summary(args.memprofile)
+log.info("CoreNLP requests: " + scheduler.summary())
+if parsings is not None:
+    log.info("Duplicate texts:\n\t" + "\n\t".join(parsings.summary()))
+if args.timings:
+    log.info("Time per stage:\n\t" + "\n\t".join(timing.stages.summary()))
+if not completed:
+    log.error("Not all the datasets were transformed, the output is incomplete")
+    print()
+    exit(1)
 log.info("Transformation Completed")
 print()
@@ -1,10 +1,9 @@
 from .Transformer import Transformer
 from tqdm import tqdm
 from ..utils import utilities
+from ..utils import timing
 from ..conf.Constants import Keys
 
-import time
-
 
 class AceTransformer(Transformer):
 
@@ -15,6 +14,10 @@ class AceTransformer(Transformer):
         self.path = ace_path
         self.origin = "ACE"
 
+    def reset(self, path, id_offset=0):
+        super().reset(path, id_offset)
+        self.path = path
+
     # accumulate and store all the roles/eventTypes
     def export_types(self, roles_path, event_paths):
         events = set()
@@ -30,112 +33,95 @@ class AceTransformer(Transformer):
         utilities.write_iterable(roles_path, roles)
         utilities.write_iterable(event_paths, events)
 
-    def transform(self, output_path):
-        """
-        Transform dataset into the common schema and store the results
-        in the output path. Storing is performed in batches.
-        Actions:
-            - Parse text and produce text-based features
-            - Parse entities and adjust them to the new list of words
-            - Parse event triples and adjust them to the new list of words
-        :param output_path: output path
-        :return:  None
-        """
-        start_time = time.monotonic()
-
-        self.log.info("Starting the transformation of ACE")
-        new_instances = []
-        i = -1
+    def read_instances(self):
         ace_jsons = utilities.read_simple_json(self.path)
-
-        print()
-        for instance in tqdm(ace_jsons):
-            i += 1
-            new_instance_id = self.id_base + str(i)
-
-            try:
-                parsing = self.advanced_parsing(instance['sentence'])
-            except ValueError:
-                continue
-            # extract parsing results
-            text_sentence = parsing[Keys.TEXT.value]
-            sentences = parsing[Keys.SENTENCES.value]
-            words = parsing[Keys.WORDS.value]
-            lemma = parsing[Keys.LEMMA.value]
-            pos_tags = parsing[Keys.POS_TAGS.value]
-            ner = parsing[Keys.NER.value]
-            # sentence centric
-            penn_treebanks = parsing[Keys.PENN_TREEBANK.value]
-            dependency_parsing = parsing[Keys.DEPENDENCY_PARSING.value]
-            chunks = parsing[Keys.CHUNKS.value]
-            no_of_sentences = len(sentences)
-
-            # adjust entities
-            entities = []
-            text_to_entity = {}
-            for entity in instance["golden-entity-mentions"]:
-                existing_entity_type = entity["entity-type"]
-                entity_type = utilities.most_frequent(ner[entity['start']: entity['end']])
-                text_to_entity[entity['text']] = entity_type
-                new_entity = {Keys.START.value: entity['start'],
-                              Keys.END.value: entity['end'],
-                              Keys.TEXT.value: entity['text'],
-                              Keys.ENTITY_ID.value: entity['entity_id'],
-                              Keys.ENTITY_TYPE.value: entity_type,
-                              Keys.EXISTING_ENTITY_TYPE.value:  existing_entity_type}
-                entities.append(new_entity)
-
-            # adjust events
-            events = []
-            for event in instance['golden-event-mentions']:
-                arguments = []
-                for arg in event['arguments']:
-                    new_arg = {
-                        Keys.START.value: arg['start'],
-                        Keys.END.value: arg['end'],
-                        Keys.TEXT.value: arg['text'],
-                        Keys.EXISTING_ENTITY_TYPE.value: arg["entity-type"],
-                        Keys.ENTITY_TYPE.value: text_to_entity[arg['text']],
-                        Keys.ROLE.value: self.get_role(arg['role'])
-                    }
-                    arguments.append(new_arg)
-                events.append({
-                    Keys.ARGUMENTS.value: arguments,
-                    Keys.EVENT_TYPE.value: self.get_event_type(event['event_type']),
-                    Keys.TRIGGER.value: event['trigger']
-                })
-
-            # create new instance
-            new_instance = {
-                Keys.ORIGIN.value: self.origin,
-                Keys.ID.value: new_instance_id,
-                Keys.NO_SENTENCES.value: no_of_sentences,
-                Keys.SENTENCES.value: sentences,
-                Keys.TEXT.value: text_sentence,
-                Keys.WORDS.value: words,
-                Keys.LEMMA.value: lemma,
-                Keys.POS_TAGS.value: pos_tags,
-                Keys.NER.value: ner,
-                Keys.ENTITIES_MENTIONED.value: entities,
-                Keys.EVENTS_MENTIONED.value: events,
-                Keys.PENN_TREEBANK.value: penn_treebanks,
-                Keys.DEPENDENCY_PARSING.value: dependency_parsing,
-                Keys.CHUNKS.value: chunks
-            }
-            new_instances.append(new_instance)
-
-            # write results if we reached batch size
-            if len(new_instances) == self.batch_size:
-                utilities.write_jsons(new_instances, output_path)
-                new_instances = []
-        utilities.write_jsons(new_instances, output_path)
-        self.log.info("Transformation of ACE completed in " + str(round(time.monotonic() - start_time, 3)) + "sec")
-
+        self.memory_checkpoint("read")
+        return ace_jsons
+
+    def annotate_instance(self, instance):
+        parsing, _ = self.parse([instance['words']], instance['sentence'])
+        return parsing
+
+    def estimate_cost(self, instance):
+        return self.annotation_cost(len(instance['sentence']), 1)
+
+    def assemble_instance(self, i, instance, parsing):
+        new_instance_id = self.id_base + str(i)
+
+        # extract parsing results
+        text_sentence = parsing[Keys.TEXT.value]
+        sentences = parsing[Keys.SENTENCES.value]
+        words = parsing[Keys.WORDS.value]
+        lemma = parsing[Keys.LEMMA.value]
+        pos_tags = parsing[Keys.POS_TAGS.value]
+        ner = parsing[Keys.NER.value]
+        # sentence centric
+        penn_treebanks = parsing[Keys.PENN_TREEBANK.value]
+        dependency_parsing = parsing[Keys.DEPENDENCY_PARSING.value]
+        chunks = parsing[Keys.CHUNKS.value]
+        no_of_sentences = len(sentences)
+
+        # adjust entities
+        entities = []
+        text_to_entity = {}
+        for entity in instance["golden-entity-mentions"]:
+            existing_entity_type = entity["entity-type"]
+            entity_type = self.get_entity_type(ner[entity['start']: entity['end']])
+            text_to_entity[entity['text']] = entity_type
+            new_entity = {Keys.START.value: entity['start'],
+                          Keys.END.value: entity['end'],
+                          Keys.TEXT.value: entity['text'],
+                          Keys.ENTITY_ID.value: entity['entity_id'],
+                          Keys.ENTITY_TYPE.value: entity_type,
+                          Keys.EXISTING_ENTITY_TYPE.value:  existing_entity_type}
+            entities.append(new_entity)
+
+        # adjust events
+        events = []
+        for event in instance['golden-event-mentions']:
+            arguments = []
+            for arg in event['arguments']:
+                new_arg = {
+                    Keys.START.value: arg['start'],
+                    Keys.END.value: arg['end'],
+                    Keys.TEXT.value: arg['text'],
+                    Keys.EXISTING_ENTITY_TYPE.value: arg["entity-type"],
+                    Keys.ENTITY_TYPE.value: text_to_entity[arg['text']],
+                    Keys.ROLE.value: self.get_role(arg['role'])
+                }
+                arguments.append(new_arg)
+            events.append({
+                Keys.ARGUMENTS.value: arguments,
+                Keys.EVENT_TYPE.value: self.get_event_type(event['event_type']),
+                Keys.TRIGGER.value: event['trigger']
+            })
+
+        # create new instance
+        new_instance = {
+            Keys.ORIGIN.value: self.origin,
+            Keys.ID.value: new_instance_id,
+            Keys.NO_SENTENCES.value: no_of_sentences,
+            Keys.SENTENCES.value: sentences,
+            Keys.TEXT.value: text_sentence,
+            Keys.WORDS.value: words,
+            Keys.LEMMA.value: lemma,
+            Keys.POS_TAGS.value: pos_tags,
+            Keys.NER.value: ner,
+            Keys.ENTITIES_MENTIONED.value: entities,
+            Keys.EVENTS_MENTIONED.value: events,
+            Keys.PENN_TREEBANK.value: penn_treebanks,
+            Keys.DEPENDENCY_PARSING.value: dependency_parsing,
+            Keys.CHUNKS.value: chunks
+        }
+        return new_instance
+
+    @timing.timed("type-mapping")
     def get_event_type(self, event_type):
         if self.disable_mapping:
             return event_type
         event_type = event_type.replace(":", ".")
         return utilities.find_most_similar(event_type, self.events)
 
+    @timing.timed("type-mapping")
     def get_role(self, role):
         return utilities.find_most_similar(role, self.roles)
@@ -1,10 +1,10 @@
-from .Transformer import Transformer
-from tqdm import tqdm
+from .Transformer import Transformer, SENTENCE_BOUNDARY
 from ..utils import utilities
+from ..utils import timing
 from ..conf.Constants import Keys
+import bisect
 import re
 import os
-import time
 
 
 class EmmTransformer(Transformer):
@@ -16,6 +16,10 @@ class EmmTransformer(Transformer):
         self.path = edd_path
         self.origin = "EMM"
 
+    def reset(self, path, id_offset=0):
+        super().reset(path, id_offset)
+        self.path = path
+
     def export_types(self, roles_path, event_paths):
         """
         accumulate and store all the roles/eventTypes
@@ -46,151 +50,201 @@ class EmmTransformer(Transformer):
         utilities.write_iterable(roles_path, roles)
         utilities.write_iterable(event_paths, events)
 
-    def transform(self, output_path):
+    def read_instances(self):
         """
-        Read input JSON(s) and transform it(them)
-        :param output_path: output path
-        :return: None
+        Read input JSON(s)
+        :return: iterable of (index of the JSON, instance)
         """
-        self.log.info("Starting the transformation of EMM")
-        start_time = time.monotonic()
-        i = 0
         if os.path.isdir(self.path):
-            for file in os.listdir(self.path):
+            for i, file in enumerate(os.listdir(self.path)):
                 json_file = os.path.join(self.path, file)
                 self.log.info("Transforming " + file)
-                self.transform_json(json_file, output_path, i)
-                i += 1
+                for instance in self.read_json(json_file):
+                    yield self.id_offset + i, instance
         else:
-            self.transform_json(self.path, output_path, i)
-        self.log.info("Transformation of EMM completed in " + str(round(time.monotonic() - start_time, 3)) + "sec")
+            for instance in self.read_json(self.path):
+                yield self.id_offset, instance
+
+    def read_json(self, json_file):
+        edd_jsons = utilities.read_simple_json(json_file)
+        self.memory_checkpoint("read")
+        return edd_jsons
 
-    def transform_json(self, json_file, output_path, i):
+    def annotate_instance(self, instance):
+        _, instance = instance
+        text = re.sub(r'(?<!\.)\n', ' . ', instance['data']['text']).replace("\n", "")
+        return self.advanced_parsing(text)
+
+    def estimate_cost(self, instance):
+        text = instance[1]['data']['text']
+        return self.annotation_cost(len(text), len(SENTENCE_BOUNDARY.findall(text)) + text.count("\n") + 1)
+
+    def assemble_instance(self, _, instance, parsing):
         """
-        Transform dataset into the common schema and store the results
-        in the output path. Storing is performed in batches.
+        Build the instance of the common schema
         Actions:
-            - Parse text and produce text-based features
             - Parse entities and adjust them to the new list of words
-            - Parse event triples and adjust them to the new list of words\
-        :param json_file: json to transform
-        :param output_path: output path
-        :return:  None
+            - Parse event triples and adjust them to the new list of words
+        :param instance:    (index of its JSON, the instance of the dataset)
+        :param parsing:     the parsing of its text
+        :return: the new instance, None if it is skipped
         """
-        new_instances = []
-        edd_jsons = utilities.read_simple_json(json_file)
-        print()
-        for instance in tqdm(edd_jsons):
-            instance_data = instance['data']
-            new_instance_id = self.id_base + "-" + instance_data['filename'] + str(i)
-            initial_text = instance_data['text']
-            text = re.sub(r'(?<!\.)\n', ' . ', instance_data['text']).replace("\n", "")
-            try:
-                parsing = self.advanced_parsing(text)
-            except ValueError:
-                continue
-            # extract parsing results
-            text_sentence = parsing[Keys.TEXT.value]
-            sentences = parsing[Keys.SENTENCES.value]
-            words = parsing[Keys.WORDS.value]
-            lemma = parsing[Keys.LEMMA.value]
-            pos_tags = parsing[Keys.POS_TAGS.value]
-            ner = parsing[Keys.NER.value]
-            # sentence centric
-            penn_treebanks = parsing[Keys.PENN_TREEBANK.value]
-            dependency_parsing = parsing[Keys.DEPENDENCY_PARSING.value]
-            chunks = parsing[Keys.CHUNKS.value]
-            no_of_sentences = len(sentences)
-
-            # parse events/entities
-            event_type = None
-            trigger = None
-            arguments = []
-            entities = []
-            instance_result = instance['completions'][0]['result']
-            for j, result in enumerate(instance_result):
-                if result['from_name'] == "ev_type":
-                    # path to event type
-                    event_type = result['value']['choices'][0].lower()
-                    event_type = self.get_event_type(event_type)
-                else:
-                    # simple entity
-                    value = result['value']
-                    entity_text = value['text']
-                    entity_char_start = value['start']
-                    entity_char_end = value['end']
-
-                    indices = self.search_text_in_list_(entity_char_start, entity_char_end, initial_text, entity_text,
-                                                        words)
-                    entity_start = indices[Keys.START.value]
-                    entity_end = indices[Keys.END.value]
-                    if entity_start is None or entity_end is None:
-                        continue
-                    entity_text = ' '.join(words[entity_start: entity_end])
-                    role = value['labels'][0].lower()
-
-                    # entity is the trigger
-                    if role == 'event trigger':
-                        trigger = {Keys.START.value: entity_start,
-                                   Keys.END.value: entity_end,
-                                   Keys.TEXT.value: entity_text}
-                    else:
-                        entity_id = new_instance_id + "-" + str(j)
-                        types = set(ner[entity_start: entity_end])
-                        entity_type = "O"
-                        if len(types) > 0:
-                            entity_type = utilities.most_frequent(ner[entity_start: entity_end])
-
-                        # add entity
-                        entity = {Keys.START.value: entity_start, Keys.END.value: entity_end,
-                                  Keys.TEXT.value: entity_text, Keys.ENTITY_ID.value: entity_id,
-                                  Keys.ENTITY_TYPE.value: entity_type, Keys.EXISTING_ENTITY_TYPE.value: ""}
-                        entities.append(entity)
-
-                        # add entity as an argument
-                        role = self.roles_mapper[role] if role in self.roles_mapper else role
-                        new_argument = {Keys.START.value: entity_start,
-                                        Keys.END.value: entity_end,
-                                        Keys.TEXT.value: entity_text,
-                                        Keys.ENTITY_TYPE.value: entity_type,
-                                        Keys.EXISTING_ENTITY_TYPE.value: "",
-                                        Keys.ROLE.value: role}
-                        arguments.append(new_argument)
-
-            # log error
-            if not (event_type and trigger):
-                if not event_type:
-                    self.log.warning("An empty Event Type was detected")
+        i, instance = instance
+        instance_data = instance['data']
+        new_instance_id = self.id_base + "-" + instance_data['filename'] + str(i)
+        initial_text = instance_data['text']
+
+        # extract parsing results
+        text_sentence = parsing[Keys.TEXT.value]
+        sentences = parsing[Keys.SENTENCES.value]
+        words = parsing[Keys.WORDS.value]
+        lemma = parsing[Keys.LEMMA.value]
+        pos_tags = parsing[Keys.POS_TAGS.value]
+        ner = parsing[Keys.NER.value]
+        # sentence centric
+        penn_treebanks = parsing[Keys.PENN_TREEBANK.value]
+        dependency_parsing = parsing[Keys.DEPENDENCY_PARSING.value]
+        chunks = parsing[Keys.CHUNKS.value]
+        no_of_sentences = len(sentences)
+        aligner = self.char_aligner(initial_text, parsing.get(Keys.TOKEN_OFFSETS.value))
+
+        # parse events/entities
+        event_type = None
+        trigger = None
+        arguments = []
+        entities = []
+        instance_result = instance['completions'][0]['result']
+        for j, result in enumerate(instance_result):
+            if result['from_name'] == "ev_type":
+                # path to event type
+                event_type = result['value']['choices'][0].lower()
+                event_type = self.get_event_type(event_type)
+            else:
+                # simple entity
+                value = result['value']
+                entity_text = value['text']
+                entity_char_start = value['start']
+                entity_char_end = value['end']
+
+                indices = None
+                if aligner is not None:
+                    indices = self.align_char_span(entity_char_start, entity_char_end, *aligner)
+                if indices is None:
+                    indices = self.search_text_in_list_(entity_char_start, entity_char_end, initial_text,
+                                                        entity_text, words)
+                entity_start = indices[Keys.START.value]
+                entity_end = indices[Keys.END.value]
+                if entity_start is None or entity_end is None:
+                    continue
+                entity_text = ' '.join(words[entity_start: entity_end])
+                role = value['labels'][0].lower()
+
+                # entity is the trigger
+                if role == 'event trigger':
+                    trigger = {Keys.START.value: entity_start,
+                               Keys.END.value: entity_end,
+                               Keys.TEXT.value: entity_text}
                 else:
-                    self.log.warning("An empty Trigger was detected")
-                continue
-            events = [{'arguments': arguments, 'trigger': trigger, 'event-type': event_type}]
-
-            # create new instance
-            new_instance = {
-                Keys.ORIGIN.value: self.origin,
-                Keys.ID.value: new_instance_id,
-                Keys.NO_SENTENCES.value: no_of_sentences,
-                Keys.SENTENCES.value: sentences,
-                Keys.TEXT.value: text_sentence,
-                Keys.WORDS.value: words,
-                Keys.LEMMA.value: lemma,
-                Keys.POS_TAGS.value: pos_tags,
-                Keys.NER.value: ner,
-                Keys.ENTITIES_MENTIONED.value: entities,
-                Keys.EVENTS_MENTIONED.value: events,
-                Keys.PENN_TREEBANK.value: penn_treebanks,
-                Keys.DEPENDENCY_PARSING.value: dependency_parsing,
-                Keys.CHUNKS.value: chunks
-            }
-            new_instances.append(new_instance)
-
-            # write results if we reached batch size
-            if len(new_instances) == self.batch_size:
-                utilities.write_jsons(new_instances, output_path)
-                new_instances = []
-        utilities.write_jsons(new_instances, output_path)
+                    entity_id = new_instance_id + "-" + str(j)
+                    types = set(ner[entity_start: entity_end])
+                    entity_type = "O"
+                    if len(types) > 0:
+                        entity_type = self.get_entity_type(ner[entity_start: entity_end])
+
+                    # add entity
+                    entity = {Keys.START.value: entity_start, Keys.END.value: entity_end,
+                              Keys.TEXT.value: entity_text, Keys.ENTITY_ID.value: entity_id,
+                              Keys.ENTITY_TYPE.value: entity_type, Keys.EXISTING_ENTITY_TYPE.value: ""}
+                    entities.append(entity)
+
+                    # add entity as an argument
+                    role = self.roles_mapper[role] if role in self.roles_mapper else role
+                    new_argument = {Keys.START.value: entity_start,
+                                    Keys.END.value: entity_end,
+                                    Keys.TEXT.value: entity_text,
+                                    Keys.ENTITY_TYPE.value: entity_type,
+                                    Keys.EXISTING_ENTITY_TYPE.value: "",
+                                    Keys.ROLE.value: role}
+                    arguments.append(new_argument)
+
+        # log error
+        if not (event_type and trigger):
+            if not event_type:
+                self.log.warning("An empty Event Type was detected")
+            else:
+                self.log.warning("An empty Trigger was detected")
+            return None
+        events = [{'arguments': arguments, 'trigger': trigger, 'event-type': event_type}]
+
+        # create new instance
+        new_instance = {
+            Keys.ORIGIN.value: self.origin,
+            Keys.ID.value: new_instance_id,
+            Keys.NO_SENTENCES.value: no_of_sentences,
+            Keys.SENTENCES.value: sentences,
+            Keys.TEXT.value: text_sentence,
+            Keys.WORDS.value: words,
+            Keys.LEMMA.value: lemma,
+            Keys.POS_TAGS.value: pos_tags,
+            Keys.NER.value: ner,
+            Keys.ENTITIES_MENTIONED.value: entities,
+            Keys.EVENTS_MENTIONED.value: events,
+            Keys.PENN_TREEBANK.value: penn_treebanks,
+            Keys.DEPENDENCY_PARSING.value: dependency_parsing,
+            Keys.CHUNKS.value: chunks
+        }
+        return new_instance
+
+    @staticmethod
+    def char_aligner(initial_text, token_offsets):
+        """
+        Prepare the alignment of the character offsets of the initial text to the parsed words.
+        The text that is parsed differs from the initial text: newlines that do not follow a dot become ' . ',
+        the rest of the newlines are removed, and every hyphen becomes ' - '. So, the position of each character
+        of the initial text in the parsed text is computed by applying the same rewriting.
+
+        :param initial_text:    the initial text
+        :param token_offsets:   (begin, end) character offsets of the parsed words in the parsed text
+        :return: the positions of the characters in the parsed text, and the begin and end offsets
+                 of the words, None if the offsets of the words are not available
+        """
+        if not token_offsets or None in token_offsets:
+            return None
+        positions = []
+        position = 0
+        for i, c in enumerate(initial_text):
+            positions.append(position)
+            if c == "\n":
+                position += 0 if i > 0 and initial_text[i - 1] == "." else 3
+            elif c == "-":
+                position += 3
+            else:
+                position += 1
+        positions.append(position)
+        return positions, [begin for begin, _ in token_offsets], [end for _, end in token_offsets]
+
+    @timing.timed("alignment")
+    def align_char_span(self, start_, end_, positions, begins, ends):
+        """
+        Find the words that overlap the characters [start_, end_) of the initial text, using binary search
+        over the character offsets of the words.
+
+        :param start_:      first index - pointer in the first char of text in the initial text
+        :param end_:        last index - pointer after the last char of text in the initial text
+        :param positions:   position of each character of the initial text in the parsed text
+        :param begins:      begin offset of each word in the parsed text
+        :param ends:        end offset of each word in the parsed text
+        :return:            a dictionary with the starting and the ending indices - None in case no word overlaps
+        """
+        if start_ is None or end_ is None or not 0 <= start_ < end_ < len(positions):
+            return None
+        start = bisect.bisect_right(ends, positions[start_])
+        end = bisect.bisect_left(begins, positions[end_])
+        if start >= end:
+            return None
+        return {Keys.START.value: start, Keys.END.value: end}
 
+    @timing.timed("alignment")
     def search_text_in_list_(self, start_, end_, whole_text, text, parsed_words):
         """
         This function finds text inside the initial text and then find its pointers in the parsed_words list.
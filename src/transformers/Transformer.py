@@ -1,11 +1,18 @@
-import json
 import re
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from ..conf import Configuration
 from ..utils.chunker import BigramChunker
 from ..conf.Constants import Keys
+from ..utils import utilities
+from ..utils import timing
+from ..utils.scheduler import AnnotationError, RequestScheduler
+from tqdm import tqdm
 import logging
+import queue
 import spacy
+import threading
+import time
 
 
 def iob_format(iterable):
@@ -24,6 +31,33 @@ def iob_format(iterable):
     return iob_format_tokens
 
 
+# the annotators of every CoreNLP request
+ANNOTATORS = 'tokenize,ssplit,pos,lemma,parse,ner'
+
+# marks the end of the stream of a queue of the pipeline
+END = object()
+
+# where a sentence may end: whitespace after a final punctuation mark
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+# estimated cost of annotating a sentence besides its characters, in characters
+SENTENCE_COST = 100
+
+
+def utf16_positions(text):
+    """
+    CoreNLP counts characters in UTF-16 code units, so characters outside the Basic Multilingual Plane count twice
+    :return: the index in text of each UTF-16 offset, None if the offsets coincide
+    """
+    if len(text.encode('utf-16-le')) == 2 * len(text):
+        return None
+    positions = []
+    for i, c in enumerate(text):
+        positions.extend([i] * (2 if ord(c) > 0xFFFF else 1))
+    positions.append(len(text))
+    return positions
+
+
 class Transformer:
 
     def __init__(self, model, disable_mapping):
@@ -41,66 +75,303 @@ class Transformer:
         self.events = Configuration.events
         self.batch_size = 50
         self.disable_mapping = disable_mapping
+        self.validator = None
+        self.rejects_path = None
+        self.rejected = 0
+        self.profiler = None
+        self.pretokenized = False
+        self.chunk_size = 5000
+        self.scheduler = RequestScheduler(model)
+        self.unannotated = 0
+        self.annotation_workers = 1
+        self.queue_size = 100
+        # a pool of annotation workers shared with other transformers, None to use a pool of its own
+        self.executor = None
+        # added to the indices the ids of the instances are built from, when the dataset is a shard of a larger one
+        self.id_offset = 0
+        # a ParsingCache shared with other transformers, None to annotate every text
+        self.parsings = None
+
+    def reset(self, path, id_offset=0):
+        """
+        Prepare the transformer to transform another dataset of its kind, e.g. the next shard of a queue,
+        reusing its models
+        :param path:        path to the dataset
+        :param id_offset:   added to the indices the ids of the instances are built from
+        :return: None
+        """
+        self.id_offset = id_offset
+        self.rejected = 0
+        self.unannotated = 0
+
+    def annotate(self, text, properties):
+        """
+        Annotate the text with CoreNLP, through the request scheduler
+        :param text:        input text
+        :param properties:  properties of the request, besides the annotators
+        :return: the parsed sentences
+        """
+        properties = dict({'annotators': ANNOTATORS}, **properties)
+        return self.scheduler.annotate(text, properties)
+
+    def annotate_chunk(self, offset, chunk):
+        """
+        Annotate a chunk of consecutive sentences. If the request times out, the chunk is bisected at the sentence
+        boundary closest to its middle and each half is annotated on its own.
+        :param offset:  offset of the chunk in the input text
+        :param chunk:   the chunk
+        :return: list of (offset of the annotated text, its UTF-16 positions, its parsed sentences)
+        """
+        try:
+            return [(offset, utf16_positions(chunk), self.annotate(chunk, {}))]
+        except AnnotationError as e:
+            # other failures are not caused by the size of the text, and were already retried
+            if not e.timed_out:
+                raise
+            boundaries = list(SENTENCE_BOUNDARY.finditer(chunk))
+            if not boundaries:
+                raise
+            middle = min(boundaries, key=lambda boundary: abs(boundary.start() - len(chunk) // 2))
+            self.log.warning("Splitting a text of " + str(len(chunk)) + " characters that CoreNLP timed out on")
+            return self.annotate_chunk(offset, chunk[:middle.start()]) + \
+                self.annotate_chunk(offset + middle.end(), chunk[middle.end():])
+
+    def annotate_sentences(self, sentences):
+        """
+        Annotate already tokenized sentences, one per line. If the request times out, the sentences are bisected
+        and each half is annotated on its own.
+        :param sentences:   list of sentences, each one a list of words
+        :return: the parsed sentences
+        """
+        text = '\n'.join(' '.join(sentence) for sentence in sentences)
+        try:
+            return self.annotate(text, {'tokenize.whitespace': 'true', 'ssplit.eolonly': 'true'})
+        except AnnotationError as e:
+            if not e.timed_out or len(sentences) < 2:
+                raise
+            self.log.warning("Splitting " + str(len(sentences)) + " sentences that CoreNLP timed out on")
+            middle = len(sentences) // 2
+            return self.annotate_sentences(sentences[:middle]) + self.annotate_sentences(sentences[middle:])
+
+    @staticmethod
+    def empty_features():
+        return {Keys.SENTENCES.value: [], Keys.TEXT.value: "", Keys.WORDS.value: [], Keys.POS_TAGS.value: [],
+                Keys.LEMMA.value: [], Keys.NER.value: [], Keys.PENN_TREEBANK.value: [],
+                Keys.DEPENDENCY_PARSING.value: [], Keys.CHUNKS.value: [], Keys.TOKEN_OFFSETS.value: []}
+
+    def add_sentence(self, features, parsed, offset=0, positions=None, sentence_words=None):
+        """
+        Append the features of a sentence parsed by CoreNLP
+        :param features:        the dictionary of features to extend
+        :param parsed:          the parsed sentence
+        :param offset:          offset of the annotated text in the input text
+        :param positions:       index of each UTF-16 offset of the annotated text, None if they coincide
+        :param sentence_words:  the words of the sentence, default are the words of CoreNLP
+        :return: None
+        """
+        if sentence_words is None:
+            sentence_words = [token['word'] for token in parsed['tokens']]
+        sentence_pos_tags = [token['pos'] for token in parsed['tokens']]
+        features[Keys.WORDS.value].extend(sentence_words)
+        features[Keys.POS_TAGS.value].extend(sentence_pos_tags)
+        features[Keys.LEMMA.value].extend([token['lemma'] for token in parsed['tokens']])
+        features[Keys.NER.value].extend(iob_format([token['ner'] for token in parsed['tokens']]))
+        for token in parsed['tokens']:
+            begin, end = token.get('characterOffsetBegin'), token.get('characterOffsetEnd')
+            if begin is not None and positions is not None:
+                begin, end = positions[min(begin, len(positions) - 1)], positions[min(end, len(positions) - 1)]
+            features[Keys.TOKEN_OFFSETS.value].append((offset + begin, offset + end) if begin is not None else None)
+
+        end = len(features[Keys.WORDS.value])
+        text = ' '.join(sentence_words)
+        features[Keys.SENTENCES.value].append({Keys.START.value: end - len(sentence_words), Keys.END.value: end,
+                                               Keys.TEXT.value: text})
+
+        features[Keys.CHUNKS.value].append(self.chunking(sentence_words, sentence_pos_tags))
+        features[Keys.PENN_TREEBANK.value].append(re.sub(r'\n|\s+', ' ', parsed['parse']))
+        features[Keys.DEPENDENCY_PARSING.value].append(
+            ['{}/dep={}/gov={}'.format(dep['dep'], dep['dependent'] - 1, dep['governor'] - 1)
+             for dep in parsed['enhancedPlusPlusDependencies']])
+
+    def split_text(self, text):
+        """
+        Split the text into chunks of consecutive sentences of up to chunk_size characters. The text is only cut
+        where a sentence may end, so CoreNLP finds the boundaries of the sentences in each chunk.
+        A sentence longer than chunk_size is a chunk on its own.
+        :param text:  input text
+        :return: list of (offset of the chunk in the text, chunk)
+        """
+        fragments = []
+        start = len(text) - len(text.lstrip())
+        for boundary in SENTENCE_BOUNDARY.finditer(text, start):
+            if boundary.start() > start:
+                fragments.append((start, boundary.start()))
+            start = boundary.end()
+        end = len(text.rstrip())
+        if end > start:
+            fragments.append((start, end))
+
+        chunks = []
+        chunk_start = chunk_end = None
+        for start, end in fragments:
+            if chunk_start is not None and end - chunk_start > self.chunk_size:
+                chunks.append((chunk_start, text[chunk_start:chunk_end]))
+                chunk_start = None
+            if chunk_start is None:
+                chunk_start = start
+            chunk_end = end
+        if chunk_start is not None:
+            chunks.append((chunk_start, text[chunk_start:chunk_end]))
+        return chunks
+
+    def reuse(self, text, parse):
+        """
+        Parse the text, or reuse the parsing of an identical text of the run if the parsings are cached
+        :param text:    the text as it is annotated
+        :param parse:   function that returns the parsing of the text
+        """
+        if self.parsings is None:
+            return parse()
+        return self.parsings.parse(text, parse, self.origin)
 
     def advanced_parsing(self, text):
         """
         extract text-based features using coreNLP based on the input text
         :param text:  input text
-        :return: a dictionary of features
+        :return: a dictionary of features, along with the character offsets of each word in the input text
+                 after its hyphens have been padded with spaces
         """
-        words = []
-        lemma = []
-        pos_tags = []
-        ner = []
-        penn_treebanks = []
-        chunks = []
-        dependency_parsing = []
-        sentences = []
-        texts = []
-        next_start = 0
         text = re.sub("-", " - ", text)
+        # the offsets of the words depend on the exact text, so only identical texts share their parsing
+        return self.reuse("text\n" + text, lambda: self.text_parsing(text))
 
-        # big texts lead to error - so we split text into senteces
-        unparsed_sentences = filter(None, text.strip().split(".", ))
-        for sentence in unparsed_sentences:
-            processed_json = self.coreNLP.annotate(sentence+".", properties={'annotators': 'tokenize,ssplit,pos,'
-                                                                                           'lemma,parse,ner',
-                                                                             'timeout': '50000'})
-            try:
-                processed_json = json.loads(processed_json)
-                for parsed in processed_json['sentences']:
-                    sentence_words = [token['word'] for token in parsed['tokens']]
-                    sentence_pos_tags = [token['pos'] for token in parsed['tokens']]
-                    sentence_lemma = [token['lemma'] for token in parsed['tokens']]
-                    sentence_ner = [token['ner'] for token in parsed['tokens']]
-                    words.extend(sentence_words)
-                    pos_tags.extend(sentence_pos_tags)
-                    lemma.extend(sentence_lemma)
-                    ner.extend(iob_format(sentence_ner))
-
-                    start = next_start
-                    end = start + len(sentence_words)
-                    next_start = end
-                    text = ' '.join(sentence_words)
-                    texts.append(text)
-                    sentences.append({Keys.START.value: start, Keys.END.value: end, Keys.TEXT.value: text})
-
-                    chunks.append(self.chunking(sentence_words, sentence_pos_tags))
-                    penn_treebanks.append(re.sub(r'\n|\s+', ' ', parsed['parse']))
-                    dependency_parsing.append(
-                        ['{}/dep={}/gov={}'.format(dep['dep'], dep['dependent'] - 1, dep['governor'] - 1)
-                         for dep in parsed['enhancedPlusPlusDependencies']])
-
-            # failed to parse text, try to increase memory
-            except json.decoder.JSONDecodeError:
-                self.log.warning("CoreNLP could not parse the input text. Try increasing timeout and heap memory")
-                raise ValueError("CoreNLP could not parse the input text. Try increasing timeout and heap memory")
-
-        return {Keys.SENTENCES.value: sentences, Keys.TEXT.value: ' '.join(texts), Keys.WORDS.value: words,
-                Keys.POS_TAGS.value: pos_tags, Keys.LEMMA.value: lemma, Keys.NER.value: ner,
-                Keys.PENN_TREEBANK.value: penn_treebanks, Keys.DEPENDENCY_PARSING.value: dependency_parsing,
-                Keys.CHUNKS.value: chunks}
+    def text_parsing(self, text):
+        """
+        :param text:  input text, with its hyphens padded
+        :return: the dictionary of features of advanced_parsing
+        """
+        features = self.empty_features()
+
+        # big texts lead to error - so we annotate chunks of consecutive sentences
+        for offset, chunk in self.split_text(text):
+            for chunk_offset, positions, parsed_sentences in self.annotate_chunk(offset, chunk):
+                for parsed in parsed_sentences:
+                    self.add_sentence(features, parsed, chunk_offset, positions)
+        features[Keys.TEXT.value] = ' '.join(sentence[Keys.TEXT.value] for sentence in features[Keys.SENTENCES.value])
+        return features
 
+    def tokenized_parsing(self, tokenized_sentences):
+        """
+        extract text-based features using coreNLP based on already tokenized sentences. The tokens are sent
+        separated by whitespace, one sentence per line, so the words and the sentences are kept as they are.
+        :param tokenized_sentences:   list of sentences, each one a list of words
+        :return: a dictionary of features, None if CoreNLP did not keep the words
+        """
+        tokenized_sentences = [sentence for sentence in tokenized_sentences if sentence]
+        if any(not word or len(word.split()) != 1 for sentence in tokenized_sentences for word in sentence):
+            return None
+        text = '\n'.join(' '.join(sentence) for sentence in tokenized_sentences)
+        return self.reuse("tokens\n" + text, lambda: self.sentences_parsing(tokenized_sentences))
+
+    def sentences_parsing(self, tokenized_sentences):
+        """
+        :param tokenized_sentences:   list of non empty sentences, each one a list of words without whitespace
+        :return: the dictionary of features of tokenized_parsing, None if CoreNLP did not keep the words
+        """
+        parsed_sentences = self.annotate_sentences(tokenized_sentences)
+        if len(parsed_sentences) != len(tokenized_sentences) or \
+                any(len(parsed['tokens']) != len(sentence) for parsed, sentence in zip(parsed_sentences, tokenized_sentences)):
+            return None
+        features = self.empty_features()
+        for parsed, sentence in zip(parsed_sentences, tokenized_sentences):
+            self.add_sentence(features, parsed, sentence_words=sentence)
+        features[Keys.TEXT.value] = ' '.join(sentence[Keys.TEXT.value] for sentence in features[Keys.SENTENCES.value])
+        return features
+
+    def parse(self, tokenized_sentences, text):
+        """
+        Parse an instance. In pre-tokenized mode the tokens of the dataset are annotated as they are,
+        otherwise, or if CoreNLP did not keep the tokens, the text is annotated.
+        :param tokenized_sentences:   the sentences of the dataset, each one a list of words
+        :param text:                  the text of the instance, as expected by advanced_parsing
+        :return: the dictionary of features, and whether its words are the words of the dataset
+        """
+        if self.pretokenized:
+            parsing = self.tokenized_parsing(tokenized_sentences)
+            if parsing is not None:
+                return parsing, True
+            self.log.warning("CoreNLP did not keep the tokens of the instance, parsing its text instead")
+        return self.advanced_parsing(text), False
+
+    def find_span(self, start, end, text, words, tokenized):
+        """
+        :param tokenized:   whether the words are the words of the dataset, in which case the span is kept as it is
+        :return:            a dictionary with the starting and the ending indices of the span in the words
+        """
+        if tokenized:
+            return {Keys.START.value: start, Keys.END.value: end}
+        return self.search_text_in_list(start, end, text, words)
+
+    def enable_pretokenized(self):
+        """
+        Annotate the tokens of the datasets that are already tokenized (RAMS, ACE and M2E2) as they are,
+        instead of re-tokenizing their text and searching their spans in the new words
+        :return: None
+        """
+        self.pretokenized = True
+
+    def enable_validation(self, validator, rejects_path):
+        """
+        Validate the instances before they are stored; invalid instances are stored in the rejects path
+        :param validator:       a ValidateTransformation
+        :param rejects_path:    path to store the invalid instances
+        :return: None
+        """
+        self.validator = validator
+        self.rejects_path = rejects_path
+
+    def enable_memory_profiling(self, profiler):
+        """
+        Take memory snapshots at the stage boundaries of the transformation and every N stored instances
+        :param profiler:    a MemoryProfiler
+        :return: None
+        """
+        self.profiler = profiler
+
+    def memory_checkpoint(self, stage):
+        if self.profiler is not None:
+            self.profiler.checkpoint(stage)
+
+    def write_instances(self, new_instances, output_path):
+        """
+        Store a batch of instances. If validation is enabled, the instances that fail
+        the validation are stored in the rejects path instead of the output path.
+        :param new_instances:   list of instances
+        :param output_path:     output path
+        :return: None
+        """
+        batch_size = len(new_instances)
+        if self.validator is not None:
+            valid = []
+            rejected = []
+            for instance in new_instances:
+                failures = self.validator.check_parsing(instance)
+                if failures:
+                    self.log.warning("Instance '" + instance[Keys.ID.value] + "' failed validation: " + "; ".join(failures))
+                    rejected.append(instance)
+                else:
+                    valid.append(instance)
+            if rejected:
+                with timing.stages.time("write"):
+                    utilities.write_jsons(rejected, self.rejects_path)
+                self.rejected += len(rejected)
+            new_instances = valid
+        with timing.stages.time("write"):
+            utilities.write_jsons(new_instances, output_path)
+        if self.profiler is not None:
+            self.profiler.count(batch_size)
+
+    @timing.timed("chunking")
     def chunking(self, words, tags):
         """
         Produce the chunks of the list of words
@@ -112,16 +383,192 @@ class Transformer:
         s_chunks = self.chunker.parseIOB(zipped)
         return [c[1:] for c in s_chunks]
 
-    @abstractmethod
     def transform(self, output_path):
+        """
+        Transform dataset into the common schema and store the results
+        in the output path. Storing is performed in batches.
+        Actions:
+            - Parse text and produce text-based features
+            - Parse entities and adjust them to the new list of words
+            - Parse event triples and adjust them to the new list of words
+        :param output_path: output path
+        :return:  None
+        """
+        self.log.info("Starting the transformation of " + self.origin)
+        start_time = time.monotonic()
+        self.pipeline(self.read_instances(), output_path)
+        self.log.info("Transformation of " + self.origin + " completed in " +
+                      str(round(time.monotonic() - start_time, 3)) + "sec")
+
+    def pipeline(self, instances, output_path):
+        """
+        Transform the instances in a pipeline of stages connected by bounded queues: a reader submits the instances
+        to a pool of annotation workers, which wait for CoreNLP, an assembler builds the new instances from the
+        annotations, in the order of the dataset, and the current thread writes them in batches. The stages overlap,
+        so the CPU work is done while waiting for CoreNLP, and a stage blocks when the queue to the next one is full,
+        so at most queue_size instances are held in memory.
+        :param instances:   iterable of the instances of the dataset
+        :param output_path: output path
+        :return: None
+        """
+        # the annotations of the instances, as futures in the order of the dataset, and the new instances
+        annotations = queue.Queue(self.queue_size)
+        assembled = queue.Queue(self.queue_size)
+        stopped = threading.Event()
+        errors = []
+
+        def put(stage_queue, item):
+            while not stopped.is_set():
+                try:
+                    stage_queue.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def get(stage_queue):
+            while not stopped.is_set():
+                try:
+                    return stage_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            return END
+
+        def stage(target):
+            # a failed stage stops the pipeline and its error is raised by the writer
+            def run():
+                try:
+                    target()
+                except BaseException as e:
+                    errors.append(e)
+                    stopped.set()
+            thread = threading.Thread(target=run, daemon=True)
+            thread.start()
+            return thread
+
+        def annotate(instance):
+            try:
+                return self.annotate_instance(instance)
+            except ValueError:
+                return None
+
+        executor = self.executor if self.executor is not None else ThreadPoolExecutor(self.annotation_workers)
+
+        def dispatch(window):
+            # longest processing time first: the most expensive instances of the window are submitted first, so they
+            # do not end up alone at its tail, while their annotations are queued in the order of the dataset
+            futures = {i: executor.submit(annotate, instance)
+                       for i, instance in sorted(window, key=lambda item: -self.estimate_cost(item[1]))}
+            for i, instance in window:
+                put(annotations, (i, instance, futures[i]))
+
+        # with a single worker the order of the requests makes no difference
+        window_size = self.queue_size if self.executor is not None or self.annotation_workers > 1 else 1
+
+        def read():
+            print()
+            window = []
+            for i, instance in enumerate(tqdm(instances), self.id_offset):
+                if stopped.is_set():
+                    return
+                window.append((i, instance))
+                if len(window) == window_size:
+                    dispatch(window)
+                    window = []
+            dispatch(window)
+            put(annotations, END)
+
+        def assemble():
+            for i, instance, annotation in iter(lambda: get(annotations), END):
+                annotation = annotation.result()
+                if annotation is None:
+                    self.unannotated += 1
+                    put(assembled, None)
+                else:
+                    put(assembled, self.assemble_instance(i, instance, annotation))
+            put(assembled, END)
+
+        threads = [stage(read), stage(assemble)]
+        try:
+            new_instances = []
+            for new_instance in iter(lambda: get(assembled), END):
+                if new_instance is None:
+                    continue
+                new_instances.append(new_instance)
+                # write results if we reached batch size
+                if len(new_instances) == self.batch_size:
+                    self.write_instances(new_instances, output_path)
+                    new_instances = []
+            if not errors:
+                self.write_instances(new_instances, output_path)
+        except BaseException:
+            stopped.set()
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+            if executor is not self.executor:
+                executor.shutdown(cancel_futures=True)
+        if errors:
+            raise errors[0]
+
+    @staticmethod
+    def annotation_cost(characters, sentences):
+        """
+        :return: the estimated cost of annotating a text of the given characters and sentences
+        """
+        return characters + SENTENCE_COST * sentences
+
+    def estimate_cost(self, instance):
+        """
+        :param instance:    an instance of the dataset
+        :return: the estimated cost of annotating the instance, the instances of a window are annotated in
+                 descending order of cost
+        """
+        return 0
+
+    @abstractmethod
+    def read_instances(self):
+        """
+        :return: iterable of the instances of the dataset
+        """
         pass
 
+    @abstractmethod
+    def annotate_instance(self, instance):
+        """
+        Annotate the text of an instance with CoreNLP
+        :param instance:    an instance of the dataset
+        :return: the annotation of the instance, passed to assemble_instance
+        :raise ValueError: if CoreNLP failed to annotate the instance
+        """
+        pass
+
+    @abstractmethod
+    def assemble_instance(self, i, instance, annotation):
+        """
+        Build the instance of the common schema
+        :param i:           index of the instance in the dataset
+        :param instance:    the instance of the dataset
+        :param annotation:  its annotation, as returned by annotate_instance
+        :return: the new instance, None if it is skipped
+        """
+        pass
+
+    @timing.timed("entity-typing")
+    def get_entity_type(self, ner):
+        """
+        :param ner: the NER tags of the words of an entity
+        :return:    the most frequent type of the tags
+        """
+        return utilities.most_frequent(ner)
+
     def get_event_type(self, event_type):
         if self.disable_mapping:
             return event_type
         else:
             return self.events_mapper[event_type]
 
+    @timing.timed("alignment")
     def search_text_in_list(self, initial_start, initial_end, text, parsed_words):
         """
                 This function finds the pointers of text inside the parsed list of words.
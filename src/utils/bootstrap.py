@@ -0,0 +1,85 @@
+import numpy as np
+
+
+def f1_scores(tp, predicted, gold):
+    """
+    Vectorized precision, recall and F1, in the same scale as Evaluator's scores
+    :param tp:          array of true positives
+    :param predicted:   array of predicted counts
+    :param gold:        array of golden counts
+    :return:            arrays of precision, recall and F1
+    """
+    tp, predicted, gold = [np.asarray(a, dtype=np.float64) for a in (tp, predicted, gold)]
+    precision = np.divide(100.0 * tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+    recall = np.divide(100.0 * tp, gold, out=np.zeros_like(tp), where=gold > 0)
+    total = precision + recall
+    f1 = np.divide(2 * precision * recall, total, out=np.zeros_like(tp), where=total > 0)
+    return precision, recall, f1
+
+
+def resample_totals(columns, n_resamples=1000, seed=None, batch_size=1000):
+    """
+    Bootstrap the column-wise totals of per-instance count vectors.
+    Count vectors take only a few distinct values, so instead of materializing an index matrix of
+    n_resamples x n_instances, the instances are grouped into their distinct rows and each resample
+    is drawn as a multinomial over them. This is equivalent to resampling the instances with replacement,
+    but it costs O(n_resamples x distinct rows) instead of O(n_resamples x n_instances).
+
+    :param columns:     list of equally sized per-instance count vectors
+    :param n_resamples: number of bootstrap resamples
+    :param seed:        seed of the random generator
+    :param batch_size:  number of resamples to draw at once, bounds the memory
+    :return:            matrix n_resamples x len(columns) with the totals of each resample
+    """
+    matrix = np.stack([np.asarray(c, dtype=np.int64) for c in columns], axis=1)
+    if len(matrix) == 0:
+        return np.zeros((n_resamples, len(columns)), dtype=np.int64)
+    rows, frequencies = np.unique(matrix, axis=0, return_counts=True)
+    probabilities = frequencies / frequencies.sum()
+
+    rng = np.random.default_rng(seed)
+    totals = np.empty((n_resamples, len(columns)), dtype=np.int64)
+    for start in range(0, n_resamples, batch_size):
+        size = min(batch_size, n_resamples - start)
+        weights = rng.multinomial(len(matrix), probabilities, size=size)
+        totals[start: start + size] = weights @ rows
+    return totals
+
+
+def confidence_interval(tp, predicted, gold, n_resamples=1000, confidence=0.95, seed=None):
+    """
+    Percentile bootstrap confidence intervals of precision, recall and F1
+    :return: a dictionary from precision/recall/f1 to their (low, high) bounds
+    """
+    totals = resample_totals([tp, predicted, gold], n_resamples, seed)
+    scores = f1_scores(totals[:, 0], totals[:, 1], totals[:, 2])
+    alpha = 100 * (1 - confidence) / 2
+    return {name: tuple(float(v) for v in np.percentile(values, [alpha, 100 - alpha]))
+            for name, values in zip(("precision", "recall", "f1"), scores)}
+
+
+def paired_test(counts_a, counts_b, n_resamples=1000, confidence=0.95, seed=None):
+    """
+    Paired bootstrap test between the F1 of two systems evaluated on the same instances.
+    Both systems are resampled with the same instances, so the difference accounts for the
+    correlation between them.
+
+    :param counts_a:    (tp, predicted, gold) per-instance vectors of the first system
+    :param counts_b:    (tp, predicted, gold) per-instance vectors of the second system
+    :return:            dictionary with the observed F1 difference (b - a), its confidence interval
+                        and the p-value of the observed sign
+    """
+    if len(counts_a[0]) != len(counts_b[0]):
+        raise ValueError("Paired bootstrap requires both systems to be evaluated on the same instances")
+    observed = f1_scores(*[np.sum(c) for c in counts_b])[2] - f1_scores(*[np.sum(c) for c in counts_a])[2]
+
+    totals = resample_totals(list(counts_a) + list(counts_b), n_resamples, seed)
+    f1_a = f1_scores(totals[:, 0], totals[:, 1], totals[:, 2])[2]
+    f1_b = f1_scores(totals[:, 3], totals[:, 4], totals[:, 5])[2]
+    delta = f1_b - f1_a
+
+    alpha = 100 * (1 - confidence) / 2
+    p_value = np.mean(delta <= 0) if observed > 0 else np.mean(delta >= 0)
+    return {"delta": float(observed),
+            "interval": tuple(float(v) for v in np.percentile(delta, [alpha, 100 - alpha])),
+            "p-value": float(p_value)}
@@ -0,0 +1,103 @@
+import itertools
+import json
+import logging
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+
+log = logging.getLogger("TRANSFORMER")
+
+WARM_UP_TEXT = "The warm-up request loads the models of CoreNLP. It is not part of the transformation."
+
+
+class CoreNLPServers:
+    """
+    Client of one or more running CoreNLP servers, with the annotate method of the StanfordCoreNLP client.
+    Requests are sent to the servers in turn over persistent HTTP connections: every thread keeps one session
+    per server, so the connections are reused instead of opened and closed for every request.
+    """
+
+    def __init__(self, urls, pool_size=4):
+        """
+        :param urls:        URLs of the servers, e.g. http://localhost:9000
+        :param pool_size:   connections kept alive per server and thread
+        """
+        self.urls = [url.rstrip("/") for url in urls]
+        self.pool_size = pool_size
+        self.turns = itertools.cycle(self.urls)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def session(self, url):
+        sessions = getattr(self.local, "sessions", None)
+        if sessions is None:
+            sessions = self.local.sessions = {}
+        if url not in sessions:
+            session = requests.Session()
+            session.mount(url, HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size))
+            sessions[url] = session
+        return sessions[url]
+
+    def next_url(self):
+        with self.lock:
+            return next(self.turns)
+
+    def annotate(self, text, properties=None, url=None):
+        """
+        :param url: the server to send the request to, default is the next server in turn
+        :return: the body of the response, as the StanfordCoreNLP client returns it
+        """
+        properties = properties if properties is not None else {}
+        url = url if url is not None else self.next_url()
+        # the connection is dropped if the server does not respond within its own deadline
+        read_timeout = int(properties.get("timeout", 60000)) / 1000 + 10
+        r = self.session(url).post(url, params={'properties': json.dumps(properties)}, data=text.encode('utf-8'),
+                                   timeout=(5, read_timeout))
+        return r.text
+
+    def ready(self):
+        """
+        :return: the URLs of the servers that respond to the readiness probe of CoreNLP
+        """
+        ready = []
+        for url in self.urls:
+            try:
+                if self.session(url).get(url + "/ready", timeout=5).status_code == 200:
+                    ready.append(url)
+            except RequestException:
+                pass
+        return ready
+
+    def use(self, urls):
+        """
+        Send the requests only to the given servers
+        """
+        with self.lock:
+            self.urls = list(urls)
+            self.turns = itertools.cycle(self.urls)
+
+    def close(self):
+        for session in getattr(self.local, "sessions", {}).values():
+            session.close()
+
+
+def warm_up(client, properties):
+    """
+    Annotate a short text with every server of the client, so their models are loaded before the timed run
+    :param client:      a CoreNLPServers or a StanfordCoreNLP client
+    :param properties:  properties of the request, with the annotators of the transformation
+    :return: the seconds it took
+    """
+    start = time.perf_counter()
+    if isinstance(client, CoreNLPServers):
+        responses = [client.annotate(WARM_UP_TEXT, properties, url) for url in client.urls]
+    else:
+        responses = [client.annotate(WARM_UP_TEXT, properties=properties)]
+    for response in responses:
+        try:
+            json.loads(response)
+        except ValueError:
+            log.warning("CoreNLP failed the warm-up request: " + response[:200])
+    return time.perf_counter() - start
@@ -0,0 +1,73 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class ParsingCache:
+    """
+    The parsings of the texts annotated in a run, keyed by a hash of the text, so identical texts of any of the
+    datasets are annotated and parsed once. A text that another worker is still annotating is waited for instead
+    of annotated again. At most size parsings are kept, the least recently used are evicted first, so the memory
+    is bounded; the duplicates are found only among the texts whose parsing is kept, so a duplicate whose earlier
+    copy was evicted is annotated again and not counted.
+    """
+
+    def __init__(self, size=10000):
+        """
+        :param size:    number of parsings kept
+        """
+        self.size = size
+        self.parsings = OrderedDict()
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(text):
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+    def count(self, origin, counter):
+        counters = self.counters.setdefault(origin, {"texts": 0, "duplicates": 0})
+        counters[counter] += 1
+
+    def parse(self, text, parse, origin=None):
+        """
+        Parse the text, or reuse the parsing of an identical text
+        :param text:    the text as it is annotated, along with anything else its parsing depends on
+        :param parse:   function that returns the parsing of the text
+        :param origin:  the dataset of the text, the duplicates are counted per dataset
+        :return: the parsing, shared by all the identical texts, so it must not be modified
+        """
+        key = self.key(text)
+        owner = False
+        with self.lock:
+            self.count(origin, "texts")
+            parsing = self.parsings.get(key)
+            if parsing is not None:
+                self.parsings.move_to_end(key)
+                self.count(origin, "duplicates")
+            else:
+                parsing = Future()
+                owner = True
+                self.parsings[key] = parsing
+                if len(self.parsings) > self.size:
+                    self.parsings.popitem(last=False)
+        if owner:
+            try:
+                parsing.set_result(parse())
+            except BaseException as e:
+                # failures are not kept, the next copy of the text is annotated again
+                with self.lock:
+                    if self.parsings.get(key) is parsing:
+                        del self.parsings[key]
+                parsing.set_exception(e)
+                raise
+        return parsing.result()
+
+    def summary(self):
+        """
+        :return: the number of texts and of duplicates, which reused a parsing, per dataset
+        """
+        with self.lock:
+            return [str(origin) + ": " + str(counters["duplicates"]) + " duplicates of " + str(counters["texts"]) +
+                    " texts" for origin, counters in self.counters.items()]
@@ -0,0 +1,76 @@
+import bisect
+
+
+class IntervalIndex:
+    """
+    Static index over the [start, end) token spans of a single instance.
+    Spans are sorted once by their start, so exact lookups are answered by a dictionary
+    and overlap lookups by a binary search bounded by the longest indexed span.
+    Spans without a start or an end are not indexed, and spans without them never match.
+    """
+
+    def __init__(self, spans):
+        """
+        :param spans:   list of (start, end, payload) triples
+        """
+        self.spans = sorted([span for span in spans if span[0] is not None and span[1] is not None],
+                            key=lambda span: (span[0], span[1]))
+        self.starts = [span[0] for span in self.spans]
+        self.max_length = max([end - start for start, end, _ in self.spans], default=0)
+        self.positions = {}
+        for i, (start, end, _) in enumerate(self.spans):
+            self.positions.setdefault((start, end), []).append(i)
+
+    def __len__(self):
+        return len(self.spans)
+
+    def payload(self, position):
+        return self.spans[position][2]
+
+    def exact(self, start, end):
+        """
+        :return: the positions of the spans with exactly the same offsets
+        """
+        return self.positions.get((start, end), [])
+
+    def overlapping(self, start, end):
+        """
+        :return: the positions of the spans that share at least one token with [start, end)
+        """
+        lo = bisect.bisect_left(self.starts, start - self.max_length + 1)
+        hi = bisect.bisect_left(self.starts, end)
+        return [i for i in range(lo, hi) if self.spans[i][1] > start]
+
+    def match(self, start, end, used, accept=None, overlap=False):
+        """
+        Find an unused span that matches [start, end) and mark it as used, so that each
+        indexed span can be matched at most once.
+        An exact match is always preferred; if overlap is enabled, the span sharing
+        the most tokens is picked instead.
+
+        :param start:       start of the span to match
+        :param end:         end of the span to match
+        :param used:        set of the positions that have already been matched
+        :param accept:      optional predicate on the payload of the candidate span
+        :param overlap:     accept overlapping spans as well
+        :return:            the position of the matched span, None if nothing matched
+        """
+        if start is None or end is None:
+            return None
+        for i in self.exact(start, end):
+            if i not in used and (accept is None or accept(self.spans[i][2])):
+                used.add(i)
+                return i
+        if not overlap:
+            return None
+
+        best, best_overlap = None, 0
+        for i in self.overlapping(start, end):
+            if i in used or (accept is not None and not accept(self.spans[i][2])):
+                continue
+            shared = min(end, self.spans[i][1]) - max(start, self.spans[i][0])
+            if shared > best_overlap:
+                best, best_overlap = i, shared
+        if best is not None:
+            used.add(best)
+        return best
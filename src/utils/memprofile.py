@@ -0,0 +1,159 @@
+import json
+import linecache
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+# frames of the profiler itself and of the import machinery are not allocation sites of the pipeline
+IGNORED_FRAMES = (tracemalloc.Filter(False, tracemalloc.__file__),
+                  tracemalloc.Filter(False, linecache.__file__),
+                  tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                  tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+                  tracemalloc.Filter(False, "<unknown>"))
+
+
+def peak_rss():
+    """
+    :return: peak resident set size of the process in MB, since the process started; it never goes down,
+             so it is not the peak of a single transformer
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes in macOS, kilobytes in Linux
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def current_rss():
+    """
+    :return: resident set size of the process in MB, None where /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemoryProfiler:
+    """
+    Traces the allocations of the transformation with tracemalloc. Snapshots are taken at the boundaries of the
+    stages of each transformer and every N instances, and for each transformer it reports the peak of the traced
+    memory, the peak RSS while it ran, sampled by a background thread, and the top allocation sites of its largest
+    snapshot. A transformer that runs more than once, e.g. on multiple shards, accumulates a single profile.
+    """
+
+    def __init__(self, every=1000, top=10, frames=1, interval=0.1):
+        """
+        :param every:       take a snapshot every N stored instances
+        :param top:         number of allocation sites to report
+        :param frames:      number of frames stored per allocation, more frames cost more memory and time
+        :param interval:    seconds between the samples of the RSS
+        """
+        self.every = every
+        self.top = top
+        self.frames = frames
+        self.interval = interval
+        self.profiles = {}
+        self.current = None
+        self.sampling = None
+        self.sampler = None
+
+    def start(self, name):
+        """
+        Start profiling a transformer
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        if name not in self.profiles:
+            self.profiles[name] = {"name": name, "started": time.monotonic(), "runs": 0, "instances": 0,
+                                   "checkpoints": [], "peak traced (MB)": 0.0, "peak RSS (MB)": None,
+                                   "largest": None, "largest size": -1}
+        self.current = self.profiles[name]
+        self.current["runs"] += 1
+        self.sampling = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, args=(self.current, self.sampling), daemon=True)
+        self.sampler.start()
+        self.checkpoint("start")
+
+    def sample(self, profile, stopped):
+        while not stopped.wait(self.interval):
+            self.sample_rss(profile)
+
+    @staticmethod
+    def sample_rss(profile):
+        """
+        Update the peak RSS of the profile with the current RSS
+        :return: the current RSS in MB, None where it is not available
+        """
+        rss = current_rss()
+        if rss is not None and (profile["peak RSS (MB)"] is None or rss > profile["peak RSS (MB)"]):
+            profile["peak RSS (MB)"] = round(rss, 1)
+        return rss
+
+    def checkpoint(self, stage):
+        """
+        Take a snapshot at a stage boundary of the current transformer
+        """
+        if self.current is None:
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces(IGNORED_FRAMES)
+        traced, peak = tracemalloc.get_traced_memory()
+        self.current["checkpoints"].append({"stage": stage, "instances": self.current["instances"],
+                                            "seconds": round(time.monotonic() - self.current["started"], 3),
+                                            "traced (MB)": round(traced / 2 ** 20, 3),
+                                            "peak traced (MB)": round(peak / 2 ** 20, 3),
+                                            "RSS (MB)": self.sample_rss(self.current),
+                                            "process peak RSS (MB)": round(peak_rss(), 1)})
+        self.current["peak traced (MB)"] = max(self.current["peak traced (MB)"], round(peak / 2 ** 20, 3))
+        if traced > self.current["largest size"]:
+            # only the allocation sites of the largest snapshot are kept
+            self.current["largest"] = [self.site(statistic) for statistic in snapshot.statistics("lineno")[:self.top]]
+            self.current["largest size"] = traced
+
+    def count(self, instances):
+        """
+        Count stored instances and take a snapshot every N of them
+        """
+        if self.current is None:
+            return
+        before = self.current["instances"] // self.every
+        self.current["instances"] += instances
+        if self.current["instances"] // self.every > before:
+            self.checkpoint("instances")
+
+    def stop(self):
+        """
+        Stop profiling the current transformer
+        """
+        if self.current is None:
+            return
+        self.checkpoint("end")
+        self.sampling.set()
+        self.sampler.join()
+        self.current = None
+
+    @staticmethod
+    def site(statistic):
+        frame = statistic.traceback[0]
+        return {"file": frame.filename, "line": frame.lineno,
+                "code": linecache.getline(frame.filename, frame.lineno).strip(),
+                "size (MB)": round(statistic.size / 2 ** 20, 3), "allocations": statistic.count}
+
+    def summary(self):
+        return {name: {"runs": profile["runs"],
+                       "instances": profile["instances"],
+                       "peak traced (MB)": profile["peak traced (MB)"],
+                       "peak RSS (MB)": profile["peak RSS (MB)"],
+                       "process peak RSS (MB)": max(c["process peak RSS (MB)"] for c in profile["checkpoints"]),
+                       "top allocation sites": profile["largest"],
+                       "checkpoints": profile["checkpoints"]}
+                for name, profile in self.profiles.items()}
+
+    def write_summary(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        tracemalloc.stop()
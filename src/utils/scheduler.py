@@ -0,0 +1,168 @@
+import json
+import logging
+import random
+import threading
+import time
+from requests.exceptions import RequestException, Timeout
+from . import timing
+
+log = logging.getLogger("TRANSFORMER")
+
+
+class AnnotationError(ValueError):
+    """
+    CoreNLP failed to annotate a text. timed_out is set if CoreNLP gave up on the text within its deadline,
+    in which case smaller texts may succeed where retrying the same text would not.
+    """
+
+    def __init__(self, message, timed_out=False):
+        super().__init__(message)
+        self.timed_out = timed_out
+
+
+class CircuitBreaker:
+    """
+    Opens after a number of consecutive failed requests and holds back all the submissions for a cooldown,
+    so an overloaded server is not flooded with retries. After the cooldown the breaker is half-open: a single
+    request, the probe, is let through while the rest keep waiting; if it fails the breaker opens again,
+    otherwise it closes and lets all of them through.
+    """
+
+    def __init__(self, threshold=5, cooldown=30.0):
+        """
+        :param threshold:   consecutive failures that open the breaker
+        :param cooldown:    seconds the breaker stays open
+        """
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened = None
+        # when the probe was let through, None if the breaker is not half-open
+        self.probing = None
+        self.condition = threading.Condition()
+
+    def wait(self):
+        """
+        Block while the breaker is open, or half-open with a probe in flight
+        """
+        with self.condition:
+            if self.opened is None:
+                return
+            log.warning("CoreNLP is overloaded, pausing the requests until a request succeeds after the cooldown of " +
+                        str(self.cooldown) + " sec")
+            with timing.stages.time("circuit-breaker"):
+                while self.opened is not None:
+                    now = time.monotonic()
+                    # a probe that has not reported for a cooldown, e.g. its request raised unexpectedly, is replaced
+                    since = self.opened if self.probing is None else self.probing
+                    remaining = since + self.cooldown - now
+                    if remaining <= 0:
+                        self.probing = now
+                        return
+                    self.condition.wait(remaining)
+
+    def success(self):
+        with self.condition:
+            self.failures = 0
+            self.opened = None
+            self.probing = None
+            self.condition.notify_all()
+
+    def failure(self):
+        with self.condition:
+            self.failures += 1
+            if self.probing is not None or self.failures >= self.threshold:
+                self.opened = time.monotonic()
+                self.probing = None
+                self.condition.notify_all()
+
+
+class RequestScheduler:
+    """
+    Submits the requests of the transformers to CoreNLP. Every request gets a deadline proportional to the
+    length of its text, failed requests are retried with exponential backoff, and a circuit breaker pauses the
+    submissions while the server keeps failing. Requests that time out are not retried, the caller
+    is expected to split their text instead.
+    """
+
+    # the deadline grows by timeout seconds every CHARACTERS characters
+    CHARACTERS = 1000
+    MAX_BACKOFF = 60.0
+
+    def __init__(self, client, timeout=10, retries=3, backoff=1.0, breaker=None):
+        """
+        :param client:      a StanfordCoreNLP client, or any object with the same annotate method
+        :param timeout:     deadline in seconds of a request of up to CHARACTERS characters
+        :param retries:     number of retries of a failed request
+        :param backoff:     seconds before the first retry, doubled on every retry
+        :param breaker:     a CircuitBreaker, shared by the schedulers of the same server
+        """
+        self.client = client
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.counters = {"requests": 0, "retries": 0, "timeouts": 0, "failures": 0}
+        self.counters_lock = threading.Lock()
+
+    def count(self, counter):
+        with self.counters_lock:
+            self.counters[counter] += 1
+
+    def deadline(self, text):
+        """
+        :return: the deadline of the request in milliseconds, as CoreNLP expects it
+        """
+        return int(1000 * self.timeout * max(1.0, len(text) / self.CHARACTERS))
+
+    def annotate(self, text, properties):
+        """
+        Annotate the text with CoreNLP
+        :param text:        input text
+        :param properties:  properties of the request
+        :return: the parsed sentences
+        :raise AnnotationError: if the request timed out or still failed after the retries
+        """
+        properties = dict(properties, timeout=str(self.deadline(text)))
+        failure = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                self.count("retries")
+                delay = min(self.backoff * 2 ** (attempt - 1), self.MAX_BACKOFF)
+                # jitter keeps concurrent retries from hitting the server at the same time
+                with timing.stages.time("backoff"):
+                    time.sleep(random.uniform(delay / 2, delay))
+            self.breaker.wait()
+            self.count("requests")
+            try:
+                with timing.stages.time("corenlp"):
+                    response = self.client.annotate(text, properties=properties)
+            except Timeout:
+                # the server did not respond within the deadline of the text, retrying the same text would not help
+                self.breaker.failure()
+                self.count("timeouts")
+                raise AnnotationError("CoreNLP did not respond within the deadline of a text of " + str(len(text)) +
+                                      " characters", True)
+            except RequestException as e:
+                failure = str(e)
+                self.breaker.failure()
+                log.warning("CoreNLP request failed (attempt " + str(attempt + 1) + "): " + failure)
+                continue
+            try:
+                with timing.stages.time("json-decode"):
+                    sentences = json.loads(response)['sentences']
+                self.breaker.success()
+                return sentences
+            except (json.decoder.JSONDecodeError, KeyError, TypeError):
+                failure = str(response)[:200]
+                self.breaker.failure()
+            if "timed out" in failure.lower():
+                self.count("timeouts")
+                raise AnnotationError("CoreNLP timed out on a text of " + str(len(text)) + " characters", True)
+            log.warning("CoreNLP request failed (attempt " + str(attempt + 1) + "): " + failure)
+        self.count("failures")
+        raise AnnotationError("CoreNLP could not parse the input text: " + str(failure) +
+                              ". Try increasing timeout and heap memory")
+
+    def summary(self):
+        return ", ".join(name + ": " + str(value) for name, value in self.counters.items())
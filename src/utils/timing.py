@@ -0,0 +1,151 @@
+from contextlib import contextmanager
+from functools import wraps
+import bisect
+import json
+import os
+import threading
+import time
+
+# upper bounds, in seconds, of the buckets of the latency histograms
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+           float("inf"))
+
+
+class Stage:
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.buckets[bisect.bisect_left(BUCKETS, elapsed)] += 1
+
+    def to_dict(self):
+        cumulative = 0
+        histogram = {}
+        for bound, count in zip(BUCKETS, self.buckets):
+            cumulative += count
+            histogram["+Inf" if bound == float("inf") else str(bound)] = cumulative
+        return {"count": self.count, "seconds": round(self.total, 6),
+                "mean": round(self.total / self.count, 6) if self.count else 0.0,
+                "max": round(self.max, 6), "histogram": histogram}
+
+
+class Timings:
+    """
+    Cumulative time, number of calls and latency histogram of each stage of the pipeline.
+    Stages are timed with the `time` context manager or the `timed` decorator, and exported as JSON
+    or as a Prometheus textfile, at the end of the run and periodically while it runs.
+    Nothing is timed unless enabled, so the stages cost nothing when the timings are not needed.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.exporter = None
+        self.stopped = threading.Event()
+
+    def add(self, stage, elapsed):
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = Stage()
+            self.stages[stage].add(elapsed)
+
+    @contextmanager
+    def time(self, stage):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+            self.started = time.time()
+
+    def to_dict(self):
+        with self.lock:
+            return {"started": self.started, "elapsed": round(time.time() - self.started, 3),
+                    "stages": {name: stage.to_dict() for name, stage in sorted(self.stages.items())}}
+
+    def to_prometheus(self, prefix="unifier_stage"):
+        lines = ["# HELP " + prefix + "_seconds Time spent in each stage of the transformation",
+                 "# TYPE " + prefix + "_seconds histogram"]
+        for name, stage in self.to_dict()["stages"].items():
+            for bound, count in stage["histogram"].items():
+                lines.append(prefix + '_seconds_bucket{stage="' + name + '",le="' + bound + '"} ' + str(count))
+            lines.append(prefix + '_seconds_sum{stage="' + name + '"} ' + str(stage["seconds"]))
+            lines.append(prefix + '_seconds_count{stage="' + name + '"} ' + str(stage["count"]))
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """
+        Store the timings in path, as a Prometheus textfile if it ends with .prom, otherwise as JSON.
+        The file is replaced atomically, so collectors never read a partial export.
+        """
+        content = self.to_prometheus() if path.endswith(".prom") else json.dumps(self.to_dict(), indent=2)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def start_exporting(self, path, interval):
+        """
+        Export the timings in path every interval seconds, in a background thread
+        """
+        def export_periodically():
+            while not self.stopped.wait(interval):
+                self.export(path)
+
+        self.stopped.clear()
+        self.exporter = threading.Thread(target=export_periodically, daemon=True)
+        self.exporter.start()
+
+    def stop_exporting(self, path=None):
+        """
+        Stop the periodic export and, if a path is given, export the final timings
+        """
+        if self.exporter is not None:
+            self.stopped.set()
+            self.exporter.join()
+            self.exporter = None
+        if path is not None:
+            self.export(path)
+
+    def summary(self):
+        """
+        :return: the timings as lines of text, the slowest stage first
+        """
+        stages = sorted(self.to_dict()["stages"].items(), key=lambda item: -item[1]["seconds"])
+        return [name + ": " + str(stage["count"]) + " calls, " + str(round(stage["seconds"], 3)) + " sec, " +
+                str(round(1000 * stage["mean"], 3)) + " ms/call" for name, stage in stages]
+
+
+# the timings of the current process
+stages = Timings()
+
+
+def timed(stage):
+    """
+    Decorator that times every call of the function as the given stage, while the timings are enabled
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not stages.enabled:
+                return function(*args, **kwargs)
+            with stages.time(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
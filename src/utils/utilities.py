@@ -30,6 +30,13 @@ def read_jsonlines(path):
     return data
 
 
+def iterate_jsonlines(path):
+    with open(path) as json_file:
+        for inline_json in json_file:
+            if inline_json.strip():
+                yield json.loads(inline_json)
+
+
 def write_jsons(mappings, path):
     with open(path, 'a+') as json_file:
         for mapping in mappings:
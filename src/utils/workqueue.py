@@ -0,0 +1,162 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+STATUSES = ("pending", "leased", "done", "failed")
+
+
+def worker_name():
+    """
+    :return: a name that identifies the worker process across hosts
+    """
+    return socket.gethostname() + ":" + str(os.getpid())
+
+
+class WorkQueue:
+    """
+    A queue of shards stored in SQLite, shared by worker processes through a common filesystem.
+    A worker claims a pending shard by taking a lease on it and keeps renewing the lease while it transforms the
+    shard; shards whose lease expired, because their worker crashed, are claimed again by other workers.
+    The most expensive shards are claimed first, so no worker is left alone with a large shard at the end of the
+    run, but shards are kept in the order they were added, which is the order of the final merge.
+    """
+
+    def __init__(self, path, timeout=60):
+        """
+        :param path:    path to the SQLite database, created if it does not exist
+        :param timeout: seconds to wait for the lock of the database
+        """
+        self.path = path
+        # autocommit mode, transactions are opened explicitly
+        self.connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS shards (
+                                       id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                       dataset TEXT NOT NULL,
+                                       input TEXT NOT NULL,
+                                       output TEXT NOT NULL,
+                                       offset INTEGER NOT NULL,
+                                       cost REAL NOT NULL DEFAULT 0,
+                                       lease REAL NOT NULL,
+                                       max_attempts INTEGER NOT NULL,
+                                       status TEXT NOT NULL DEFAULT 'pending',
+                                       worker TEXT,
+                                       expires REAL,
+                                       attempts INTEGER NOT NULL DEFAULT 0,
+                                       instances INTEGER,
+                                       error TEXT)""")
+
+    def transaction(self, statements):
+        """
+        Run the statements in a transaction that holds the write lock of the database from its start,
+        so concurrent workers never claim the same shard
+        :param statements:  function that takes the connection and returns the result of the transaction
+        """
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self.connection)
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+            return result
+
+    def add(self, dataset, input_path, output_path, offset, cost=0, lease=600.0, max_attempts=3):
+        """
+        Add a shard to the queue
+        :param dataset:         the dataset of the shard, e.g. rams
+        :param input_path:      path to the instances of the shard
+        :param output_path:     path to store the transformed instances
+        :param offset:          index of the first instance of the shard in its dataset, so ids stay unique
+        :param cost:            estimated cost of transforming the shard
+        :param lease:           seconds a worker holds the shard without renewing its lease
+        :param max_attempts:    number of claims before the shard is marked as failed
+        """
+        self.transaction(lambda c: c.execute("INSERT INTO shards (dataset, input, output, offset, cost, lease, "
+                                             "max_attempts) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                             (dataset, input_path, output_path, offset, cost, lease, max_attempts)))
+
+    def claim(self, worker):
+        """
+        Lease the most expensive shard that is pending, or whose lease expired
+        :return: the shard as a dictionary, None if there is no shard to claim
+        """
+        def claim_shard(c):
+            now = time.time()
+            # shards of crashed workers that used up their attempts are failed
+            c.execute("UPDATE shards SET status = 'failed', error = 'lease expired' "
+                      "WHERE status = 'leased' AND expires < ? AND attempts >= max_attempts", (now,))
+            shard = c.execute("SELECT * FROM shards WHERE status = 'pending' OR (status = 'leased' AND expires < ?) "
+                              "ORDER BY cost DESC, id LIMIT 1", (now,)).fetchone()
+            if shard is None:
+                return None
+            c.execute("UPDATE shards SET status = 'leased', worker = ?, expires = ?, attempts = attempts + 1 "
+                      "WHERE id = ?", (worker, now + shard["lease"], shard["id"]))
+            return dict(shard, worker=worker, attempts=shard["attempts"] + 1)
+
+        return self.transaction(claim_shard)
+
+    def renew(self, shard_id, worker):
+        """
+        Extend the lease of a shard
+        :return: whether the worker still holds the shard
+        """
+        return self.transaction(lambda c: c.execute(
+            "UPDATE shards SET expires = ? + lease WHERE id = ? AND worker = ? AND status = 'leased'",
+            (time.time(), shard_id, worker)).rowcount == 1)
+
+    def complete(self, shard_id, worker, instances, store):
+        """
+        Mark a shard as done and store its output, if the worker still holds the shard
+        :param instances:   number of transformed instances
+        :param store:       function that moves the output of the worker to the output of the shard
+        :return: whether the shard was completed by this worker
+        """
+        def complete_shard(c):
+            updated = c.execute("UPDATE shards SET status = 'done', instances = ?, error = NULL "
+                                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                                (instances, shard_id, worker)).rowcount == 1
+            # the output is stored while the database is locked, so no other worker completes the shard meanwhile
+            if updated:
+                store()
+            return updated
+
+        return self.transaction(complete_shard)
+
+    def fail(self, shard_id, worker, error):
+        """
+        Release a shard that failed, to be claimed again until it uses up its attempts
+        """
+        self.transaction(lambda c: c.execute(
+            "UPDATE shards SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END, "
+            "error = ?, expires = NULL WHERE id = ? AND worker = ? AND status = 'leased'",
+            (error, shard_id, worker)))
+
+    def status(self):
+        """
+        :return: the number of shards and of transformed instances per status
+        """
+        counts = {status: {"shards": 0, "instances": 0} for status in STATUSES}
+        for row in self.connection.execute("SELECT status, COUNT(*), SUM(instances) FROM shards GROUP BY status"):
+            counts[row[0]] = {"shards": row[1], "instances": row[2] or 0}
+        return counts
+
+    def unfinished(self):
+        """
+        :return: the number of shards that are pending or leased
+        """
+        return self.connection.execute("SELECT COUNT(*) FROM shards "
+                                       "WHERE status IN ('pending', 'leased')").fetchone()[0]
+
+    def shards(self):
+        """
+        :return: all the shards, in the order of the merge
+        """
+        return [dict(row) for row in self.connection.execute("SELECT * FROM shards ORDER BY id")]
+
+    def close(self):
+        self.connection.close()
@@ -4,7 +4,11 @@ import argparse
 import logging
 import sys
 from tqdm import tqdm
+from functools import partial
+from multiprocessing import Pool
+import json
 import os
+import zlib
 
 log = logging.getLogger("VALIDATOR")
 log.setLevel(logging.DEBUG)
@@ -23,86 +27,301 @@ consoleER.terminator = ""
 log_root.addHandler(consoleER)
 
 
+# fields that every instance must have, in the detailed validation
+REQUIRED_FIELDS = [Keys.SENTENCES.value, Keys.TEXT.value, Keys.WORDS.value, Keys.LEMMA.value, Keys.POS_TAGS.value,
+                   Keys.NER.value, Keys.PENN_TREEBANK.value, Keys.DEPENDENCY_PARSING.value, Keys.CHUNKS.value]
+
+
+def pointers_match(text, start, end, words):
+    """
+    Check that the text is found in words[start:end]. Spans are compared as strings first,
+    and only if they differ, their similarity is computed.
+    """
+    new_text = ' '.join(words[start:end])
+    return new_text == text or utilities.string_similarity(new_text, text) >= 0.9
+
+
+class ValidationPlan:
+    """
+    The checks of ValidateTransformation compiled once for a validation mode: the required fields
+    and features are precomputed sets/tuples, and the span checks that apply are bound in a list,
+    so validating an instance runs only the checks it needs.
+    """
+
+    def __init__(self, detailed=True):
+        self.detailed = detailed
+        self.required = frozenset(REQUIRED_FIELDS) if detailed else frozenset()
+        self.word_features = (Keys.LEMMA.value, Keys.POS_TAGS.value, Keys.NER.value) if detailed else ()
+        self.sentence_features = (Keys.SENTENCES.value, Keys.PENN_TREEBANK.value, Keys.CHUNKS.value,
+                                  Keys.DEPENDENCY_PARSING.value) if detailed else ()
+        self.span_checks = [self.check_sentences] + ([self.check_entities] if detailed else []) + [self.check_events]
+
+    def check(self, parsing_dict):
+        """
+        :param parsing_dict:    the instance
+        :return: a list with the names of the failed checks, empty if the instance is valid
+        """
+        failures = []
+        try:
+            # test all fields exists
+            if not self.required.issubset(parsing_dict.keys()):
+                return ["fields: missing " + ", ".join(field for field in REQUIRED_FIELDS if field not in parsing_dict)]
+
+            words = parsing_dict[Keys.WORDS.value]
+            no_words = len(words)
+
+            # test word-centric features
+            if any(len(parsing_dict[feature]) != no_words for feature in self.word_features):
+                failures.append("word-centric features")
+
+            # test sentences-centric features
+            if self.sentence_features:
+                no_sentences = parsing_dict[Keys.NO_SENTENCES.value]
+                if any(len(parsing_dict[feature]) != no_sentences for feature in self.sentence_features):
+                    failures.append("sentence-centric features")
+
+            # test chunks
+            if no_words != sum(len(chunk) for chunk in parsing_dict[Keys.CHUNKS.value]):
+                failures.append("chunks")
+
+            for check in self.span_checks:
+                check(parsing_dict, words, failures)
+        except (KeyError, TypeError) as e:
+            failures.append("fields: malformed " + str(e))
+        return failures
+
+    def check_sentences(self, parsing_dict, words, failures):
+        for i, sentence in enumerate(parsing_dict[Keys.SENTENCES.value]):
+            if not pointers_match(sentence[Keys.TEXT.value], sentence[Keys.START.value], sentence[Keys.END.value],
+                                  words):
+                failures.append("sentence " + str(i))
+
+    def check_entities(self, parsing_dict, words, failures):
+        for entity in parsing_dict[Keys.ENTITIES_MENTIONED.value]:
+            if not pointers_match(entity[Keys.TEXT.value], entity[Keys.START.value], entity[Keys.END.value], words):
+                failures.append("entity '" + str(entity.get(Keys.ENTITY_ID.value)) + "'")
+
+    def check_events(self, parsing_dict, words, failures):
+        for i, event in enumerate(parsing_dict[Keys.EVENTS_MENTIONED.value]):
+            trigger = event[Keys.TRIGGER.value]
+            if not pointers_match(trigger[Keys.TEXT.value], trigger[Keys.START.value], trigger[Keys.END.value], words):
+                failures.append("event " + str(i) + " trigger")
+            for j, arg in enumerate(event[Keys.ARGUMENTS.value]):
+                if not pointers_match(arg[Keys.TEXT.value], arg[Keys.START.value], arg[Keys.END.value], words):
+                    failures.append("event " + str(i) + " argument " + str(j))
+
+
 class ValidateTransformation:
 
+    def __init__(self):
+        self.plans = {True: ValidationPlan(True), False: ValidationPlan(False)}
+
     def test_pointers(self, text, start, end, words):
         try:
-            new_text = ' '.join(words[start:end])
-            if utilities.string_similarity(new_text, text) < 0.9:
-                return False
-            return True
+            return pointers_match(text, start, end, words)
         except IndexError:
             log.error("Index ERROR: Text'" + text + "' not found in the list of words")
             return False
 
+    def check_parsing(self, parsing_dict, detailed=True):
+        """
+        Run all the checks on an instance
+        :param parsing_dict:    the instance
+        :param detailed:        also check the fields, the word/sentence-centric features and the entities
+        :return: a list with the names of the failed checks, empty if the instance is valid
+        """
+        return self.plans[detailed].check(parsing_dict)
+
     def validate_parsing(self, parsing_dict, detailed=True):
-        try:
-            # test all fields exists
-            if detailed:
-                assert(Keys.SENTENCES.value in parsing_dict and
-                       Keys.TEXT.value in parsing_dict and
-                       Keys.WORDS.value in parsing_dict and
-                       Keys.LEMMA.value in parsing_dict and
-                       Keys.POS_TAGS.value in parsing_dict and
-                       Keys.NER.value in parsing_dict and
-                       Keys.PENN_TREEBANK.value in parsing_dict and
-                       Keys.DEPENDENCY_PARSING.value in parsing_dict and
-                       Keys.CHUNKS.value in parsing_dict)
-
-                # test word-centric features
-                assert(len(parsing_dict[Keys.WORDS.value]) == len(parsing_dict[Keys.LEMMA.value]) and
-                       len(parsing_dict[Keys.WORDS.value]) == len(parsing_dict[Keys.POS_TAGS.value]) and
-                       len(parsing_dict[Keys.WORDS.value]) == len(parsing_dict[Keys.NER.value]))
-
-                # test sentences-centric features
-                assert (parsing_dict[Keys.NO_SENTENCES.value] == len(parsing_dict[Keys.SENTENCES.value]) and
-                        parsing_dict[Keys.NO_SENTENCES.value] == len(parsing_dict[Keys.PENN_TREEBANK.value]) and
-                        parsing_dict[Keys.NO_SENTENCES.value] == len(parsing_dict[Keys.CHUNKS.value]) and
-                        parsing_dict[Keys.NO_SENTENCES.value] == len(parsing_dict[Keys.DEPENDENCY_PARSING.value]))
+        failures = self.check_parsing(parsing_dict, detailed)
+        if failures:
+            log.error("Assertion ERROR json with id: '" + str(parsing_dict.get(Keys.ID.value)) + "': " +
+                      "; ".join(failures))
+            return False
+        return True
 
-            # test chunks
-            assert(len(parsing_dict[Keys.WORDS.value]) == len([c for ch in parsing_dict[Keys.CHUNKS.value] for c in ch]))
 
-            words = parsing_dict[Keys.WORDS.value]
+def shard_ranges(path, n_shards, start=0, end=None):
+    """
+    Split [start, end) of a file into byte ranges of about the same size. Ranges are aligned to lines by validate_shard.
+    :return: a list of (start, end) byte offsets
+    """
+    end = os.path.getsize(path) if end is None else end
+    size = end - start
+    n_shards = max(1, min(n_shards, size))
+    bounds = [start + size * i // n_shards for i in range(n_shards + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(n_shards) if bounds[i] < bounds[i + 1]]
 
-            # test sentences
-            for sentence in parsing_dict[Keys.SENTENCES.value]:
-                assert (self.test_pointers(sentence[Keys.TEXT.value],
-                                           sentence[Keys.START.value],
-                                           sentence[Keys.END.value],
-                                           words))
-
-            # test entities
-            if detailed:
-                for entity in parsing_dict[Keys.ENTITIES_MENTIONED.value]:
-                    assert(self.test_pointers(entity[Keys.TEXT.value],
-                                              entity[Keys.START.value],
-                                              entity[Keys.END.value],
-                                              words))
-
-            # test events
-            for event in parsing_dict[Keys.EVENTS_MENTIONED.value]:
-                # test trigger
-                assert(self.test_pointers(event[Keys.TRIGGER.value][Keys.TEXT.value],
-                                          event[Keys.TRIGGER.value][Keys.START.value],
-                                          event[Keys.TRIGGER.value][Keys.END.value],
-                                          words))
-                # test arguments
-                for arg in event[Keys.ARGUMENTS.value]:
-                    assert(self.test_pointers(arg[Keys.TEXT.value],
-                                              arg[Keys.START.value],
-                                              arg[Keys.END.value],
-                                              words))
-            return True
-        except AssertionError:
-            log.error("Assertion ERROR json with id: '" + parsing_dict[Keys.ID.value] + "'")
-            return False
+
+def validate_shard(path, start, end, detailed=True):
+    """
+    Validate the lines that start inside [start, end) of a jsonlines file
+    :return: the number of validated instances, and a list with the failures
+    """
+    validator = ValidateTransformation()
+    validated = 0
+    failures = []
+    with open(path, 'rb') as json_file:
+        if start > 0:
+            # the line containing start-1 belongs to the previous shard
+            json_file.seek(start - 1)
+            json_file.readline()
+        offset = json_file.tell()
+        while offset < end:
+            line = json_file.readline()
+            if not line:
+                break
+            if line.strip():
+                validated += 1
+                try:
+                    instance = json.loads(line)
+                    checks = validator.check_parsing(instance, detailed)
+                    instance_id = instance.get(Keys.ID.value) if isinstance(instance, dict) else None
+                except ValueError as e:
+                    checks = ["json: " + str(e)]
+                    instance_id = None
+                if checks:
+                    failures.append({Keys.ID.value: instance_id, "offset": offset, "checks": checks})
+            offset += len(line)
+    return validated, failures
+
+
+def validate_file(path, detailed=True, workers=1, start=0, end=None):
+    """
+    Stream and validate the lines of a jsonlines file that start in [start, end), using a pool of
+    processes over byte-range shards
+    :return: the number of validated instances, and a list with all the failures ordered by their offset
+    """
+    shards = shard_ranges(path, workers * 4, start, end)
+    validate = partial(validate_shard_range, path, detailed)
+    validated = 0
+    failures = []
+    if workers > 1:
+        with Pool(workers) as pool:
+            for shard_validated, shard_failures in tqdm(pool.imap_unordered(validate, shards), total=len(shards)):
+                validated += shard_validated
+                failures.extend(shard_failures)
+    else:
+        for shard_validated, shard_failures in tqdm(map(validate, shards), total=len(shards)):
+            validated += shard_validated
+            failures.extend(shard_failures)
+    failures.sort(key=lambda failure: failure["offset"])
+    return validated, failures
+
+
+def validate_shard_range(path, detailed, shard):
+    return validate_shard(path, shard[0], shard[1], detailed)
+
+
+# the validated prefix of an incremental validation is compared through a few blocks of this size
+FINGERPRINT_BLOCK = 1 << 16
+FINGERPRINT_SAMPLES = 16
+
+
+def watermark_path(path):
+    return path + ".watermark"
+
+
+def checksum(path, end, start=0, value=0, block_size=1 << 20):
+    """
+    Rolling CRC32 of the bytes [start, end) of a file, continuing from the checksum of [0, start)
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            value = zlib.crc32(block, value)
+            remaining -= len(block)
+    return value
+
+
+def fingerprint(path, end, block_size=FINGERPRINT_BLOCK, samples=FINGERPRINT_SAMPLES):
+    """
+    CRC32 of a few blocks of [0, end) of a file: the block right before end and blocks sampled evenly before it.
+    Unlike the checksum, its cost does not grow with the file.
+    """
+    last = max(0, end - block_size)
+    starts = sorted({last * i // samples for i in range(samples)} | {last})
+    value = 0
+    with open(path, 'rb') as f:
+        for start in starts:
+            f.seek(start)
+            value = zlib.crc32(f.read(min(block_size, end - start)), value)
+    return value
+
+
+def file_identity(path):
+    """
+    :return: the device and the inode of the file, which change if the file is replaced instead of appended to
+    """
+    stat = os.stat(path)
+    return [stat.st_dev, stat.st_ino]
+
+
+def complete_lines_end(path, block_size=1 << 16):
+    """
+    :return: the offset right after the last newline, so that a line that is still being appended is not validated
+    """
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        while position > 0:
+            start = max(0, position - block_size)
+            f.seek(start)
+            block = f.read(position - start)
+            newline = block.rfind(b"\n")
+            if newline >= 0:
+                return start + newline + 1
+            position = start
+    return 0
+
+
+def load_watermark(path, detailed, verify=False):
+    """
+    Load the watermark of a previous validation, and check that the validated prefix has not changed since.
+    By default the prefix is checked by the identity of the file and a fingerprint of a few of its blocks,
+    so the cost does not grow with the file; a prefix rewritten in place outside these blocks is not detected.
+    :param verify:  check the checksum of the whole prefix instead
+    :return: the watermark, or None if the whole file must be validated
+    """
+    if not os.path.exists(watermark_path(path)):
+        return None
+    with open(watermark_path(path)) as watermark_file:
+        watermark = json.load(watermark_file)
+    if watermark["detailed"] != detailed:
+        log.warning("Watermark was created with a different validation mode, validating the whole file")
+        return None
+    if "failures" not in watermark:
+        log.warning("Watermark does not contain the failures of the validated part, validating the whole file")
+        return None
+    if os.path.getsize(path) < watermark["offset"]:
+        changed = True
+    elif verify or "fingerprint" not in watermark:
+        changed = checksum(path, watermark["offset"]) != watermark["checksum"]
+    else:
+        changed = file_identity(path) != watermark["identity"] or \
+            fingerprint(path, watermark["offset"]) != watermark["fingerprint"]
+    if changed:
+        log.warning("The validated part of the file has changed, validating the whole file")
+        return None
+    return watermark
+
+
+def save_watermark(path, watermark):
+    with open(watermark_path(path), 'w') as watermark_file:
+        json.dump(watermark, watermark_file)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Give arguments")
     parser.add_argument('-input', metavar='--input', type=str, help='Path to the json to validate', required=True)
     parser.add_argument('-disableDetailed', action='store_true', help='Disable event type mapping matching ')
+    parser.add_argument('-workers', type=int, default=os.cpu_count(), help='Number of validation processes, default value is the number of CPUs')
+    parser.add_argument('-report', metavar='report_path', type=str, help='Path to store a JSON report with all the failures')
+    parser.add_argument('-incremental', action='store_true', help='Validate only the lines appended since the previous incremental validation')
+    parser.add_argument('-verify', action='store_true', help='With -incremental, check the checksum of the whole validated part of the file, instead of sampled blocks')
 
     args = parser.parse_args()
     disableDetailed = args.disableDetailed
@@ -110,18 +329,53 @@ if __name__ == '__main__':
         log.error("Path '" + args.input + "' does not exist")
         exit(1)
 
-    jsons = utilities.read_jsonlines(args.input)
-    validator = ValidateTransformation()
+    if args.report and not os.path.exists(os.path.dirname(os.path.abspath(args.report))):
+        log.error("Report path '" + args.report + "' does not exist")
+        exit(1)
+
+    detailed = not disableDetailed
+    watermark = {"offset": 0, "checksum": 0, "validated": 0, "failures": [], "detailed": detailed}
+    end = None
+    if args.incremental:
+        watermark = load_watermark(args.input, detailed, args.verify) or watermark
+        end = complete_lines_end(args.input)
+        log.info("Validating bytes " + str(watermark["offset"]) + " to " + str(end))
+
     log.info("Starting validation")
-    successful = True
-    for json in tqdm(jsons):
-        successful = successful and validator.validate_parsing(json, not disableDetailed)
-        if not successful:
-            break
-    if successful:
+    validated, failures = validate_file(args.input, detailed, max(1, args.workers), watermark["offset"], end)
+
+    if args.incremental:
+        log.info("Validated " + str(validated) + " new instances, " + str(len(failures)) + " of them failed, " +
+                 str(watermark["validated"] + validated) + " instances in total")
+        # the failures of the validated part are kept, so the report covers the whole file
+        failures = watermark["failures"] + failures
+        watermark = {"offset": end,
+                     "checksum": checksum(args.input, end, watermark["offset"], watermark["checksum"]),
+                     "fingerprint": fingerprint(args.input, end),
+                     "identity": file_identity(args.input),
+                     "validated": watermark["validated"] + validated,
+                     "failures": failures,
+                     "detailed": detailed}
+        save_watermark(args.input, watermark)
+        validated = watermark["validated"]
+    total_failed = len(failures)
+    for failure in failures[:100]:
+        log.error("Instance '" + str(failure[Keys.ID.value]) + "' at byte " + str(failure["offset"]) + ": " +
+                  "; ".join(failure["checks"]))
+    if len(failures) > 100:
+        log.error("... and " + str(len(failures) - 100) + " more failures")
+
+    if args.report:
+        with open(args.report, 'w') as report_file:
+            json.dump({"input": args.input, "detailed": detailed, "validated": validated,
+                       "failed": total_failed, "failures": failures}, report_file, indent=4)
+        log.info("Validation report was stored in '" + args.report + "'")
+
+    if total_failed == 0:
         log.info("Validation was completed Successfully")
         log.info("Document is correct")
     else:
+        log.error(str(total_failed) + " out of " + str(validated) + " instances contain mistakes")
         log.error("Document contains mistakes")
         log.error("Validation Failed")
     print()
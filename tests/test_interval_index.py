@@ -0,0 +1,48 @@
+import unittest
+
+from src.conf.Constants import Keys
+from src.evaluate import InstanceCounts, score_offsets
+from src.utils.interval_index import IntervalIndex
+
+
+def event(event_type, start, end, arguments=()):
+    return {Keys.EVENT_TYPE.value: event_type,
+            Keys.TRIGGER.value: {Keys.START.value: start, Keys.END.value: end},
+            Keys.ARGUMENTS.value: [{Keys.START.value: arg_start, Keys.END.value: arg_end, Keys.ROLE.value: role}
+                                   for arg_start, arg_end, role in arguments]}
+
+
+class IntervalIndexTest(unittest.TestCase):
+
+    def test_spans_without_offsets_are_not_indexed(self):
+        index = IntervalIndex([(None, 3, "a"), (2, None, "b"), (4, 6, "c")])
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.payload(index.match(4, 6, set())), "c")
+
+    def test_spans_without_offsets_never_match(self):
+        index = IntervalIndex([(0, 3, "a")])
+        self.assertIsNone(index.match(None, 3, set(), overlap=True))
+        self.assertIsNone(index.match(0, None, set(), overlap=True))
+
+    def test_overlap_prefers_exact_match(self):
+        index = IntervalIndex([(0, 4, "a"), (2, 3, "b")])
+        used = set()
+        self.assertEqual(index.payload(index.match(2, 3, used, overlap=True)), "b")
+        self.assertEqual(index.payload(index.match(2, 3, used, overlap=True)), "a")
+        self.assertIsNone(index.match(2, 3, used, overlap=True))
+
+
+class ScoreOffsetsTest(unittest.TestCase):
+
+    def test_offsets_may_be_missing(self):
+        gold = [event("Attack", 1, 2, [(3, 4, "Target"), (None, None, "Place")]), event("Die", None, None)]
+        predicted = [event("Attack", 1, 2, [(3, 4, "Target"), (5, None, "Place")]), event("Die", None, 7)]
+        counts = InstanceCounts()
+        score_offsets(gold, predicted, counts)
+        self.assertEqual(counts.total['trigger_exact_tp'], 1)
+        self.assertEqual(counts.total['argument_classification_tp'], 1)
+        self.assertEqual(counts.total['total_gold_arguments'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import threading
+import time
+import unittest
+
+from src.utils.scheduler import CircuitBreaker
+
+COOLDOWN = 0.3
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(threshold=2, cooldown=COOLDOWN)
+        self.passed = []
+        self.threads = [threading.Thread(target=self.submit, args=(i,), daemon=True) for i in range(5)]
+
+    def submit(self, i):
+        self.breaker.wait()
+        self.passed.append(i)
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join(5)
+
+    def test_closed_breaker_lets_all_through(self):
+        self.breaker.failure()
+        self.start()
+        self.join()
+        self.assertEqual(len(self.passed), 5)
+
+    def test_single_probe_after_cooldown(self):
+        self.breaker.failure()
+        self.breaker.failure()
+        self.start()
+        time.sleep(COOLDOWN / 2)
+        self.assertEqual(self.passed, [])
+        time.sleep(COOLDOWN)
+        self.assertEqual(len(self.passed), 1)
+        self.breaker.success()
+        self.join()
+        self.assertEqual(len(self.passed), 5)
+
+    def test_failed_probe_opens_again(self):
+        self.breaker.failure()
+        self.breaker.failure()
+        self.start()
+        time.sleep(1.5 * COOLDOWN)
+        self.assertEqual(len(self.passed), 1)
+        self.breaker.failure()
+        time.sleep(COOLDOWN / 2)
+        self.assertEqual(len(self.passed), 1)
+        time.sleep(COOLDOWN)
+        self.assertEqual(len(self.passed), 2)
+        self.breaker.success()
+        self.join()
+        self.assertEqual(len(self.passed), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
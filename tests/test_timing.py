@@ -0,0 +1,35 @@
+import unittest
+
+from src.utils import timing
+
+
+@timing.timed("test")
+def identity(value):
+    return value
+
+
+class TimingsTest(unittest.TestCase):
+
+    def setUp(self):
+        timing.stages.reset()
+
+    def tearDown(self):
+        timing.stages.enabled = False
+        timing.stages.reset()
+
+    def test_disabled_timings_are_not_recorded(self):
+        self.assertEqual(identity(1), 1)
+        with timing.stages.time("test"):
+            pass
+        self.assertEqual(timing.stages.to_dict()["stages"], {})
+
+    def test_enabled_timings_are_recorded(self):
+        timing.stages.enabled = True
+        self.assertEqual(identity(1), 1)
+        with timing.stages.time("test"):
+            pass
+        self.assertEqual(timing.stages.to_dict()["stages"]["test"]["count"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import json
+import unittest
+from unittest import mock
+
+from benchmarks.stub_corenlp import StubCoreNLP
+from src.transformers.RAMS_Trasnformer import RamsTransformer
+
+RAMS_PATH = "data/RAMS/rams_10.jsonlines"
+
+
+def rams_transformer():
+    # the models of spaCy and of the chunker are not needed to split the texts into sentences
+    with mock.patch("spacy.load"), mock.patch("src.transformers.Transformer.BigramChunker"):
+        return RamsTransformer(RAMS_PATH, StubCoreNLP(), False)
+
+
+class RamsSentencesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.transformer = rams_transformer()
+        self.texts = []
+        self.transformer.parse = lambda sentences, text: self.texts.append(text)
+        with open(RAMS_PATH) as json_file:
+            self.instances = [json.loads(line) for line in json_file]
+
+    def sentences(self, instance):
+        self.transformer.annotate_instance(instance)
+        parsing = self.transformer.text_parsing(self.texts[-1])
+        return [sentence["text"] for sentence in parsing["sentences"]]
+
+    def test_sentences_match_baseline(self):
+        self.assertEqual(self.sentences(self.instances[0]), [
+            "Transportation officials are urging carpool and teleworking as options to combat an expected flood of "
+            "drivers on the road .",
+            "-LRB- Paul Duggan -RRB- .",
+            "- - A Baltimore prosecutor accused a police detective of “ sabotaging ” investigations related to the "
+            "death of Freddie Gray , accusing him of fabricating notes to suggest that the state ’ s medical examiner "
+            "believed the manner of death was an accident rather than a homicide .",
+            "The heated exchange came in the chaotic sixth day of the trial of Baltimore Officer Caesar Goodson Jr .",
+            ", who drove the police van in which Gray suffered a fatal spine injury in 2015 .",
+            "-LRB- Derek Hawkins and Lynh Bui -RRB- ."])
+
+    def test_no_punctuation_only_sentences(self):
+        for instance in self.instances:
+            for sentence in self.sentences(instance):
+                self.assertNotIn(sentence, (".", "!", "?"))
+
+
+if __name__ == '__main__':
+    unittest.main()